@@ -9,7 +9,7 @@ from quart import (
     stream_with_context,
     jsonify,
 )
-from .storage import InMemoryConversationStorage
+from .storage import ConversationStorage
 
 # Define the Blueprint for the chat UI and API
 # It will look for templates in a 'templates' folder in the same directory as this blueprint.
@@ -20,8 +20,9 @@ chat_ui_bp = Blueprint(
 # Configure a logger for this blueprint
 logger = logging.getLogger(__name__)
 
-# Initialize storage
-storage = InMemoryConversationStorage()
+def _get_storage() -> ConversationStorage:
+    """Returns the app-wide conversation storage shared by every blueprint."""
+    return current_app.conversation_storage
 
 @chat_ui_bp.route("/")
 async def index():
@@ -34,7 +35,7 @@ async def index():
 async def create_conversation():
     """Create a new conversation and return its ID."""
     try:
-        conversation_id = await storage.create_conversation()
+        conversation_id = await _get_storage().create_conversation()
         return jsonify({"conversation_id": conversation_id})
     except Exception as e:
         logger.error(f"Error creating conversation: {e}")
@@ -44,11 +45,11 @@ async def create_conversation():
 async def get_conversation(conversation_id: str):
     """Get a conversation by ID."""
     try:
-        conversation = await storage.get_conversation(conversation_id)
+        conversation = await _get_storage().get_conversation(conversation_id)
         if not conversation:
             return jsonify({"error": "Conversation not found"}), 404
         
-        messages = await storage.get_messages(conversation_id)
+        messages = await _get_storage().get_messages(conversation_id)
         return jsonify({
             "id": conversation.id,
             "created_at": conversation.created_at.isoformat(),
@@ -121,10 +122,12 @@ async def chat_handler():
         try:
             # Store the user's message
             if request_messages:
-                await storage.add_message(conversation_id, "user", request_messages[-1]["content"])
+                await _get_storage().add_message(conversation_id, "user", request_messages[-1]["content"])
 
-            # Get all messages for the conversation
-            conversation_messages = await storage.get_messages(conversation_id)
+            # Get the messages for the conversation, windowed to HISTORY_TOKEN_BUDGET
+            conversation_messages = await _get_storage().get_messages(
+                conversation_id, current_app.config.get("HISTORY_TOKEN_BUDGET")
+            )
 
             if show_multimodal_features and image_base64_data_uri:
                 user_content_parts = [
@@ -166,7 +169,7 @@ async def chat_handler():
 
             # Store the complete assistant's reply after streaming is done
             if full_response:
-                await storage.add_message(conversation_id, "assistant", full_response)
+                await _get_storage().add_message(conversation_id, "assistant", full_response)
 
         except Exception as e:
             logger.error(f"OpenAI API call failed: {e}", exc_info=True)
@@ -16,11 +16,18 @@ def create_app():
 
     from . import chat_api
     from . import chat_ui
+    from .storage import InMemoryConversationStorage
     app = Quart(__name__)
 
+    # One conversation storage per app, shared by the chat UI and API blueprints
+    app.conversation_storage = InMemoryConversationStorage()
+
     # Feature flag for multimodal features
     app.config["SHOW_MULTIMODAL_FEATURES"] = os.getenv("SHOW_MULTIMODAL_FEATURES", "False").lower() == "true"
     app.logger.info(f'Multimodal features enabled: {app.config["SHOW_MULTIMODAL_FEATURES"]}')
+    # Optional cap on the history tokens sent to the model per turn
+    token_budget = os.getenv("HISTORY_TOKEN_BUDGET")
+    app.config["HISTORY_TOKEN_BUDGET"] = int(token_budget) if token_budget else None
 
     # Register the module-level functions as lifecycle hooks
     # These functions will be called within an app context, so current_app is available.
@@ -7,6 +7,8 @@ from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from .embedding_cache import CachedEmbeddings
+from .vector_index import load_or_build_index
 from langchain.chains import RetrievalQA
 import os
 from .config import SYSTEM_PROMPT_TEMPLATE
@@ -19,7 +21,24 @@ chat_api_bp = Blueprint("chat_api", __name__, url_prefix="/api") # , template_fo
 def initialize_vector_store():
     """Initialize the vector store with movie data."""
     try:
-        # Load the movies text file
+        # Initialize embeddings
+        embeddings = OpenAIEmbeddings(
+            openai_api_key=os.getenv("OPENAI_KEY"),
+            model="text-embedding-3-small"
+        )
+        # Embeddings computed before, by any process, are read from the shared cache
+        cache_path = os.getenv("EMBEDDING_CACHE_PATH", "embeddings.db")
+        if cache_path:
+            embeddings = CachedEmbeddings(embeddings, cache_path, model="text-embedding-3-small")
+
+        # Reuse the persisted index: movies.txt is only hashed, and split only when the index must change
+        index_dir = os.getenv("VECTOR_INDEX_DIR", "vector_index")
+        if index_dir:
+            return load_or_build_index(
+                "src/myapp/movies.txt", index_dir, embeddings, "text-embedding-3-small", chunk_size=1000, chunk_overlap=200
+            )
+
+        # No index directory: load the movies text file
         loader = TextLoader("src/myapp/movies.txt", encoding="utf-8")
         documents = loader.load()
 
@@ -27,13 +46,7 @@ def initialize_vector_store():
         text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
         docs = text_splitter.split_documents(documents)
 
-        # Initialize embeddings
-        embeddings = OpenAIEmbeddings(
-            openai_api_key=os.getenv("OPENAI_KEY"),
-            model="text-embedding-3-small"
-        )
-
-        # Create and return the vector store
+        # Create and return the in-memory vector store
         return Chroma.from_documents(docs, embeddings)
     except Exception as e:
         logger.error(f"Error initializing vector store: {e}")
@@ -9,12 +9,14 @@ from quart import (
     stream_with_context,
     jsonify,
 )
-from .storage import InMemoryConversationStorage
+from .storage import ConversationStorage
 from langchain.schema import HumanMessage, SystemMessage, AIMessage
 from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
+from .embedding_cache import CachedEmbeddings
+from .vector_index import load_or_build_index
 from langchain.chains import RetrievalQA
 from langchain_openai import ChatOpenAI
 import os
@@ -29,13 +31,31 @@ chat_ui_bp = Blueprint(
 # Configure a logger for this blueprint
 logger = logging.getLogger(__name__)
 
-# Initialize storage
-storage = InMemoryConversationStorage()
+def _get_storage() -> ConversationStorage:
+    """Returns the app-wide conversation storage shared by every blueprint."""
+    return current_app.conversation_storage
 
 def initialize_vector_store():
     """Initialize the vector store with movie data."""
     try:
-        # Load the movies text file
+        # Initialize embeddings
+        embeddings = OpenAIEmbeddings(
+            openai_api_key=os.getenv("OPENAI_KEY"),
+            model="text-embedding-3-small"
+        )
+        # Embeddings computed before, by any process, are read from the shared cache
+        cache_path = os.getenv("EMBEDDING_CACHE_PATH", "embeddings.db")
+        if cache_path:
+            embeddings = CachedEmbeddings(embeddings, cache_path, model="text-embedding-3-small")
+
+        # Reuse the persisted index: movies.txt is only hashed, and split only when the index must change
+        index_dir = os.getenv("VECTOR_INDEX_DIR", "vector_index")
+        if index_dir:
+            return load_or_build_index(
+                "src/myapp/movies.txt", index_dir, embeddings, "text-embedding-3-small", chunk_size=1000, chunk_overlap=200
+            )
+
+        # No index directory: load the movies text file
         loader = TextLoader("src/myapp/movies.txt", encoding="utf-8")
         documents = loader.load()
 
@@ -43,13 +63,7 @@ def initialize_vector_store():
         text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
         docs = text_splitter.split_documents(documents)
 
-        # Initialize embeddings
-        embeddings = OpenAIEmbeddings(
-            openai_api_key=os.getenv("OPENAI_KEY"),
-            model="text-embedding-3-small"
-        )
-
-        # Create and return the vector store
+        # Create and return the in-memory vector store
         return Chroma.from_documents(docs, embeddings)
     except Exception as e:
         logger.error(f"Error initializing vector store: {e}")
@@ -69,7 +83,7 @@ async def index():
 async def create_conversation():
     """Create a new conversation and return its ID."""
     try:
-        conversation_id = await storage.create_conversation()
+        conversation_id = await _get_storage().create_conversation()
         return jsonify({"conversation_id": conversation_id})
     except Exception as e:
         logger.error(f"Error creating conversation: {e}")
@@ -79,11 +93,11 @@ async def create_conversation():
 async def get_conversation(conversation_id: str):
     """Get a conversation by ID."""
     try:
-        conversation = await storage.get_conversation(conversation_id)
+        conversation = await _get_storage().get_conversation(conversation_id)
         if not conversation:
             return jsonify({"error": "Conversation not found"}), 404
         
-        messages = await storage.get_messages(conversation_id)
+        messages = await _get_storage().get_messages(conversation_id)
         return jsonify({
             "id": conversation.id,
             "created_at": conversation.created_at.isoformat(),
@@ -145,18 +159,18 @@ async def handle_chat_post():
             user_message_content_to_store = user_message_input
         
         if user_message_content_to_store:
-            await storage.add_message(conversation_id, "user", user_message_content_to_store)
+            await _get_storage().add_message(conversation_id, "user", user_message_content_to_store)
             user_message_stored = True
             logger.info(f"User message stored for conversation '{conversation_id}'.")
         elif show_multimodal_features and image_base64_data_uri: 
             # This case handles if user_message_input was a list, but only contained an image part,
             # and image_base64_data_uri was also sent in context.
-            await storage.add_message(conversation_id, "user", "[Image received]")
+            await _get_storage().add_message(conversation_id, "user", "[Image received]")
             user_message_stored = True
             logger.info(f"User image placeholder (from multimodal list) stored for conversation '{conversation_id}'.")
 
     elif show_multimodal_features and image_base64_data_uri: # Only image in context, no "messages" array or empty "messages"
-        await storage.add_message(conversation_id, "user", "[Image received]")
+        await _get_storage().add_message(conversation_id, "user", "[Image received]")
         user_message_stored = True
         logger.info(f"User image placeholder (from context) stored for conversation '{conversation_id}'.")
     
@@ -195,7 +209,8 @@ async def handle_chat_get_stream():
                       status=400, 
                       content_type="text/event-stream")
     
-    messages = await storage.get_messages(conversation_id)
+    # Windowed to HISTORY_TOKEN_BUDGET, so langchain_messages below stays within it
+    messages = await _get_storage().get_messages(conversation_id, current_app.config.get("HISTORY_TOKEN_BUDGET"))
     # sse_generator will handle if messages is None or empty.
 
     @stream_with_context
@@ -272,7 +287,7 @@ async def handle_chat_get_stream():
                     yield f"data: {json.dumps(event_dict, ensure_ascii=False)}\n\n"
 
             if full_response:
-                await storage.add_message(conversation_id, "assistant", full_response)
+                await _get_storage().add_message(conversation_id, "assistant", full_response)
                 logger.info(f"Assistant response for '{conversation_id}' stored.")
             else:
                 logger.info(f"No content generated by LLM for '{conversation_id}'.")
@@ -23,8 +23,12 @@ def create_app():
 
     from . import chat_api
     from . import chat_ui
+    from .storage import InMemoryConversationStorage
     app = Quart(__name__)
 
+    # One conversation storage per app, shared by the chat UI and API blueprints
+    app.conversation_storage = InMemoryConversationStorage()
+
     # Feature flag for multimodal features
     app.config["SHOW_MULTIMODAL_FEATURES"] = os.getenv("SHOW_MULTIMODAL_FEATURES", "False").lower() == "true"
     app.logger.info(f'Multimodal features enabled: {app.config["SHOW_MULTIMODAL_FEATURES"]}')
@@ -63,7 +67,12 @@ async def _initialize_langchain_resources():
 
         # Initialize Chroma vector store using the new manager
         # Pass the API key needed for OpenAIEmbeddings within initialize_vector_store
-        vector_store = init_chroma_vector_store(embeddings_api_key=api_key)
+        # Persisted in VECTOR_INDEX_DIR and only re-embedded when its inputs change
+        vector_store = init_chroma_vector_store(
+            embeddings_api_key=api_key,
+            index_dir=os.getenv("VECTOR_INDEX_DIR", "vector_index"),
+            embedding_cache_path=os.getenv("EMBEDDING_CACHE_PATH", "embeddings.db"),
+        )
         if vector_store:
             current_app.vector_store = vector_store
             logger.info("Chroma vector store initialized via vector_store_manager.")
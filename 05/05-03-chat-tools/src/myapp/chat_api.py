@@ -1,12 +1,15 @@
 import logging
 import json
 from quart import Blueprint, request, jsonify, Response, current_app, stream_with_context
-from .storage import InMemoryConversationStorage
+from .storage import ConversationStorage
 from langchain.schema import HumanMessage, AIMessage
 
 chat_api_bp = Blueprint("chat_api", __name__, url_prefix="/api")  # Added url_prefix="/api"
 logger = logging.getLogger(__name__)
-storage = InMemoryConversationStorage()
+
+def _get_storage() -> ConversationStorage:
+    """Returns the app-wide conversation storage shared by every blueprint."""
+    return current_app.conversation_storage
 
 @chat_api_bp.route("/chat", methods=["POST"])
 async def handle_chat():
@@ -30,7 +33,7 @@ async def handle_chat():
         chat_history_for_agent = []
 
         if conversation_id:
-            stored_messages = await storage.get_messages(conversation_id)
+            stored_messages = await _get_storage().get_messages(conversation_id)
             if stored_messages:
                 for msg_data in stored_messages:
                     role = msg_data.get("role")
@@ -63,8 +66,8 @@ async def handle_chat():
         assistant_response_content = response.get("output", "")
 
         if conversation_id:
-            await storage.add_message(conversation_id, "user", last_user_message_content)
-            await storage.add_message(conversation_id, "assistant", assistant_response_content)
+            await _get_storage().add_message(conversation_id, "user", last_user_message_content)
+            await _get_storage().add_message(conversation_id, "assistant", assistant_response_content)
 
         return jsonify({"response": assistant_response_content, "conversation_id": conversation_id})
 
@@ -102,7 +105,7 @@ async def handle_chat_stream_post():
         last_user_message_content = None
         chat_history_for_agent = []
         if conversation_id:
-            stored_messages = await storage.get_messages(conversation_id)
+            stored_messages = await _get_storage().get_messages(conversation_id)
             if stored_messages:
                 for msg_data in stored_messages:
                     role, content = msg_data.get("role"), msg_data.get("content")
@@ -134,8 +137,8 @@ async def handle_chat_stream_post():
                             yield json.dumps({"chunk": content_piece}, ensure_ascii=False) + "\n"
                 
                 if conversation_id:
-                    await storage.add_message(conversation_id, "user", last_user_message_content)
-                    await storage.add_message(conversation_id, "assistant", full_response)
+                    await _get_storage().add_message(conversation_id, "user", last_user_message_content)
+                    await _get_storage().add_message(conversation_id, "assistant", full_response)
                 logger.info(f"NDJSON stream complete for conv '{conversation_id}'.")
             except Exception as e:
                 logger.error(f"Error during NDJSON stream generation for conv '{conversation_id}': {e}", exc_info=True)
@@ -174,7 +177,7 @@ async def handle_chat_sse_post():
         last_user_message_content = None
         chat_history_for_agent = []
         if conversation_id:
-            stored_messages = await storage.get_messages(conversation_id)
+            stored_messages = await _get_storage().get_messages(conversation_id)
             if stored_messages:
                 for msg_data in stored_messages:
                     role, content = msg_data.get("role"), msg_data.get("content")
@@ -207,8 +210,8 @@ async def handle_chat_sse_post():
                             yield f"data: {json.dumps({'chunk': content_piece}, ensure_ascii=False)}\n\n"
                 
                 if conversation_id:
-                    await storage.add_message(conversation_id, "user", last_user_message_content)
-                    await storage.add_message(conversation_id, "assistant", full_response)
+                    await _get_storage().add_message(conversation_id, "user", last_user_message_content)
+                    await _get_storage().add_message(conversation_id, "assistant", full_response)
                 logger.info(f"SSE stream complete for conv '{conversation_id}'.")
             except Exception as e:
                 logger.error(f"Error during SSE stream generation for conv '{conversation_id}': {e}", exc_info=True)
@@ -9,7 +9,7 @@ from quart import (
     stream_with_context,
     jsonify,
 )
-from .storage import InMemoryConversationStorage
+from .storage import ConversationStorage
 from langchain.schema import HumanMessage, AIMessage
 
 # Define the Blueprint for the chat UI and API
@@ -20,8 +20,9 @@ chat_ui_bp = Blueprint(
 # Configure a logger for this blueprint
 logger = logging.getLogger(__name__)
 
-# Initialize storage
-storage = InMemoryConversationStorage()
+def _get_storage() -> ConversationStorage:
+    """Returns the app-wide conversation storage shared by every blueprint."""
+    return current_app.conversation_storage
 
 @chat_ui_bp.route("/")
 async def index():
@@ -34,7 +35,7 @@ async def index():
 async def create_conversation():
     """Create a new conversation and return its ID."""
     try:
-        conversation_id = await storage.create_conversation()
+        conversation_id = await _get_storage().create_conversation()
         return jsonify({"conversation_id": conversation_id})
     except Exception as e:
         logger.error(f"Error creating conversation: {e}")
@@ -44,11 +45,11 @@ async def create_conversation():
 async def get_conversation(conversation_id: str):
     """Get a conversation by ID."""
     try:
-        conversation = await storage.get_conversation(conversation_id)
+        conversation = await _get_storage().get_conversation(conversation_id)
         if not conversation:
             return jsonify({"error": "Conversation not found"}), 404
         
-        messages = await storage.get_messages(conversation_id)
+        messages = await _get_storage().get_messages(conversation_id)
         return jsonify({
             "id": conversation.id,
             "created_at": conversation.created_at.isoformat(),
@@ -100,16 +101,16 @@ async def handle_chat_post():
             user_message_content_to_store = user_message_input
         
         if user_message_content_to_store:
-            await storage.add_message(conversation_id, "user", user_message_content_to_store)
+            await _get_storage().add_message(conversation_id, "user", user_message_content_to_store)
             user_message_stored = True
             logger.info(f"User message stored for conversation '{conversation_id}'.")
         elif show_multimodal_features and image_base64_data_uri: 
-            await storage.add_message(conversation_id, "user", "[Image received]")
+            await _get_storage().add_message(conversation_id, "user", "[Image received]")
             user_message_stored = True
             logger.info(f"User image placeholder (from multimodal list) stored for conversation '{conversation_id}'.")
 
     elif show_multimodal_features and image_base64_data_uri: 
-        await storage.add_message(conversation_id, "user", "[Image received]")
+        await _get_storage().add_message(conversation_id, "user", "[Image received]")
         user_message_stored = True
         logger.info(f"User image placeholder (from context) stored for conversation '{conversation_id}'.")
     
@@ -141,7 +142,7 @@ async def handle_chat_get_stream():
                       status=400, 
                       content_type="text/event-stream")
     
-    messages = await storage.get_messages(conversation_id)
+    messages = await _get_storage().get_messages(conversation_id)
 
     @stream_with_context
     async def sse_generator():
@@ -198,7 +199,7 @@ async def handle_chat_get_stream():
                         yield f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
 
             if full_response:
-                await storage.add_message(conversation_id, "assistant", full_response)
+                await _get_storage().add_message(conversation_id, "assistant", full_response)
                 logger.info(f"SSE stream complete for conv '{conversation_id}'. Full response stored.")
             else:
                 logger.info(f"SSE stream complete for conv '{conversation_id}'. No response content generated by agent.")
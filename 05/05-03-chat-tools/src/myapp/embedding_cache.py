@@ -0,0 +1,232 @@
+"""Disk-backed embedding cache, shared by every process that opens the same SQLite file.
+
+Wrap any LangChain `Embeddings`; texts already embedded with the same
+model and dimensions are read from the cache and only the misses go
+upstream, in one batch:
+
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small"), "embeddings.db")
+
+Warm the cache from a corpus (split like the vector store does), or
+inspect it:
+
+    python -m myapp.embedding_cache warm src/myapp/movies.txt --db embeddings.db
+    python -m myapp.embedding_cache stats --db embeddings.db
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# SQLite's default limit on host parameters per statement is 999.
+_LOOKUP_BATCH = 900
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    dimensions INTEGER NOT NULL,
+    text_sha256 BLOB NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (model, dimensions, text_sha256)
+) WITHOUT ROWID
+"""
+
+
+def _text_key(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    # float32, the precision the embedding APIs return.
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """`Embeddings` that look up (model, dimensions, sha256(text)) in a SQLite file before going upstream.
+
+    The file is opened in WAL mode, so any number of workers, scripts and
+    notebooks can read and add entries concurrently; an entry written by
+    one is a hit for all of them. Documents and queries share entries,
+    which holds for OpenAI embeddings (a query is embedded exactly like a
+    document). Vectors are stored as float32.
+    """
+
+    def __init__(
+        self,
+        upstream: Embeddings,
+        path: str,
+        model: Optional[str] = None,
+        dimensions: Optional[int] = None,
+    ):
+        self._upstream = upstream
+        self._model = model or getattr(upstream, "model", None)
+        if not self._model:
+            raise ValueError("CachedEmbeddings needs the model name to key its entries")
+        # 0 stands for the model's default size.
+        self._dimensions = dimensions or getattr(upstream, "dimensions", None) or 0
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        self.upstream_calls = 0
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "embedding_cache_hits": self.hits,
+            "embedding_cache_misses": self.misses,
+            "embedding_cache_hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "embedding_upstream_calls": self.upstream_calls,
+        }
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self._path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA_SQL)
+            self._conn = conn
+        return self._conn
+
+    def _lookup(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        found: Dict[bytes, List[float]] = {}
+        with self._lock:
+            conn = self._connection()
+            unique = list(dict.fromkeys(keys))
+            for first in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[first:first + _LOOKUP_BATCH]
+                rows = conn.execute(
+                    f"SELECT text_sha256, vector FROM embeddings WHERE model = ? AND dimensions = ?"
+                    f" AND text_sha256 IN ({','.join('?' * len(batch))})",
+                    [self._model, self._dimensions, *batch],
+                )
+                for key, blob in rows:
+                    found[key] = _unpack(blob)
+        return found
+
+    def _store(self, entries: Dict[bytes, List[float]]) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have stored the same text meanwhile; either copy will do.
+                conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (model, dimensions, text_sha256, vector) VALUES (?, ?, ?, ?)",
+                    [(self._model, self._dimensions, key, _pack(vector)) for key, vector in entries.items()],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _missing(self, keys: List[bytes], texts: List[str], found: Dict[bytes, List[float]]) -> Dict[bytes, str]:
+        """The distinct texts not in the cache, by key; counts hits and misses."""
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key in found:
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing.setdefault(key, text)
+        return missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [_text_key(text) for text in texts]
+        found = self._lookup(keys)
+        missing = self._missing(keys, texts, found)
+        if missing:
+            self.upstream_calls += 1
+            vectors = self._upstream.embed_documents(list(missing.values()))
+            fetched = dict(zip(missing, vectors))
+            self._store(fetched)
+            found.update(fetched)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [_text_key(text) for text in texts]
+        found = await asyncio.to_thread(self._lookup, keys)
+        missing = self._missing(keys, texts, found)
+        if missing:
+            self.upstream_calls += 1
+            vectors = await self._upstream.aembed_documents(list(missing.values()))
+            fetched = dict(zip(missing, vectors))
+            await asyncio.to_thread(self._store, fetched)
+            found.update(fetched)
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _print_stats(path: str) -> None:
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT model, dimensions, COUNT(*), SUM(LENGTH(vector)) FROM embeddings GROUP BY model, dimensions"
+        ).fetchall()
+    finally:
+        conn.close()
+    for model, dimensions, count, size in rows:
+        print(f"{model} (dimensions {dimensions or 'default'}): {count} entries, {size / 2**20:.1f} MB of vectors")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Warm or inspect the embedding cache.")
+    parser.add_argument("command", choices=["warm", "stats"])
+    parser.add_argument("files", nargs="*", help="Text files to embed (warm)")
+    parser.add_argument("--db", default=os.getenv("EMBEDDING_CACHE_PATH") or "embeddings.db")
+    parser.add_argument("--model", default="text-embedding-3-small")
+    parser.add_argument("--dimensions", type=int)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "stats":
+        _print_stats(args.db)
+        return
+
+    from dotenv import load_dotenv
+    from langchain_openai import OpenAIEmbeddings
+
+    from .vector_index import split_source
+
+    load_dotenv(override=True)
+    upstream = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_KEY"), model=args.model, dimensions=args.dimensions)
+    embeddings = CachedEmbeddings(upstream, args.db, model=args.model, dimensions=args.dimensions)
+    for path in args.files:
+        # The same chunks the vector store embeds, so its next (re)build is all hits.
+        chunks = split_source(path, args.chunk_size, args.chunk_overlap)
+        embeddings.embed_documents([chunk.page_content for chunk in chunks])
+        logger.info(f"Warmed {len(chunks)} chunk(s) of {path}; {embeddings.stats()}")
+    embeddings.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,32 @@ import uuid
 from dataclasses import dataclass
 from datetime import datetime
 
+# Every chat message costs a few tokens of framing on top of its content.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """Count the tokens in `text` with tiktoken, or estimate ~4 characters per token without it."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # tiktoken missing, or its encoding file can't be downloaded: fall back to the estimate.
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
 @dataclass
 class Message:
     role: str
     content: str
     timestamp: datetime = datetime.utcnow()
+    # Prompt tokens this message takes up, counted once when it is added.
+    tokens: int = 0
 
 @dataclass
 class Conversation:
@@ -34,8 +55,12 @@ class ConversationStorage(ABC):
         pass
 
     @abstractmethod
-    async def get_messages(self, conversation_id: str) -> List[Dict]:
-        """Get all messages from a conversation in the format expected by OpenAI."""
+    async def get_messages(self, conversation_id: str, token_budget: Optional[int] = None) -> List[Dict]:
+        """Get all messages from a conversation in the format expected by OpenAI.
+
+        With `token_budget`, only the system messages and the newest other
+        messages that fit in what is left of the budget are returned.
+        """
         pass
 
 class InMemoryConversationStorage(ConversationStorage):
@@ -58,13 +83,22 @@ class InMemoryConversationStorage(ConversationStorage):
         if not conversation:
             raise ValueError(f"Conversation {conversation_id} not found")
         
-        message = Message(role=role, content=content)
+        message = Message(role=role, content=content, tokens=count_tokens(content) + MESSAGE_OVERHEAD_TOKENS)
         conversation.messages.append(message)
         conversation.updated_at = datetime.utcnow()
 
-    async def get_messages(self, conversation_id: str) -> List[Dict]:
+    async def get_messages(self, conversation_id: str, token_budget: Optional[int] = None) -> List[Dict]:
         conversation = self._conversations.get(conversation_id)
         if not conversation:
             raise ValueError(f"Conversation {conversation_id} not found")
         
-        return [{"role": msg.role, "content": msg.content} for msg in conversation.messages] 
\ No newline at end of file
+        messages = conversation.messages
+        if token_budget is not None:
+            remaining = token_budget - sum(msg.tokens for msg in messages if msg.role == "system")
+            start = len(messages)
+            while start > 0 and (messages[start - 1].role == "system" or messages[start - 1].tokens <= remaining):
+                if messages[start - 1].role != "system":
+                    remaining -= messages[start - 1].tokens
+                start -= 1
+            messages = [msg for msg in messages[:start] if msg.role == "system"] + messages[start:]
+        return [{"role": msg.role, "content": msg.content} for msg in messages] 
\ No newline at end of file
@@ -5,12 +5,23 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 
+from .embedding_cache import CachedEmbeddings
+from .vector_index import load_or_build_index
+
 logger = logging.getLogger(__name__)
 
-def initialize_vector_store(embeddings_api_key: str):
+EMBEDDING_MODEL = "text-embedding-3-small"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+def initialize_vector_store(embeddings_api_key: str, index_dir: str = None, embedding_cache_path: str = None):
     """
     Initializes the vector store with movie data using TextLoader and Chroma.
     Constructs an absolute path to 'movies.txt' relative to this file.
+    With `index_dir`, the index is persisted there and only re-embedded when
+    movies.txt, the splitter settings or the embedding model change.
+    With `embedding_cache_path`, embeddings (documents and queries) are
+    cached in that SQLite file, shared with other workers and scripts.
     """
     try:
         # Determine the absolute path to 'movies.txt'
@@ -38,6 +49,23 @@ def initialize_vector_store(embeddings_api_key: str):
                     return None
 
 
+        logger.info(f"Initializing embeddings with model '{EMBEDDING_MODEL}'.")
+        embeddings = OpenAIEmbeddings(
+            openai_api_key=embeddings_api_key, # Use the passed API key
+            model=EMBEDDING_MODEL
+        )
+        if embedding_cache_path:
+            embeddings = CachedEmbeddings(embeddings, embedding_cache_path, model=EMBEDDING_MODEL)
+
+        if index_dir:
+            vector_store = load_or_build_index(
+                movies_file_path, index_dir, embeddings, EMBEDDING_MODEL, CHUNK_SIZE, CHUNK_OVERLAP
+            )
+            if vector_store is None:
+                return None
+            logger.info("Chroma vector store initialized successfully.")
+            return vector_store
+
         logger.info(f"Loading documents from: {movies_file_path}")
         loader = TextLoader(movies_file_path, encoding="utf-8")
         documents = loader.load()
@@ -46,19 +74,13 @@ def initialize_vector_store(embeddings_api_key: str):
             logger.error(f"No documents loaded from {movies_file_path}. Check the file content and permissions.")
             return None
 
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
         docs = text_splitter.split_documents(documents)
 
         if not docs:
             logger.error(f"No documents to process after text splitting from {movies_file_path}.")
             return None
 
-        logger.info(f"Initializing embeddings with model 'text-embedding-3-small'.")
-        embeddings = OpenAIEmbeddings(
-            openai_api_key=embeddings_api_key, # Use the passed API key
-            model="text-embedding-3-small"
-        )
-
         logger.info(f"Creating Chroma vector store from {len(docs)} documents.")
         vector_store = Chroma.from_documents(docs, embeddings)
         logger.info("Chroma vector store initialized successfully.")
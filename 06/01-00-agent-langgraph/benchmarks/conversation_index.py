@@ -0,0 +1,104 @@
+"""Listing and search latency with the conversation index versus a full scan.
+
+Populates `--conversations` conversations of a few turns each, then times
+`list_conversations` (first page and a page deep into the listing) and
+`search_conversations` (a rare term, a common term and a phrase) against the
+scan the index replaces. `--sqlite` runs the same queries against
+SQLiteConversationStorage (updated_at index + FTS5). Run from the app
+directory:
+
+    python benchmarks/conversation_index.py --conversations 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from myapp.storage import InMemoryConversationStorage  # noqa: E402
+from myapp.sqlite_storage import SQLiteConversationStorage  # noqa: E402
+
+_WORDS = (
+    "movie actor director plot scene sequel trilogy villain hero score soundtrack "
+    "release premiere review rating studio budget cast script camera"
+).split()
+
+async def _populate(storage, conversations: int, turns: int, concurrency: int = 256) -> None:
+    rng = random.Random(42)
+
+    async def play(i: int) -> None:
+        conversation_id = await storage.create_conversation()
+        messages = []
+        for turn in range(turns):
+            words = " ".join(rng.choice(_WORDS) for _ in range(12))
+            messages.append(("user", f"Question {turn} about the {words}?"))
+            messages.append(("assistant", f"Answer with {words} and trivia #{i}."))
+        await storage.add_messages(conversation_id, messages)
+
+    # Concurrent batches, so group-committing backends aren't timed one commit interval per write.
+    for first in range(0, conversations, concurrency):
+        await asyncio.gather(*(play(i) for i in range(first, min(first + concurrency, conversations))))
+
+async def _timed(label: str, coro_factory, repeat: int = 20) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = await coro_factory()
+    elapsed = (time.perf_counter() - start) / repeat
+    count = len(result[0]) if isinstance(result, tuple) else len(result)
+    print(f"{label:>36}: {elapsed * 1000:>9.3f} ms  ({count} results)")
+
+async def _deep_cursor(storage, pages: int, limit: int):
+    cursor = None
+    for _ in range(pages):
+        _, cursor = await storage.list_conversations(limit, cursor)
+    return cursor
+
+async def _bench(storage, args, scan: bool) -> None:
+    start = time.perf_counter()
+    await _populate(storage, args.conversations, args.turns)
+    print(f"{'populate':>36}: {time.perf_counter() - start:>9.2f} s")
+
+    deep = await _deep_cursor(storage, 100, 50)
+    rare = f"#{args.conversations // 2}"[1:]  # A trivia number appears in one conversation only.
+    await _timed("list, first page", lambda: storage.list_conversations(50))
+    await _timed("list, page 101", lambda: storage.list_conversations(50, deep))
+    await _timed("search rare term", lambda: storage.search_conversations(rare, 50))
+    await _timed("search common terms", lambda: storage.search_conversations("villain soundtrack", 50))
+    await _timed("search phrase", lambda: storage.search_conversations('"villain soundtrack"', 50))
+
+    if scan:
+        # What a listing or search costs without the index: touch every conversation.
+        async def scan_list():
+            return sorted(storage._conversations.values(), key=lambda c: c.updated_at, reverse=True)[:50]
+
+        async def scan_search():
+            return [
+                c for c in storage._conversations.values()
+                if any("villain soundtrack" in content.lower() for content in c.messages.columns()[2])
+            ][:50]
+
+        await _timed("scan: list, first page", scan_list, repeat=3)
+        await _timed("scan: search phrase", scan_search, repeat=3)
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=100_000)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--sqlite", action="store_true", help="Also benchmark the SQLite backend")
+    args = parser.parse_args()
+
+    print(f"InMemoryConversationStorage, {args.conversations} conversations")
+    await _bench(InMemoryConversationStorage(), args, scan=True)
+    if args.sqlite:
+        with tempfile.TemporaryDirectory() as tmp:
+            print(f"SQLiteConversationStorage, {args.conversations} conversations")
+            storage = SQLiteConversationStorage(os.path.join(tmp, "bench.db"))
+            await _bench(storage, args, scan=False)
+            await storage.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
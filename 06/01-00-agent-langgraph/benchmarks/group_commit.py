@@ -0,0 +1,54 @@
+"""End-of-turn write throughput of SQLiteConversationStorage with and without group commit.
+
+Each of `--tasks` concurrent asyncio tasks plays `--turns` chat turns against
+its own conversation and ends every turn with one `add_messages` call for the
+user and assistant messages. Run from the app directory:
+
+    python benchmarks/group_commit.py --tasks 64 --turns 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from myapp.sqlite_storage import SQLiteConversationStorage  # noqa: E402
+
+async def _run(storage: SQLiteConversationStorage, tasks: int, turns: int) -> float:
+    conversation_ids = [await storage.create_conversation() for _ in range(tasks)]
+
+    async def play(conversation_id: str) -> None:
+        for turn in range(turns):
+            await storage.add_messages(conversation_id, [
+                ("user", f"Question {turn} about a movie?"),
+                ("assistant", f"Answer {turn} with plenty of movie trivia."),
+            ])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(play(c) for c in conversation_ids))
+    return time.perf_counter() - start
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=64)
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+
+    modes = {
+        # A batch size of one commits every write on its own.
+        "commit per write": dict(commit_batch_size=1),
+        "group commit (5 ms)": dict(commit_interval=0.005),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (name, options) in enumerate(modes.items()):
+            storage = SQLiteConversationStorage(os.path.join(tmp, f"bench-{i}.db"), **options)
+            elapsed = await _run(storage, args.tasks, args.turns)
+            turns = args.tasks * args.turns
+            print(f"{name:>20}: {turns / elapsed:>9.0f} turns/s  commits={storage.stats()['commits']}")
+            await storage.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
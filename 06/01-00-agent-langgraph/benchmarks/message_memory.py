@@ -0,0 +1,70 @@
+"""Memory footprint of the columnar MessageLog versus a list of plain dataclass messages.
+
+Run from the app directory:
+
+    python benchmarks/message_memory.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from myapp.storage import Message, MessageLog  # noqa: E402
+
+@dataclass
+class LegacyMessage:
+    """The message layout storage.py used before MessageLog: one dict-backed object per message."""
+    role: str
+    content: str
+    timestamp: datetime
+
+# A chat workload mixes many repeated short messages with unique longer ones.
+_REPEATED = ["Thanks!", "[Image received]", "Tell me more.", "Yes", "No spoilers please."]
+
+def _content(i: int) -> str:
+    if i % 3 == 0:
+        return _REPEATED[i % len(_REPEATED)]
+    # Built at runtime so every unique message is a distinct string object.
+    return f"Which movies did the director of title #{i} make after {1950 + i % 70}?"
+
+def _measure(build) -> int:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+def _legacy(n: int):
+    roles = ("user", "assistant")
+    return [LegacyMessage(role=roles[i % 2], content=_content(i), timestamp=datetime.utcnow()) for i in range(n)]
+
+def _columnar(n: int):
+    roles = ("user", "assistant")
+    log = MessageLog()
+    for i in range(n):
+        log.append(Message(role=roles[i % 2], content=_content(i)))
+    return log
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'messages':>10} {'dataclass list':>16} {'MessageLog':>12} {'B/msg old':>10} {'B/msg new':>10} {'saving':>7}")
+    for n in args.sizes:
+        legacy = _measure(lambda: _legacy(n))
+        columnar = _measure(lambda: _columnar(n))
+        print(
+            f"{n:>10} {legacy / 2**20:>13.1f} MB {columnar / 2**20:>9.1f} MB "
+            f"{legacy / n:>10.0f} {columnar / n:>10.0f} {1 - columnar / legacy:>6.0%}"
+        )
+
+if __name__ == "__main__":
+    main()
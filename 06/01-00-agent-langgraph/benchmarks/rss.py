@@ -0,0 +1,13 @@
+"""Process memory measurement shared by the benchmarks."""
+import os
+import resource
+import sys
+
+def rss_mb() -> float:
+    """Current resident set size of this process, in MB (peak RSS where /proc isn't available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
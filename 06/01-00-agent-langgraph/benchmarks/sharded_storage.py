@@ -0,0 +1,109 @@
+"""Write throughput of SQLite conversation storage as the shard count grows.
+
+Starts `--workers` processes, standing in for gunicorn workers, that all open
+the same shard files. Each runs `--tasks` concurrent asyncio tasks playing
+`--turns` chat turns, ending every turn with one `add_messages` call. The
+processes start writing together and the total turns/s is reported for each
+shard count, with the speed-up over the first one.
+
+A shard helps by letting commits to different files hold their write locks
+at the same time. On a local SSD a group commit is mostly CPU, so that only
+adds throughput with a spare core per writer. `--commit-latency-ms` keeps
+each transaction's write lock for that much longer, as a commit on a
+network-attached disk does (e.g. with synchronous=FULL), which is where
+one file caps every worker's writes. Run from the app directory:
+
+    python benchmarks/sharded_storage.py --shards 1 2 4 8
+    python benchmarks/sharded_storage.py --shards 1 2 4 8 --commit-latency-ms 5
+
+With 5 ms commits (8 workers x 2 turns, one CPU) 1/2/4/8 shards gave
+289/338/407/681 turns/s (x1.00/1.17/1.41/2.36); without the added latency
+all four stayed within 7% of 2170 turns/s on that single core.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from myapp.sharded_storage import ShardedConversationStorage, shard_paths  # noqa: E402
+from myapp.sqlite_storage import SQLiteConversationStorage  # noqa: E402
+
+class _SlowCommitStorage(SQLiteConversationStorage):
+    """Holds the write lock `commit_latency` seconds longer per transaction, like a slow fsync."""
+
+    def __init__(self, path: str, commit_latency: float):
+        super().__init__(path)
+        self._commit_latency = commit_latency
+
+    def _apply_batch_sync(self, batch):
+        # Runs inside the transaction, after the batch's writes.
+        return super()._apply_batch_sync(batch + [(time.sleep, (self._commit_latency,))])[:-1]
+
+def _storage(path: str, commit_latency: float) -> SQLiteConversationStorage:
+    return _SlowCommitStorage(path, commit_latency) if commit_latency else SQLiteConversationStorage(path)
+
+async def _worker(paths, tasks: int, turns: int, commit_latency: float, barrier) -> float:
+    storage = ShardedConversationStorage([_storage(path, commit_latency) for path in paths])
+    conversation_ids = await asyncio.gather(*(storage.create_conversation() for _ in range(tasks)))
+
+    async def play(conversation_id: str) -> None:
+        for turn in range(turns):
+            await storage.add_messages(conversation_id, [
+                ("user", f"Question {turn} about a movie?"),
+                ("assistant", f"Answer {turn} with plenty of movie trivia."),
+            ])
+
+    await asyncio.to_thread(barrier.wait)
+    start = time.perf_counter()
+    await asyncio.gather(*(play(c) for c in conversation_ids))
+    elapsed = time.perf_counter() - start
+    await storage.close()
+    return elapsed
+
+def _worker_main(paths, tasks: int, turns: int, commit_latency: float, barrier, results) -> None:
+    results.put(asyncio.run(_worker(paths, tasks, turns, commit_latency, barrier)))
+
+def _run(paths, workers: int, tasks: int, turns: int, commit_latency: float) -> float:
+    barrier = multiprocessing.Barrier(workers)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_worker_main, args=(paths, tasks, turns, commit_latency, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    elapsed = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    # The workers start together, so the slowest one spans the whole run.
+    return max(elapsed)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    # A real worker has few turns in flight, each waiting seconds on the model; with many, group
+    # commit already folds them into one commit per worker and shards have little to spread.
+    parser.add_argument("--tasks", type=int, default=2, help="Concurrent turns per worker")
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--commit-latency-ms", type=float, default=0.0, help="Extra time each commit holds the write lock")
+    args = parser.parse_args()
+
+    total_turns = args.workers * args.tasks * args.turns
+    print(f"{args.workers} workers x {args.tasks} tasks, commit latency {args.commit_latency_ms:g} ms, {os.cpu_count()} CPU(s)")
+    baseline = None
+    for shard_count in args.shards:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = shard_paths(os.path.join(tmp, "bench.db"), shard_count)
+            elapsed = _run(paths, args.workers, args.tasks, args.turns, args.commit_latency_ms / 1000)
+            throughput = total_turns / elapsed
+            baseline = baseline or throughput
+            print(f"{shard_count:>3} shard(s): {throughput:>9.0f} turns/s  x{throughput / baseline:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Benchmark suite for ConversationStorage backends.
+
+For every `--scales` size, a fresh backend is populated with that many
+conversations and then driven through four workloads from `--tasks`
+concurrent asyncio tasks:
+
+    create_burst  every task creates conversations back to back
+    long_append   a few conversations grow by one turn per call to --long-turns turns
+    polling       clients poll for new messages (info + get_messages_since), read only
+    mixed         75% reads, 20% appends, 5% creates on random conversations
+
+Each workload reports throughput and p50/p95/p99 latency per operation, and
+each scale the process RSS after populating and after the workloads. Every
+scale runs in a fresh process, so its RSS isn't inflated by the previous
+scale's freed memory. Results
+are printed and, with `--json`, written out; `--baseline` prints the change
+against an earlier JSON file, e.g. from the previous commit. Run from the app
+directory:
+
+    python benchmarks/storage_suite.py --backend sqlite --scales 1000 100000 --json sqlite.json
+    python benchmarks/storage_suite.py --backend sqlite --scales 1000 100000 --baseline sqlite.json
+
+Backends: memory, sqlite, sharded (SQLite, --shards files) and redis (--redis-url).
+RSS is the benchmark process's only, so it does not include a Redis server's
+memory. Each redis scale writes under its own key prefix and deletes its keys
+when done.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from myapp.storage import InMemoryConversationStorage  # noqa: E402
+from rss import rss_mb  # noqa: E402
+
+_WORDS = (
+    "movie actor director plot scene sequel trilogy villain hero score soundtrack "
+    "release premiere review rating studio budget cast script camera"
+).split()
+
+def _percentile(sorted_values, fraction: float) -> float:
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+def _turn(rng: random.Random, turn: int):
+    words = " ".join(rng.choice(_WORDS) for _ in range(12))
+    return [("user", f"Question {turn} about the {words}?"), ("assistant", f"Answer about the {words}.")]
+
+async def _create_storage(args, directory: str, key_prefix: str):
+    if args.backend == "sqlite":
+        from myapp.sqlite_storage import SQLiteConversationStorage
+        return SQLiteConversationStorage(os.path.join(directory, "bench.db"))
+    if args.backend == "sharded":
+        from myapp.sharded_storage import ShardedConversationStorage, shard_paths
+        from myapp.sqlite_storage import SQLiteConversationStorage
+        paths = shard_paths(os.path.join(directory, "bench.db"), args.shards)
+        return ShardedConversationStorage([SQLiteConversationStorage(path) for path in paths])
+    if args.backend == "redis":
+        from myapp.redis_storage import RedisConversationStorage
+        return RedisConversationStorage.from_url(args.redis_url, key_prefix=key_prefix)
+    return InMemoryConversationStorage()
+
+async def _populate(storage, conversations: int, turns: int, concurrency: int = 256):
+    rng = random.Random(42)
+    conversation_ids = []
+
+    async def play() -> None:
+        conversation_id = await storage.create_conversation()
+        messages = [message for turn in range(turns) for message in _turn(rng, turn)]
+        await storage.add_messages(conversation_id, messages)
+        conversation_ids.append(conversation_id)
+
+    for first in range(0, conversations, concurrency):
+        await asyncio.gather(*(play() for _ in range(first, min(first + concurrency, conversations))))
+    return conversation_ids
+
+async def _drive(tasks: int, operations: int, operation) -> dict:
+    """Run `operations` calls of `operation(rng)` spread over `tasks` tasks; time each call."""
+    latencies = []
+
+    async def worker(seed: int, count: int) -> None:
+        rng = random.Random(seed)
+        for _ in range(count):
+            started = time.perf_counter()
+            await operation(rng)
+            latencies.append(time.perf_counter() - started)
+
+    per_task, extra = divmod(operations, tasks)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i, per_task + (i < extra)) for i in range(tasks)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "ops": len(latencies),
+        "seconds": round(elapsed, 4),
+        "ops_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+    }
+
+async def _workloads(storage, conversation_ids, args) -> dict:
+    results = {}
+
+    async def create(rng):
+        conversation_ids.append(await storage.create_conversation())
+
+    results["create_burst"] = await _drive(args.tasks, args.operations, create)
+
+    long_ids = [await storage.create_conversation() for _ in range(args.long_conversations)]
+    long_turns = {conversation_id: 0 for conversation_id in long_ids}
+
+    async def append_long(rng):
+        conversation_id = rng.choice(long_ids)
+        turn = long_turns[conversation_id]
+        long_turns[conversation_id] += 1
+        await storage.add_messages(conversation_id, _turn(rng, turn))
+
+    results["long_append"] = await _drive(
+        min(args.tasks, args.long_conversations), args.long_conversations * args.long_turns, append_long
+    )
+
+    async def poll(rng):
+        # What the UI does on every poll: check the version, then fetch what's new.
+        conversation_id = rng.choice(conversation_ids)
+        info = await storage.get_conversation_info(conversation_id)
+        await storage.get_messages_since(conversation_id, max(info.message_count - 2, 0))
+
+    results["polling"] = await _drive(args.tasks, args.operations, poll)
+
+    async def mixed(rng):
+        roll = rng.random()
+        if roll < 0.05:
+            conversation_ids.append(await storage.create_conversation())
+        elif roll < 0.25:
+            await storage.add_messages(rng.choice(conversation_ids), _turn(rng, 0))
+        else:
+            await storage.get_messages_range(rng.choice(conversation_ids), 0, 50)
+
+    results["mixed"] = await _drive(args.tasks, args.operations, mixed)
+    return results
+
+async def _delete_redis_keys(url: str, key_prefix: str, batch: int = 1000) -> None:
+    from redis.asyncio import Redis
+    client = Redis.from_url(url)
+    try:
+        keys = []
+        async for key in client.scan_iter(match=f"{key_prefix}*", count=batch):
+            keys.append(key)
+            if len(keys) >= batch:
+                await client.unlink(*keys)
+                keys = []
+        if keys:
+            await client.unlink(*keys)
+    finally:
+        await client.aclose()
+
+async def _run_scale(args, scale: int) -> dict:
+    # A fresh key prefix per scale, so scales don't see each other's conversations.
+    key_prefix = f"bench:{os.getpid()}:{time.time_ns()}:"
+    with tempfile.TemporaryDirectory() as directory:
+        rss_start = rss_mb()
+        storage = await _create_storage(args, directory, key_prefix)
+        try:
+            await storage.start()
+            started = time.perf_counter()
+            conversation_ids = await _populate(storage, scale, args.turns)
+            populate_seconds = time.perf_counter() - started
+            rss_populated = rss_mb()
+            workloads = await _workloads(storage, conversation_ids, args)
+            rss_end = rss_mb()
+        finally:
+            await storage.close()
+            if args.backend == "redis":
+                await _delete_redis_keys(args.redis_url, key_prefix)
+    return {
+        "scale": scale,
+        "populate_s": round(populate_seconds, 3),
+        "rss_start_mb": round(rss_start, 1),
+        "rss_growth_populate_mb": round(rss_populated - rss_start, 1),
+        "rss_growth_workloads_mb": round(rss_end - rss_populated, 1),
+        "workloads": workloads,
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _print_results(report: dict, baseline: dict = None) -> None:
+    previous = {}
+    if baseline:
+        for result in baseline["results"]:
+            for name, workload in result["workloads"].items():
+                previous[(result["scale"], name)] = workload
+    print(f"{report['backend']} @ {report['commit']}")
+    for result in report["results"]:
+        print(
+            f"scale {result['scale']}: populate {result['populate_s']:.2f} s, RSS +{result['rss_growth_populate_mb']:.1f} MB"
+            f" populating, +{result['rss_growth_workloads_mb']:.1f} MB in workloads"
+        )
+        for name, workload in result["workloads"].items():
+            line = (
+                f"  {name:>12}: {workload['ops_per_s']:>10.1f} ops/s  p50 {workload['p50_ms']:>8.3f}"
+                f"  p95 {workload['p95_ms']:>8.3f}  p99 {workload['p99_ms']:>8.3f} ms"
+            )
+            old = previous.get((result["scale"], name))
+            if old:
+                line += (
+                    f"  | vs baseline: {workload['ops_per_s'] / old['ops_per_s'] - 1:+.1%} ops/s,"
+                    f" p99 {workload['p99_ms'] / old['p99_ms'] - 1:+.1%}"
+                )
+            print(line)
+
+def _run_scale_process(args, scale: int) -> dict:
+    return asyncio.run(_run_scale(args, scale))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["memory", "sqlite", "sharded", "redis"], default="memory")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1_000, 100_000], help="e.g. 1000 100000 1000000")
+    parser.add_argument("--turns", type=int, default=2, help="Turns per conversation when populating")
+    parser.add_argument("--tasks", type=int, default=64, help="Concurrent asyncio tasks")
+    parser.add_argument("--operations", type=int, default=5_000, help="Operations per workload")
+    parser.add_argument("--long-conversations", type=int, default=8)
+    parser.add_argument("--long-turns", type=int, default=250)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Earlier --json output to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "backend": args.backend if args.backend != "sharded" else f"sharded[{args.shards}]",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {key: value for key, value in vars(args).items() if key not in ("json", "baseline")},
+        "results": [],
+    }
+    # One process per scale, so RSS growth isn't muddied by the previous scale's freed memory.
+    context = multiprocessing.get_context("spawn")
+    for scale in args.scales:
+        with context.Pool(1) as pool:
+            report["results"].append(pool.apply(_run_scale_process, (args, scale)))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    _print_results(report, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
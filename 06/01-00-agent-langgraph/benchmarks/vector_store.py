@@ -0,0 +1,145 @@
+"""Search latency and memory of NumpyVectorStore versus Chroma at several corpus sizes.
+
+For every `--sizes` size, each store is built in a fresh process from the
+same random unit vectors (`--dims` wide, OpenAI's text-embedding-3-small is
+1536) and queried with perturbed copies of stored vectors through
+`as_retriever(search_type="similarity_score_threshold")`, the path
+`movie_database_search` takes. Query embeddings are precomputed, so only
+the search is timed. Reported per store: build time, RSS growth, p50/p95
+query latency, NumPy's throughput for `--batch` queries per matrix product,
+and Chroma's recall@k against the exact results. Run from the app directory:
+
+    python benchmarks/vector_store.py --sizes 1000 100000 1000000 --dims 256
+
+1M vectors of 1536 dims take 6 GB per copy, and Chroma needs a long time to
+index them; reduce `--dims` for a quick run.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from myapp.numpy_store import NumpyVectorStore  # noqa: E402
+from rss import rss_mb  # noqa: E402
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+class _QueryEmbeddings(Embeddings):
+    """Answers the query "q<i>" with the i-th precomputed query vector."""
+
+    def __init__(self, queries: np.ndarray):
+        self._queries = queries
+
+    def embed_documents(self, texts):
+        raise NotImplementedError("The benchmark adds precomputed vectors")
+
+    def embed_query(self, text):
+        return self._queries[int(text[1:])].tolist()
+
+def _corpus(n: int, dims: int, queries: int, noise: float = 0.5):
+    rng = np.random.default_rng(42)
+    vectors = _normalize(rng.standard_normal((n, dims), dtype=np.float32))
+    targets = rng.integers(0, n, size=queries)
+    query_vectors = _normalize(vectors[targets] + noise * rng.standard_normal((queries, dims), dtype=np.float32) / np.sqrt(dims))
+    return vectors, query_vectors
+
+def _build_numpy(vectors: np.ndarray, embeddings: Embeddings):
+    from langchain_core.documents import Document
+    documents = [Document(page_content=f"doc {i}") for i in range(len(vectors))]
+    return NumpyVectorStore(embeddings, _normalize(vectors), documents, [str(i) for i in range(len(vectors))])
+
+def _build_chroma(vectors: np.ndarray, embeddings: Embeddings):
+    import chromadb
+    from langchain_community.vectorstores import Chroma
+    client = chromadb.EphemeralClient()
+    store = Chroma(client=client, collection_name=f"bench{os.getpid()}", embedding_function=embeddings)
+    batch = client.get_max_batch_size()
+    for first in range(0, len(vectors), batch):
+        rows = range(first, min(first + batch, len(vectors)))
+        store._collection.add(
+            ids=[str(i) for i in rows],
+            embeddings=vectors[first:rows.stop].tolist(),
+            documents=[f"doc {i}" for i in rows],
+        )
+    return store
+
+def _run(name: str, n: int, args) -> dict:
+    # Random vectors are mostly far apart: quiet the "no relevant docs" and negative-score warnings.
+    warnings.simplefilter("ignore", UserWarning)
+    logging.getLogger("langchain_core.vectorstores.base").setLevel(logging.ERROR)
+    vectors, query_vectors = _corpus(n, args.dims, args.queries)
+    embeddings = _QueryEmbeddings(query_vectors)
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    store = (_build_numpy if name == "numpy" else _build_chroma)(vectors, embeddings)
+    result = {"build_s": time.perf_counter() - start, "rss_mb": rss_mb() - rss_before}
+
+    retriever = store.as_retriever(
+        search_type="similarity_score_threshold", search_kwargs={"k": args.k, "score_threshold": args.threshold}
+    )
+    latencies, found = [], []
+    for i in range(args.queries):
+        start = time.perf_counter()
+        docs = retriever.invoke(f"q{i}")
+        latencies.append(time.perf_counter() - start)
+        found.append({doc.page_content for doc in docs})
+    latencies.sort()
+    result["p50_ms"] = latencies[len(latencies) // 2] * 1000
+    result["p95_ms"] = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000
+
+    if name == "numpy":
+        start = time.perf_counter()
+        for first in range(0, args.queries, args.batch):
+            store.search_by_vectors(query_vectors[first:first + args.batch], args.k)
+        result["batch_qps"] = args.queries / (time.perf_counter() - start)
+    else:
+        exact = _build_numpy(vectors, embeddings).search_by_vectors(query_vectors, args.k)
+        hits = total = 0
+        for got, expected in zip(found, exact):
+            # Only results that pass the threshold are comparable.
+            expected = {doc.page_content for doc, distance in expected if 1.0 - distance / np.sqrt(2) >= args.threshold}
+            hits += len(got & expected)
+            total += len(expected)
+        result["recall"] = hits / total if total else 1.0
+    return result
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--k", type=int, default=3)
+    # The retriever settings used by _initialize_langchain_resources.
+    parser.add_argument("--threshold", type=float, default=0.01)
+    parser.add_argument("--stores", nargs="+", choices=["numpy", "chroma"], default=["numpy", "chroma"])
+    args = parser.parse_args()
+
+    print(f"{'vectors':>9} {'store':>6} {'build':>9} {'RSS':>10} {'p50':>9} {'p95':>9}  extra")
+    # One process per run, so RSS growth isn't muddied by the previous store's freed memory.
+    context = multiprocessing.get_context("spawn")
+    for n in args.sizes:
+        for name in args.stores:
+            with context.Pool(1) as pool:
+                result = pool.apply(_run, (name, n, args))
+            extra = (
+                f"{result['batch_qps']:.0f} queries/s in batches of {args.batch}"
+                if name == "numpy" else f"recall@{args.k} {result['recall']:.3f}"
+            )
+            print(
+                f"{n:>9} {name:>6} {result['build_s']:>7.2f} s {result['rss_mb']:>7.1f} MB "
+                f"{result['p50_ms']:>6.3f} ms {result['p95_ms']:>6.3f} ms  {extra}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
+import fcntl
 import multiprocessing
 import os
+import subprocess
 import sys
 
 from dotenv import load_dotenv
@@ -20,4 +22,40 @@ num_cpus = multiprocessing.cpu_count()
 workers = (num_cpus * 2) + 1
 worker_class = "uvicorn.workers.UvicornWorker"
 
-timeout = 120
\ No newline at end of file
+timeout = 120
+
+# Must match myapp.PRELOADED_SNAPSHOT_ENV and myapp.vector_index.READERS_FILE; not imported, so the master never loads the app.
+PRELOADED_SNAPSHOT_ENV = "MYAPP_PRELOADED_VECTOR_INDEX"
+INDEX_READERS_FILE = ".readers"
+# Shared lock on the preloaded index, held by the master (and inherited by its workers).
+_index_reader = None
+
+
+def on_starting(server):
+    """With VECTOR_INDEX_PRELOAD, builds or loads the movie index once in the master, before forking.
+
+    The index is exported as a snapshot that every worker memory-maps
+    read-only (one copy of the vectors per host, no embedding on worker
+    start). It runs in a child process so the master never imports Chroma;
+    a worker that can't attach falls back to loading the index itself.
+    """
+    if os.getenv("VECTOR_INDEX_PRELOAD", "").lower() != "true" or os.getenv(PRELOADED_SNAPSHOT_ENV):
+        return
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [src, os.getenv("PYTHONPATH")]))}
+    result = subprocess.run(
+        [sys.executable, "-m", "myapp.vector_store_manager"], env=env, stdout=subprocess.PIPE, text=True
+    )
+    if result.returncode != 0 or not result.stdout.strip():
+        server.log.warning("Vector index preload failed; each worker will load it.")
+        return
+    # Inherited by every worker forked from here on; create_app() reads it before loading .env.
+    snapshot_path = result.stdout.strip().splitlines()[-1]
+    os.environ[PRELOADED_SNAPSHOT_ENV] = snapshot_path
+    # The workers map the snapshot inside the index directory, so a later deploy's build mustn't prune it.
+    global _index_reader
+    try:
+        _index_reader = open(os.path.join(os.path.dirname(snapshot_path), INDEX_READERS_FILE), "a")
+        fcntl.flock(_index_reader.fileno(), fcntl.LOCK_SH)
+    except OSError as e:
+        server.log.warning(f"Could not lock the preloaded vector index: {e}")
@@ -7,12 +7,21 @@ from langchain_openai import ChatOpenAI
 
 from .chat_ui import chat_ui_bp
 from .chat_api import chat_api_bp
+from .admin import admin_bp
 from .tools import get_all_tools
 from .vector_store_manager import initialize_vector_store as init_chroma_vector_store
 from .agent_builder import create_agent_graph
-from .storage import ConversationStorage, InMemoryConversationStorage
+from .storage import ConversationStorage, InMemoryConversationStorage, DirectoryColdTier, CompressedMemoryColdTier
+from .history import GraphHistoryCache
+from .summarizer import ChatModelSummarizer, RollingSummarizer
+from .turn_locks import TurnLocks
+
+# Environment variable through which gunicorn's master hands the preloaded index snapshot to its workers.
+PRELOADED_SNAPSHOT_ENV = "MYAPP_PRELOADED_VECTOR_INDEX"
 
 def create_app():
+    # Set by gunicorn's master (see gunicorn.conf.py) before forking; read first, so .env can't override it.
+    preloaded_snapshot = os.environ.get(PRELOADED_SNAPSHOT_ENV)
     # We do this here in addition to gunicorn.conf.py, since we don't always use gunicorn
     load_dotenv(override=True)
     if os.getenv("RUNNING_IN_PRODUCTION"):
@@ -27,18 +36,123 @@ def create_app():
     # Feature flag for multimodal features
     app.config["SHOW_MULTIMODAL_FEATURES"] = os.getenv("SHOW_MULTIMODAL_FEATURES", "False").lower() == "true"
     app.logger.info(f'Multimodal features enabled: {app.config["SHOW_MULTIMODAL_FEATURES"]}')
+    app.config["VECTOR_INDEX_SNAPSHOT"] = preloaded_snapshot
+
+    # Conversation storage is selected by CONVERSATION_STORAGE ("memory", "sqlite", "partitioned" or "redis").
+    # Persistent backends open their connections lazily, so this is safe before gunicorn forks.
+    app.conversation_storage = _create_conversation_storage()
+    app.logger.info(f"Conversation storage: {type(app.conversation_storage).__name__}")
+    # LangChain-form histories, extended incrementally on each turn instead of rebuilt.
+    # HISTORY_TOKEN_BUDGET caps how much of the history is sent to the model per turn.
+    token_budget = os.getenv("HISTORY_TOKEN_BUDGET")
+    app.graph_history = GraphHistoryCache(token_budget=int(token_budget) if token_budget else None)
+    # Concurrent turns of one conversation: CONVERSATION_TURN_POLICY is "queue", "reject" (409) or "cancel".
+    # Persistent backends are shared by the workers, so their turn leases serialize turns across processes too.
+    turn_wait_timeout = os.getenv("CONVERSATION_TURN_WAIT_TIMEOUT")
+    shared_storage = not isinstance(app.conversation_storage, InMemoryConversationStorage)
+    app.turn_locks = TurnLocks(
+        stripes=int(os.getenv("CONVERSATION_TURN_STRIPES") or 1024),
+        policy=os.getenv("CONVERSATION_TURN_POLICY", "queue").lower(),
+        wait_timeout=float(turn_wait_timeout) if turn_wait_timeout else None,
+        leases=app.conversation_storage if shared_storage else None,
+        lease_seconds=float(os.getenv("CONVERSATION_TURN_LEASE_SECONDS") or 30),
+    )
 
     # Register the module-level functions as lifecycle hooks
     # These functions will be called within an app context, so current_app is available.
+    app.before_serving(_start_conversation_storage)
     app.before_serving(_initialize_langchain_resources)
     app.after_serving(_cleanup_langchain_resources)
 
     app.register_blueprint(chat_api.chat_api_bp)
     app.register_blueprint(chat_ui.chat_ui_bp)
+    # Conversation listing, search and export/import under /admin, disabled unless ADMIN_TOKEN is set.
+    app.register_blueprint(admin_bp)
 
     return app
 
 # --- Helper functions defined at module level ---
+def _create_conversation_storage() -> ConversationStorage:
+    """Builds the conversation storage selected by the environment."""
+    storage = _create_conversation_backend()
+    cache_bytes = os.getenv("CONVERSATION_CACHE_MAX_BYTES")
+    if cache_bytes and not isinstance(storage, InMemoryConversationStorage):
+        # Histories this worker already holds are served after a version check instead of re-read.
+        from .caching_storage import CachingConversationStorage
+        cache_conversations = os.getenv("CONVERSATION_CACHE_MAX_CONVERSATIONS")
+        storage = CachingConversationStorage(
+            storage,
+            max_bytes=int(cache_bytes),
+            max_conversations=int(cache_conversations) if cache_conversations else 10_000,
+        )
+    journal_dir = os.getenv("CONVERSATION_JOURNAL_DIR")
+    if journal_dir:
+        # Message writes return immediately and reach the backend from a background task.
+        from .write_behind import WriteBehindConversationStorage
+        storage = WriteBehindConversationStorage(storage, journal_dir)
+    return storage
+
+def _create_conversation_backend() -> ConversationStorage:
+    """Builds the conversation storage backend selected by CONVERSATION_STORAGE."""
+    backend = os.getenv("CONVERSATION_STORAGE", "memory").lower()
+    if backend == "sqlite":
+        from .sqlite_storage import SQLiteConversationStorage
+        path = os.getenv("CONVERSATION_STORAGE_PATH", "conversations.db")
+        shards = int(os.getenv("CONVERSATION_SHARDS") or 1)
+        if shards > 1:
+            # One database file per shard, so workers only contend for a write lock on the same shard.
+            from .sharded_storage import ShardedConversationStorage, shard_paths
+            return ShardedConversationStorage([SQLiteConversationStorage(p) for p in shard_paths(path, shards)])
+        return SQLiteConversationStorage(path)
+    if backend == "partitioned":
+        # SQLite split into time-partitioned segment files; retention drops whole segments.
+        from .partitioned_storage import PartitionedConversationStorage, RetentionPolicy
+        max_age = os.getenv("CONVERSATION_RETENTION_MAX_AGE_SECONDS")
+        max_conversations = os.getenv("CONVERSATION_RETENTION_MAX_CONVERSATIONS")
+        max_bytes = os.getenv("CONVERSATION_RETENTION_MAX_BYTES")
+        retention = None
+        if max_age or max_conversations or max_bytes:
+            retention = RetentionPolicy(
+                max_age_seconds=float(max_age) if max_age else None,
+                max_conversations=int(max_conversations) if max_conversations else None,
+                max_bytes=int(max_bytes) if max_bytes else None,
+            )
+        return PartitionedConversationStorage(
+            os.getenv("CONVERSATION_PARTITION_DIR", "conversations"),
+            partition_seconds=int(os.getenv("CONVERSATION_PARTITION_SECONDS") or 86400),
+            retention=retention,
+            sweep_interval=float(os.getenv("CONVERSATION_RETENTION_SWEEP_INTERVAL") or 300),
+        )
+    if backend == "redis":
+        # Shared by all gunicorn workers, so any worker can serve any conversation.
+        from .redis_storage import RedisConversationStorage
+        return RedisConversationStorage.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    if backend != "memory":
+        logging.getLogger("quart.app").warning(f"Unknown CONVERSATION_STORAGE '{backend}', using in-memory storage.")
+    # Optional eviction: a resident-size budget, an idle TTL and a cold tier to spill evicted conversations to.
+    max_bytes = os.getenv("CONVERSATION_MAX_BYTES")
+    ttl_seconds = os.getenv("CONVERSATION_TTL_SECONDS")
+    cold_dir = os.getenv("CONVERSATION_COLD_DIR")
+    if cold_dir == "memory":
+        # Compressed blobs in this process instead of segment files on disk.
+        cold_tier = CompressedMemoryColdTier()
+    else:
+        cold_tier = DirectoryColdTier(cold_dir) if cold_dir else None
+    # Optional warm restarts: per-worker snapshots of the conversations, restored lazily on start.
+    snapshot_dir = os.getenv("CONVERSATION_SNAPSHOT_DIR")
+    snapshot_interval = os.getenv("CONVERSATION_SNAPSHOT_INTERVAL")
+    return InMemoryConversationStorage(
+        max_bytes=int(max_bytes) if max_bytes else None,
+        ttl_seconds=float(ttl_seconds) if ttl_seconds else None,
+        cold_tier=cold_tier,
+        snapshot_dir=snapshot_dir or None,
+        snapshot_interval=float(snapshot_interval) if snapshot_interval else 60.0,
+    )
+
+async def _start_conversation_storage():
+    """Starts the storage's background tasks (e.g. the TTL sweep) once the event loop is running."""
+    await current_app.conversation_storage.start()
+
 async def _initialize_langchain_resources():
     """Initializes Langchain resources before the app starts serving.
     This includes loading API keys, initializing the ChatOpenAI model,
@@ -54,17 +168,31 @@ async def _initialize_langchain_resources():
         return
 
     try:
-        # Initialize Conversation Storage
-        current_app.conversation_storage = InMemoryConversationStorage()
-        logger.info("InMemoryConversationStorage initialized.")
-
         # Initialize ChatOpenAI model
         chat_model = ChatOpenAI(model="gpt-4", temperature=0, streaming=True, api_key=api_key)
         current_app.chat_model = chat_model
         logger.info("ChatOpenAI model initialized.")
 
-        # Initialize Chroma vector store
-        vector_store = init_chroma_vector_store(embeddings_api_key=api_key)
+        # Optional background summarization of older turns once a conversation's
+        # unsummarized history exceeds HISTORY_SUMMARIZE_AFTER_TOKENS.
+        summarize_after = os.getenv("HISTORY_SUMMARIZE_AFTER_TOKENS")
+        if summarize_after:
+            current_app.graph_history.summarizer = RollingSummarizer(
+                ChatModelSummarizer(chat_model), summarize_after_tokens=int(summarize_after)
+            )
+            logger.info(f"History summarization enabled after {summarize_after} tokens.")
+
+        # Initialize Chroma vector store, persisted in VECTOR_INDEX_DIR and only re-embedded when its inputs change.
+        # Under gunicorn with VECTOR_INDEX_PRELOAD, the master exported it as a snapshot,
+        # which each worker memory-maps instead.
+        vector_store = init_chroma_vector_store(
+            embeddings_api_key=api_key,
+            index_dir=os.getenv("VECTOR_INDEX_DIR", "vector_index"),
+            embedding_cache_path=os.getenv("EMBEDDING_CACHE_PATH", "embeddings.db"),
+            snapshot_path=current_app.config.get("VECTOR_INDEX_SNAPSHOT") or None,
+            # "numpy" answers queries by exact search over an in-memory matrix instead of through Chroma.
+            store=os.getenv("VECTOR_STORE", "chroma").lower(),
+        )
         if vector_store:
             current_app.vector_store = vector_store
             logger.info("Chroma vector store initialized.")
@@ -109,6 +237,9 @@ async def _cleanup_langchain_resources():
         delattr(current_app, 'chat_model')
     if hasattr(current_app, 'compiled_graph'):
         delattr(current_app, 'compiled_graph')
+    if getattr(current_app, 'graph_history', None) and current_app.graph_history.summarizer:
+        await current_app.graph_history.summarizer.close()
     if hasattr(current_app, 'conversation_storage'):
+        await current_app.conversation_storage.close()
         delattr(current_app, 'conversation_storage')
     logger.info("Resources cleaned up.")
@@ -0,0 +1,128 @@
+import hmac
+import logging
+import os
+
+from quart import Blueprint, Response, current_app, jsonify, request
+
+from .bulk_transfer import EXPORT_PAGE_SIZE, export_ndjson, import_ndjson
+from .storage import ConversationStorage
+
+# Admin endpoints, enabled by setting ADMIN_TOKEN and called with "Authorization: Bearer <token>"
+admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
+
+logger = logging.getLogger(__name__)
+
+# Largest page of conversations an export reads at a time
+MAX_EXPORT_PAGE_SIZE = 1000
+# Largest page a client can ask for with ?limit= when listing or searching
+MAX_LIST_PAGE_SIZE = 1000
+
+@admin_bp.before_request
+async def require_admin_token():
+    """Rejects every admin request unless it carries the ADMIN_TOKEN bearer token."""
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        return jsonify({"error": "Admin endpoints are disabled (ADMIN_TOKEN is not set)"}), 403
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode("utf-8"), token.encode("utf-8")):
+        return jsonify({"error": "Unauthorized"}), 401
+
+@admin_bp.get("/export")
+async def export_conversations():
+    """Stream every conversation as NDJSON (?cursor= resumes after a cursor line, ?page_size=)."""
+    storage: ConversationStorage = getattr(current_app, 'conversation_storage', None)
+    if not storage:
+        logger.error("Conversation storage not found in current_app.")
+        return jsonify({"error": "Conversation storage not available"}), 500
+    page_size = request.args.get("page_size", EXPORT_PAGE_SIZE, type=int)
+    if not 1 <= page_size <= MAX_EXPORT_PAGE_SIZE:
+        return jsonify({"error": f"page_size must be between 1 and {MAX_EXPORT_PAGE_SIZE}"}), 400
+    cursor = request.args.get("cursor")
+    # Errors are reported before the stream starts, while a status code can still be sent.
+    try:
+        await storage.list_conversations_by_creation(1, cursor)
+    except NotImplementedError as e:
+        return jsonify({"error": str(e)}), 501
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    response = Response(export_ndjson(storage, cursor, page_size), mimetype="application/x-ndjson")
+    # An export runs as long as the client keeps reading.
+    response.timeout = None
+    return response
+
+@admin_bp.post("/import")
+async def import_conversations():
+    """Import NDJSON conversations from the request body, skipping IDs that already exist."""
+    storage: ConversationStorage = getattr(current_app, 'conversation_storage', None)
+    if not storage:
+        logger.error("Conversation storage not found in current_app.")
+        return jsonify({"error": "Conversation storage not available"}), 500
+    request.body_timeout = None
+    try:
+        counts = await import_ndjson(storage, request.body)
+    except NotImplementedError as e:
+        return jsonify({"error": str(e)}), 501
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    logger.info(f"Imported conversations: {counts}")
+    return jsonify(counts)
+
+@admin_bp.get("/stats")
+async def get_stats():
+    """Counters of the worker that answers: conversation storage (with its cache and backends), turn locks and history cache."""
+    stats = {"pid": os.getpid()}
+    storage = getattr(current_app, 'conversation_storage', None)
+    if storage is not None and hasattr(storage, "stats"):
+        stats["storage"] = storage.stats()
+    turn_locks = getattr(current_app, 'turn_locks', None)
+    if turn_locks is not None:
+        stats["turn_locks"] = turn_locks.stats()
+    graph_history = getattr(current_app, 'graph_history', None)
+    if graph_history is not None:
+        stats["history"] = graph_history.stats()
+    return jsonify(stats)
+
+# Listing and search span every user's conversations, so they are admin-only.
+@admin_bp.get("/conversations")
+async def list_conversations():
+    """List every conversation by most recent update, one page at a time (?limit=, ?cursor=)."""
+    return await _conversation_page(lambda storage, limit, cursor: storage.list_conversations(limit, cursor))
+
+@admin_bp.get("/conversations/search")
+async def search_conversations():
+    """Find conversations (of all users) containing every term and "quoted phrase" in ?q=, most recently updated first."""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    return await _conversation_page(lambda storage, limit, cursor: storage.search_conversations(query, limit, cursor))
+
+async def _conversation_page(fetch):
+    try:
+        storage: ConversationStorage = getattr(current_app, 'conversation_storage', None)
+        if not storage:
+            logger.error("Conversation storage not found in current_app.")
+            return jsonify({"error": "Conversation storage not available"}), 500
+        limit = request.args.get("limit", 50, type=int)
+        if not 1 <= limit <= MAX_LIST_PAGE_SIZE:
+            return jsonify({"error": f"limit must be between 1 and {MAX_LIST_PAGE_SIZE}"}), 400
+        try:
+            conversations, next_cursor = await fetch(storage, limit, request.args.get("cursor"))
+        except NotImplementedError as e:
+            return jsonify({"error": str(e)}), 501
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+        return jsonify({
+            "conversations": [
+                {
+                    "id": info.id,
+                    "created_at": info.created_at.isoformat(),
+                    "updated_at": info.updated_at.isoformat(),
+                    "message_count": info.message_count,
+                }
+                for info in conversations
+            ],
+            "next_cursor": next_cursor,
+        })
+    except Exception as e:
+        logger.error(f"Error listing conversations: {e}")
+        return jsonify({"error": "Failed to list conversations"}), 500
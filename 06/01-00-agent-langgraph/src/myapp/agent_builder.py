@@ -20,6 +20,9 @@ def _convert_stored_messages_to_graph_history(stored_messages: list[dict]) -> li
             content = msg_data.get("content")
             if role == "user":
                 history.append(HumanMessage(content=content))
+            elif role == "system":
+                # Stored system/context messages are kept (and pinned by the history window).
+                history.append(SystemMessage(content=content))
             elif role == "assistant":
                 # If the assistant message had tool calls, they should have been processed
                 # and the 'content' here should be the textual part of the response.
@@ -0,0 +1,283 @@
+"""Streaming NDJSON export and import of conversations, for any ConversationStorage.
+
+Export writes one line per conversation, oldest first:
+
+    {"type": "conversation", "id": ..., "created_at": ..., "updated_at": ..., "messages": [{"role", "content", "timestamp"}, ...]}
+
+followed after each page by a `{"type": "cursor", "cursor": ...}` line that
+resumes the export after that page, and finally an `{"type": "end"}` line
+with the number of conversations this run wrote.
+Import reads the same lines and skips conversations that already exist, so
+an interrupted import can simply be run again.
+
+Command line (storage from the same environment variables as the app, or a
+running server with --url). In-memory storage lives in the server's workers,
+so it can only be reached with --url, and each worker holds its own
+conversations: an export or import through --url only sees the worker that
+answers each request, so it is complete only against a single-worker server.
+
+    python -m myapp.bulk_transfer export --out conversations.ndjson [--resume]
+    python -m myapp.bulk_transfer import --in conversations.ndjson
+    python -m myapp.bulk_transfer export --url http://localhost:50505 --token $ADMIN_TOKEN --out backup.ndjson
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+from .storage import Conversation, ConversationStorage, Message
+
+logger = logging.getLogger(__name__)
+
+EXPORT_PAGE_SIZE = 100
+# Longest NDJSON line (i.e. conversation) an import accepts.
+MAX_LINE_BYTES = 64 * 1024 * 1024
+
+
+def _conversation_line(conversation: Conversation) -> str:
+    return json.dumps({
+        "type": "conversation",
+        "id": conversation.id,
+        "created_at": conversation.created_at.isoformat(),
+        "updated_at": conversation.updated_at.isoformat(),
+        "messages": [
+            {"role": m.role, "content": m.content, "timestamp": m.timestamp.isoformat()}
+            for m in conversation.messages
+        ],
+    }, ensure_ascii=False) + "\n"
+
+
+async def export_ndjson(
+    storage: ConversationStorage, cursor: Optional[str] = None, page_size: int = EXPORT_PAGE_SIZE
+) -> AsyncIterator[str]:
+    """Yield every conversation as an NDJSON line, holding one page of IDs and one conversation at a time.
+
+    The caller pulls lines at its own pace (e.g. as fast as the HTTP client
+    reads them), so nothing is read from the storage ahead of the consumer.
+    Pages follow `list_conversations_by_creation`, whose order writes never
+    change, so every conversation that exists for the whole export is
+    exported exactly once, at its state when its page was read; ones created
+    during the export come last.
+    """
+    exported = 0
+    while True:
+        page, cursor = await storage.list_conversations_by_creation(page_size, cursor)
+        for info in page:
+            conversation = await storage.get_conversation(info.id)
+            if conversation is not None:  # Deleted since it was listed.
+                exported += 1
+                yield _conversation_line(conversation)
+        if cursor is None:
+            yield json.dumps({"type": "end", "conversations": exported}) + "\n"
+            return
+        yield json.dumps({"type": "cursor", "cursor": cursor}) + "\n"
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            yield bytes(buffer[start:end])
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > MAX_LINE_BYTES:
+            raise ValueError(f"NDJSON line longer than {MAX_LINE_BYTES} bytes")
+    if buffer:
+        yield bytes(buffer)
+
+
+def _parse_conversation(record: Dict) -> Conversation:
+    return Conversation(
+        id=record["id"],
+        messages=[
+            Message(role=m["role"], content=m["content"], timestamp=datetime.fromisoformat(m["timestamp"]))
+            for m in record["messages"]
+        ],
+        created_at=datetime.fromisoformat(record["created_at"]),
+        updated_at=datetime.fromisoformat(record["updated_at"]),
+    )
+
+
+async def import_ndjson(storage: ConversationStorage, chunks: AsyncIterator[bytes]) -> Dict[str, int]:
+    """Import the conversations in an NDJSON byte stream, one conversation in memory at a time.
+
+    Each conversation is stored before the next chunk is read, so a slow
+    backend slows the reader down instead of letting input pile up.
+    Conversations that already exist are skipped. Raises ValueError on a
+    malformed line, after importing everything before it.
+    """
+    counts = {"imported": 0, "skipped": 0}
+    line_number = 0
+    async for line in _lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if record.get("type") != "conversation":
+                continue  # Cursor and end markers.
+            conversation = _parse_conversation(record)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Line {line_number}: invalid conversation record ({e}); {counts}") from None
+        try:
+            await storage.import_conversation(conversation)
+            counts["imported"] += 1
+        except ValueError:
+            counts["skipped"] += 1
+    return counts
+
+
+# --- Command line ---------------------------------------------------------------------
+
+def _resume_point(path: str) -> Optional[str]:
+    """Cursor of the last completed page in a partial export, truncating anything after it."""
+    cursor, keep = None, 0
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            offset += len(line)
+            if not line.endswith(b"\n"):
+                break
+            record = json.loads(line)
+            if record.get("type") == "cursor":
+                cursor, keep = record["cursor"], offset
+            elif record.get("type") == "end":
+                raise SystemExit(f"{path} is already a complete export.")
+    with open(path, "r+b") as f:
+        f.truncate(keep)
+    return cursor
+
+
+async def _export_from_storage(out, cursor: Optional[str], page_size: int) -> None:
+    from . import _create_conversation_storage
+
+    storage = _create_conversation_storage()
+    await storage.start()
+    try:
+        async for line in export_ndjson(storage, cursor, page_size):
+            out.write(line)
+    finally:
+        await storage.close()
+
+
+async def _file_chunks(f, size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await asyncio.to_thread(f.read, size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _import_to_storage(f) -> Dict[str, int]:
+    from . import _create_conversation_storage
+
+    storage = _create_conversation_storage()
+    await storage.start()
+    try:
+        return await import_ndjson(storage, _file_chunks(f))
+    finally:
+        await storage.close()
+
+
+def _http_request(url: str, token: Optional[str], data: Optional[bytes] = None):
+    headers = {"Content-Type": "application/x-ndjson"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers))
+
+
+def _export_from_url(out, url: str, token: Optional[str], cursor: Optional[str], page_size: int) -> None:
+    query = {"page_size": page_size}
+    if cursor:
+        query["cursor"] = cursor
+    with _http_request(f"{url.rstrip('/')}/admin/export?{urllib.parse.urlencode(query)}", token) as response:
+        for line in response:
+            out.write(line.decode("utf-8"))
+
+
+def _batches(f, batch_bytes: int) -> Iterator[bytes]:
+    batch = []
+    size = 0
+    for line in f:
+        batch.append(line)
+        size += len(line)
+        if size >= batch_bytes:
+            yield b"".join(batch)
+            batch, size = [], 0
+    if batch:
+        yield b"".join(batch)
+
+
+def _import_to_url(f, url: str, token: Optional[str], batch_bytes: int) -> Dict[str, int]:
+    # One request per batch keeps each body under the server's MAX_CONTENT_LENGTH.
+    totals = {"imported": 0, "skipped": 0}
+    for batch in _batches(f, batch_bytes):
+        with _http_request(f"{url.rstrip('/')}/admin/import", token, batch) as response:
+            counts = json.load(response)
+        for key in totals:
+            totals[key] += counts[key]
+        logger.info(f"Imported batch: {counts}")
+    return totals
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Export or import conversations as NDJSON.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("--out", help="Export file (default: stdout)")
+    parser.add_argument("--in", dest="in_path", help="Import file (default: stdin)")
+    parser.add_argument("--resume", action="store_true", help="Continue a partial export in --out")
+    parser.add_argument("--cursor", help="Start the export after this cursor line's page")
+    parser.add_argument("--page-size", type=int, default=EXPORT_PAGE_SIZE)
+    parser.add_argument("--url", help="Use a running server's /admin endpoints instead of the storage")
+    parser.add_argument("--token", default=os.getenv("ADMIN_TOKEN"), help="Admin token for --url")
+    parser.add_argument("--batch-bytes", type=int, default=8 * 1024 * 1024, help="Request size for --url imports")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if not args.url:
+        from dotenv import load_dotenv
+        load_dotenv(override=True)
+        if os.getenv("CONVERSATION_STORAGE", "memory").lower() == "memory":
+            parser.error("in-memory storage is only reachable through a running server; use --url")
+
+    if args.command == "export":
+        cursor = args.cursor
+        if args.resume:
+            if not args.out:
+                parser.error("--resume needs --out")
+            cursor = _resume_point(args.out) if os.path.exists(args.out) else None
+        out = open(args.out, "a" if args.resume else "w", encoding="utf-8") if args.out else sys.stdout
+        try:
+            if args.url:
+                _export_from_url(out, args.url, args.token, cursor, args.page_size)
+            else:
+                asyncio.run(_export_from_storage(out, cursor, args.page_size))
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        return
+
+    f = open(args.in_path, "rb") if args.in_path else sys.stdin.buffer
+    try:
+        if args.url:
+            counts = _import_to_url(f, args.url, args.token, args.batch_bytes)
+        else:
+            counts = asyncio.run(_import_to_storage(f))
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
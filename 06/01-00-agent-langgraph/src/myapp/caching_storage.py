@@ -0,0 +1,272 @@
+import asyncio
+import weakref
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .storage import Conversation, ConversationInfo, ConversationStorage, StoredSummary, _message_size
+from .tokens import message_tokens
+
+
+@dataclass
+class _CachedHistory:
+    # None until a read has confirmed this worker's view against the backend.
+    created_at: Optional[datetime]
+    messages: List[Dict] = field(default_factory=list)
+    # Each message's stored token count, kept apart so the cached dicts stay in OpenAI format.
+    tokens: array = field(default_factory=lambda: array("I"))
+    size: int = 0
+    # False after a local write-through, until a read sees the backend at the same length.
+    verified: bool = False
+
+
+class CachingConversationStorage(ConversationStorage):
+    """Read-through LRU cache of message histories in front of any `ConversationStorage`.
+
+    Every history read first asks the backend for the conversation's
+    version (`get_conversation_info`, one indexed lookup) and answers from
+    the cache when it matches. When another worker has appended since, only
+    the new messages are fetched; a version that can't follow from the
+    cached one (fewer messages, a different created_at, or an unconfirmed
+    local write interleaved with someone else's) reloads the whole history.
+
+    `add_message`/`add_messages` write through: the backend is written
+    first, then the cached history is extended. Operations on one
+    conversation are serialized within the worker, so the cache sees its
+    own writes in backend order.
+
+    The cache is bounded by `max_bytes` of message content and
+    `max_conversations`, evicting the least recently used history. Cached
+    message dicts are shared between calls and must not be mutated.
+    """
+
+    def __init__(
+        self,
+        backend: ConversationStorage,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_conversations: int = 10_000,
+    ):
+        self._backend = backend
+        self._max_bytes = max_bytes
+        self._max_conversations = max_conversations
+        self._entries: "OrderedDict[str, _CachedHistory]" = OrderedDict()
+        self._bytes = 0
+        # One lock per conversation in use; dropped once nobody holds or waits on it.
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @property
+    def backend(self) -> ConversationStorage:
+        return self._backend
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self._backend.stats()) if hasattr(self._backend, "stats") else {}
+        stats.update({
+            "cache_conversations": len(self._entries),
+            "cache_bytes": self._bytes,
+            "cache_hits": self.hits,
+            "cache_partial_hits": self.partial_hits,
+            "cache_misses": self.misses,
+            "cache_invalidations": self.invalidations,
+            "cache_evictions": self.evictions,
+        })
+        return stats
+
+    def _lock(self, conversation_id: str) -> asyncio.Lock:
+        lock = self._locks.get(conversation_id)
+        if lock is None:
+            lock = self._locks[conversation_id] = asyncio.Lock()
+        return lock
+
+    # --- Cache bookkeeping ----------------------------------------------------------
+
+    def _drop(self, conversation_id: str) -> None:
+        entry = self._entries.pop(conversation_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _extend(self, conversation_id: str, entry: _CachedHistory, messages: List[Dict], tokens: List[int]) -> None:
+        entry.messages.extend(messages)
+        entry.tokens.extend(tokens)
+        added = sum(_message_size(m["content"]) for m in messages)
+        entry.size += added
+        self._bytes += added
+        self._entries.move_to_end(conversation_id)
+        self._enforce_budget(conversation_id)
+
+    def _store(self, conversation_id: str, entry: _CachedHistory) -> None:
+        self._drop(conversation_id)
+        self._entries[conversation_id] = entry
+        self._bytes += entry.size
+        self._enforce_budget(conversation_id)
+
+    def _enforce_budget(self, keep_id: str) -> None:
+        while self._entries and (self._bytes > self._max_bytes or len(self._entries) > self._max_conversations):
+            conversation_id = next(iter(self._entries))
+            if conversation_id == keep_id and len(self._entries) == 1:
+                # A single history larger than the whole budget isn't cached at all.
+                self._drop(conversation_id)
+                break
+            if conversation_id == keep_id:
+                self._entries.move_to_end(conversation_id)
+                continue
+            self._drop(conversation_id)
+            self.evictions += 1
+
+    async def _fetch(self, conversation_id: str, cursor: int) -> Tuple[List[Dict], List[int]]:
+        """The backend's messages after `cursor`, and their token counts."""
+        messages, _ = await self._backend.get_messages_since(conversation_id, cursor, with_tokens=True)
+        return [{"role": m["role"], "content": m["content"]} for m in messages], [m["tokens"] for m in messages]
+
+    async def _history(self, conversation_id: str) -> Optional[_CachedHistory]:
+        """The conversation's full history, validated against the backend; None if it doesn't exist."""
+        async with self._lock(conversation_id):
+            info = await self._backend.get_conversation_info(conversation_id)
+            entry = self._entries.get(conversation_id)
+            if info is None:
+                if entry is not None:
+                    self._drop(conversation_id)
+                    self.invalidations += 1
+                return None
+            if entry is not None and entry.created_at in (None, info.created_at):
+                cached = len(entry.messages)
+                if info.message_count == cached:
+                    self.hits += 1
+                    entry.created_at, entry.verified = info.created_at, True
+                    self._entries.move_to_end(conversation_id)
+                    return entry
+                if info.message_count > cached and entry.verified:
+                    # Appended by another worker: the cached prefix is still exact.
+                    self.partial_hits += 1
+                    self._extend(conversation_id, entry, *await self._fetch(conversation_id, cached))
+                    return entry
+            if entry is not None:
+                self._drop(conversation_id)
+                self.invalidations += 1
+            self.misses += 1
+            messages, tokens = await self._fetch(conversation_id, 0)
+            entry = _CachedHistory(
+                created_at=info.created_at,
+                messages=messages,
+                tokens=array("I", tokens),
+                size=sum(_message_size(m["content"]) for m in messages),
+                verified=True,
+            )
+            self._store(conversation_id, entry)
+            return entry
+
+    # --- ConversationStorage --------------------------------------------------------
+
+    async def create_conversation(self) -> str:
+        conversation_id = await self._backend.create_conversation()
+        # Cached empty, so the first turns of a new conversation never read the backend's history.
+        self._store(conversation_id, _CachedHistory(created_at=None))
+        return conversation_id
+
+    async def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
+        # Needs the message timestamps, which the cache doesn't keep.
+        return await self._backend.get_conversation(conversation_id)
+
+    async def get_conversation_info(self, conversation_id: str) -> Optional[ConversationInfo]:
+        return await self._backend.get_conversation_info(conversation_id)
+
+    async def add_message(self, conversation_id: str, role: str, content: str) -> None:
+        await self.add_messages(conversation_id, [(role, content)])
+
+    async def add_messages(self, conversation_id: str, messages: Sequence[Tuple[str, str]]) -> None:
+        async with self._lock(conversation_id):
+            try:
+                await self._backend.add_messages(conversation_id, messages)
+            except BaseException:
+                # The backend may have applied part of the batch.
+                self._drop(conversation_id)
+                raise
+            entry = self._entries.get(conversation_id)
+            if entry is not None:
+                entry.verified = False
+                self._extend(
+                    conversation_id,
+                    entry,
+                    [{"role": role, "content": content} for role, content in messages],
+                    [message_tokens(content) for _, content in messages],
+                )
+
+    async def get_messages(self, conversation_id: str) -> List[Dict]:
+        history = await self._history(conversation_id)
+        if history is None:
+            return await self._backend.get_messages(conversation_id)
+        return list(history.messages)
+
+    async def get_messages_since(
+        self, conversation_id: str, cursor: int = 0, with_tokens: bool = False
+    ) -> Tuple[List[Dict], int]:
+        history = await self._history(conversation_id)
+        if history is None:
+            return await self._backend.get_messages_since(conversation_id, cursor, with_tokens)
+        if with_tokens:
+            messages = [
+                {**m, "tokens": tokens} for m, tokens in zip(history.messages[cursor:], history.tokens[cursor:])
+            ]
+            return messages, len(history.messages)
+        return history.messages[cursor:], len(history.messages)
+
+    async def get_messages_range(self, conversation_id: str, start: int, end: int) -> Tuple[List[Dict], int]:
+        history = await self._history(conversation_id)
+        if history is None:
+            return await self._backend.get_messages_range(conversation_id, start, end)
+        return history.messages[start:end], len(history.messages)
+
+    async def fork_conversation(self, conversation_id: str, at_index: int) -> str:
+        return await self._backend.fork_conversation(conversation_id, at_index)
+
+    async def import_conversation(self, conversation: Conversation) -> None:
+        await self._backend.import_conversation(conversation)
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        async with self._lock(conversation_id):
+            self._drop(conversation_id)
+            return await self._backend.delete_conversation(conversation_id)
+
+    async def list_conversations(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        return await self._backend.list_conversations(limit, cursor)
+
+    async def list_conversations_by_creation(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        return await self._backend.list_conversations_by_creation(limit, cursor)
+
+    async def search_conversations(
+        self, query: str, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        return await self._backend.search_conversations(query, limit, cursor)
+
+    async def acquire_turn_lease(self, conversation_id: str, owner: str, ttl_seconds: float) -> bool:
+        return await self._backend.acquire_turn_lease(conversation_id, owner, ttl_seconds)
+
+    async def release_turn_lease(self, conversation_id: str, owner: str) -> None:
+        await self._backend.release_turn_lease(conversation_id, owner)
+
+    async def get_summary(self, conversation_id: str) -> Optional[StoredSummary]:
+        return await self._backend.get_summary(conversation_id)
+
+    async def save_summary(self, conversation_id: str, summary: StoredSummary) -> None:
+        await self._backend.save_summary(conversation_id, summary)
+
+    async def delete_summary(self, conversation_id: str) -> None:
+        await self._backend.delete_summary(conversation_id)
+
+    async def start(self) -> None:
+        await self._backend.start()
+
+    async def close(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        await self._backend.close()
@@ -1,12 +1,21 @@
 import logging
 import json
+from contextlib import nullcontext
 from quart import Blueprint, request, jsonify, Response, current_app, stream_with_context
-from .storage import InMemoryConversationStorage
+from .storage import ConversationStorage
+from .turn_locks import ConversationBusyError
 from langchain.schema import HumanMessage, AIMessage
 
 chat_api_bp = Blueprint("chat_api", __name__, url_prefix="/api")  # Added url_prefix="/api"
 logger = logging.getLogger(__name__)
-storage = InMemoryConversationStorage()
+
+def _get_storage() -> ConversationStorage:
+    """Returns the app-wide conversation storage shared with the chat UI."""
+    return current_app.conversation_storage
+
+def _turn(conversation_id):
+    """Holds the conversation's turn lock for a turn, if the request belongs to a conversation."""
+    return current_app.turn_locks.turn(conversation_id) if conversation_id else nullcontext()
 
 @chat_api_bp.route("/chat", methods=["POST"])
 async def handle_chat():
@@ -14,6 +23,7 @@ async def handle_chat():
     Handles non-streaming chat requests using the AgentExecutor.
     """
     agent_executor = getattr(current_app, 'agent_executor', None)
+    storage = _get_storage()
     if not agent_executor:
         logger.error("Agent Executor not configured for /chat POST.")
         return jsonify({"error": "Server agent not available."}), 500
@@ -26,47 +36,45 @@ async def handle_chat():
         request_messages = data["messages"]
         conversation_id = data.get("conversation_id")
 
-        last_user_message_content = None
-        chat_history_for_agent = []
-
-        if conversation_id:
-            stored_messages = await storage.get_messages(conversation_id)
-            if stored_messages:
-                for msg_data in stored_messages:
-                    role = msg_data.get("role")
-                    content = msg_data.get("content")
-                    if role == "user":
+        # The history is loaded and the reply stored under the conversation's turn lock.
+        async with _turn(conversation_id):
+            last_user_message_content = None
+            chat_history_for_agent = []
+            if conversation_id:
+                chat_history_for_agent = await current_app.graph_history.load(storage, conversation_id)
+
+            for i, msg_data in enumerate(request_messages):
+                role = msg_data.get("role")
+                content = msg_data.get("content")
+                if role == "user":
+                    if i == len(request_messages) - 1:
+                        last_user_message_content = content
+                    else:
                         chat_history_for_agent.append(HumanMessage(content=content))
-                    elif role == "assistant":
-                        chat_history_for_agent.append(AIMessage(content=content))
-
-        for i, msg_data in enumerate(request_messages):
-            role = msg_data.get("role")
-            content = msg_data.get("content")
-            if role == "user":
-                if i == len(request_messages) - 1:
-                    last_user_message_content = content
-                else:
-                    chat_history_for_agent.append(HumanMessage(content=content))
-            elif role == "assistant":
-                chat_history_for_agent.append(AIMessage(content=content))
+                elif role == "assistant":
+                    chat_history_for_agent.append(AIMessage(content=content))
 
-        if not last_user_message_content:
-            return jsonify({"error": "No user input message found in the request."}), 400
+            if not last_user_message_content:
+                return jsonify({"error": "No user input message found in the request."}), 400
 
-        logger.info(f"Invoking agent (non-stream) for conv '{conversation_id}' with input: '{last_user_message_content[:100]}...'")
+            logger.info(f"Invoking agent (non-stream) for conv '{conversation_id}' with input: '{last_user_message_content[:100]}...'")
         
-        response = await agent_executor.ainvoke(
-            {"input": last_user_message_content, "chat_history": chat_history_for_agent}
-        )
+            response = await agent_executor.ainvoke(
+                {"input": last_user_message_content, "chat_history": chat_history_for_agent}
+            )
 
-        assistant_response_content = response.get("output", "")
+            assistant_response_content = response.get("output", "")
 
-        if conversation_id:
-            await storage.add_message(conversation_id, "user", last_user_message_content)
-            await storage.add_message(conversation_id, "assistant", assistant_response_content)
+            if conversation_id:
+                await storage.add_messages(conversation_id, [
+                    ("user", last_user_message_content),
+                    ("assistant", assistant_response_content),
+                ])
 
-        return jsonify({"response": assistant_response_content, "conversation_id": conversation_id})
+            return jsonify({"response": assistant_response_content, "conversation_id": conversation_id})
+
+    except ConversationBusyError as e:
+        return jsonify({"error": str(e), "conversation_id": conversation_id}), 409
 
     except Exception as e:
         logger.error(f"Error in /chat POST: {e}", exc_info=True)
@@ -79,6 +87,7 @@ async def handle_chat_stream_post():
     Accessible at /api/chat-stream
     """
     agent_executor = getattr(current_app, 'agent_executor', None)
+    storage = _get_storage()
     if not agent_executor:
         logger.error("Agent Executor not configured for /chat-stream POST.")
         return Response(
@@ -100,42 +109,47 @@ async def handle_chat_stream_post():
         conversation_id = data.get("conversation_id")
 
         last_user_message_content = None
-        chat_history_for_agent = []
-        if conversation_id:
-            stored_messages = await storage.get_messages(conversation_id)
-            if stored_messages:
-                for msg_data in stored_messages:
-                    role, content = msg_data.get("role"), msg_data.get("content")
-                    if role == "user": chat_history_for_agent.append(HumanMessage(content=content))
-                    elif role == "assistant": chat_history_for_agent.append(AIMessage(content=content))
-        
+        request_history = []
         for i, msg_data in enumerate(request_messages):
             role, content = msg_data.get("role"), msg_data.get("content")
             if role == "user":
                 if i == len(request_messages) - 1: last_user_message_content = content
-                else: chat_history_for_agent.append(HumanMessage(content=content))
-            elif role == "assistant": chat_history_for_agent.append(AIMessage(content=content))
+                else: request_history.append(HumanMessage(content=content))
+            elif role == "assistant": request_history.append(AIMessage(content=content))
 
         if not last_user_message_content:
             return Response(json.dumps({"error": "No user input message found."}), status=400, mimetype="application/x-ndjson")
 
         logger.info(f"Invoking agent (NDJSON stream) for conv '{conversation_id}' with input: '{last_user_message_content[:100]}...'")
 
+        # Rejected here, while the status code can still be sent; the lock itself is held by the stream.
+        if conversation_id:
+            current_app.turn_locks.check(conversation_id)
+        graph_history = current_app.graph_history
+        turn = _turn(conversation_id)
+
         async def ndjson_generator():
             full_response = ""
             try:
-                async for chunk_dict in agent_executor.astream(
-                    {"input": last_user_message_content, "chat_history": chat_history_for_agent}
-                ):
-                    if "output" in chunk_dict and isinstance(chunk_dict["output"], str):
-                        content_piece = chunk_dict["output"]
-                        if content_piece:  # Ensure content_piece is not empty
-                            full_response += content_piece
-                            yield json.dumps({"chunk": content_piece}, ensure_ascii=False) + "\n"
-                
-                if conversation_id:
-                    await storage.add_message(conversation_id, "user", last_user_message_content)
-                    await storage.add_message(conversation_id, "assistant", full_response)
+                async with turn:
+                    chat_history_for_agent = []
+                    if conversation_id:
+                        chat_history_for_agent = await graph_history.load(storage, conversation_id)
+                    chat_history_for_agent += request_history
+                    async for chunk_dict in agent_executor.astream(
+                        {"input": last_user_message_content, "chat_history": chat_history_for_agent}
+                    ):
+                        if "output" in chunk_dict and isinstance(chunk_dict["output"], str):
+                            content_piece = chunk_dict["output"]
+                            if content_piece:  # Ensure content_piece is not empty
+                                full_response += content_piece
+                                yield json.dumps({"chunk": content_piece}, ensure_ascii=False) + "\n"
+
+                    if conversation_id:
+                        await storage.add_messages(conversation_id, [
+                            ("user", last_user_message_content),
+                            ("assistant", full_response),
+                        ])
                 logger.info(f"NDJSON stream complete for conv '{conversation_id}'.")
             except Exception as e:
                 logger.error(f"Error during NDJSON stream generation for conv '{conversation_id}': {e}", exc_info=True)
@@ -143,6 +157,9 @@ async def handle_chat_stream_post():
         
         return Response(stream_with_context(ndjson_generator()), mimetype="application/x-ndjson")
 
+    except ConversationBusyError as e:
+        return Response(json.dumps({"error": str(e)}), status=409, mimetype="application/x-ndjson")
+
     except Exception as e:
         logger.error(f"Error in /chat-stream POST: {e}", exc_info=True)
         return Response(json.dumps({"error": str(e)}), status=500, mimetype="application/x-ndjson")
@@ -155,6 +172,7 @@ async def handle_chat_sse_post():
     Accessible at /api/chat-sse
     """
     agent_executor = getattr(current_app, 'agent_executor', None)
+    storage = _get_storage()
     if not agent_executor:
         logger.error("Agent Executor not configured for /chat-sse POST.")
         return Response("data: {\"error\": \"Server agent not available.\"}\n\n", 
@@ -172,43 +190,48 @@ async def handle_chat_sse_post():
         conversation_id = data.get("conversation_id")
 
         last_user_message_content = None
-        chat_history_for_agent = []
-        if conversation_id:
-            stored_messages = await storage.get_messages(conversation_id)
-            if stored_messages:
-                for msg_data in stored_messages:
-                    role, content = msg_data.get("role"), msg_data.get("content")
-                    if role == "user": chat_history_for_agent.append(HumanMessage(content=content))
-                    elif role == "assistant": chat_history_for_agent.append(AIMessage(content=content))
-        
+        request_history = []
         for i, msg_data in enumerate(request_messages):
             role, content = msg_data.get("role"), msg_data.get("content")
             if role == "user":
                 if i == len(request_messages) - 1: last_user_message_content = content
-                else: chat_history_for_agent.append(HumanMessage(content=content))
-            elif role == "assistant": chat_history_for_agent.append(AIMessage(content=content))
+                else: request_history.append(HumanMessage(content=content))
+            elif role == "assistant": request_history.append(AIMessage(content=content))
 
         if not last_user_message_content:
             return Response("data: {\"error\": \"No user input message found.\"}\n\n", status=400, content_type="text/event-stream")
 
         logger.info(f"Invoking agent (SSE stream) for conv '{conversation_id}' with input: '{last_user_message_content[:100]}...'")
 
+        # Rejected here, while the status code can still be sent; the lock itself is held by the stream.
+        if conversation_id:
+            current_app.turn_locks.check(conversation_id)
+        graph_history = current_app.graph_history
+        turn = _turn(conversation_id)
+
         @stream_with_context
         async def sse_api_generator():
             full_response = ""
             try:
-                async for chunk_dict in agent_executor.astream(
-                    {"input": last_user_message_content, "chat_history": chat_history_for_agent}
-                ):
-                    if "output" in chunk_dict and isinstance(chunk_dict["output"], str):
-                        content_piece = chunk_dict["output"]
-                        if content_piece:  # Ensure content_piece is not empty
-                            full_response += content_piece
-                            yield f"data: {json.dumps({'chunk': content_piece}, ensure_ascii=False)}\n\n"
-                
-                if conversation_id:
-                    await storage.add_message(conversation_id, "user", last_user_message_content)
-                    await storage.add_message(conversation_id, "assistant", full_response)
+                async with turn:
+                    chat_history_for_agent = []
+                    if conversation_id:
+                        chat_history_for_agent = await graph_history.load(storage, conversation_id)
+                    chat_history_for_agent += request_history
+                    async for chunk_dict in agent_executor.astream(
+                        {"input": last_user_message_content, "chat_history": chat_history_for_agent}
+                    ):
+                        if "output" in chunk_dict and isinstance(chunk_dict["output"], str):
+                            content_piece = chunk_dict["output"]
+                            if content_piece:  # Ensure content_piece is not empty
+                                full_response += content_piece
+                                yield f"data: {json.dumps({'chunk': content_piece}, ensure_ascii=False)}\n\n"
+
+                    if conversation_id:
+                        await storage.add_messages(conversation_id, [
+                            ("user", last_user_message_content),
+                            ("assistant", full_response),
+                        ])
                 logger.info(f"SSE stream complete for conv '{conversation_id}'.")
             except Exception as e:
                 logger.error(f"Error during SSE stream generation for conv '{conversation_id}': {e}", exc_info=True)
@@ -216,6 +239,9 @@ async def handle_chat_sse_post():
         
         return Response(sse_api_generator(), content_type='text/event-stream')
 
+    except ConversationBusyError as e:
+        return Response(f"data: {json.dumps({'error': str(e)})}\n\n", status=409, content_type="text/event-stream")
+
     except Exception as e:
         logger.error(f"Error in /chat-sse POST: {e}", exc_info=True)
         return Response(f"data: {json.dumps({'error': str(e)})}\n\n", status=500, content_type="text/event-stream")
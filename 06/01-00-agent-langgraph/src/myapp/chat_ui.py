@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import uuid  # For generating conversation IDs if needed
@@ -12,7 +13,8 @@ from quart import (
 )
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage, ToolMessage
 from .storage import ConversationStorage  # Assuming storage is accessible
-from .agent_builder import _convert_stored_messages_to_graph_history  # Helper for history
+from .history import GraphHistoryCache  # Incrementally converted chat history
+from .turn_locks import ConversationBusyError, TurnLocks  # Per-conversation turn serialization
 
 # Define the Blueprint for the chat UI and API
 chat_ui_bp = Blueprint(
@@ -43,29 +45,103 @@ async def create_conversation():
         logger.error(f"Error creating conversation: {e}")
         return jsonify({"error": "Failed to create conversation"}), 500
 
+# Largest page a client can ask for with ?limit=
+MAX_PAGE_SIZE = 1000
+
 @chat_ui_bp.get("/conversations/<conversation_id>")
 async def get_conversation(conversation_id: str):
-    """Get a conversation by ID."""
+    """Get a conversation by ID, optionally one page of its messages at a time.
+
+    Query parameters:
+      order  - "oldest" (default) or "newest" first
+      limit  - page size; without it every message from the cursor on is returned
+      cursor - the `next_cursor` of the previous page
+
+    The response carries the conversation's version as a strong ETag; a
+    request whose If-None-Match matches it gets 304 without any message
+    being read.
+    """
     try:
         storage: ConversationStorage = getattr(current_app, 'conversation_storage', None)
         if not storage:
             logger.error("Conversation storage not found in current_app.")
             return jsonify({"error": "Conversation storage not available"}), 500
-        conversation = await storage.get_conversation(conversation_id)
-        if not conversation:
+
+        order = request.args.get("order", "oldest")
+        limit = request.args.get("limit", type=int)
+        cursor = request.args.get("cursor", type=int)
+        if order not in ("oldest", "newest"):
+            return jsonify({"error": "order must be 'oldest' or 'newest'"}), 400
+        if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+        if cursor is not None and cursor < 0:
+            return jsonify({"error": "cursor must not be negative"}), 400
+
+        info = await storage.get_conversation_info(conversation_id)
+        if not info:
             return jsonify({"error": "Conversation not found"}), 404
-        
-        messages = await storage.get_messages(conversation_id)
-        return jsonify({
-            "id": conversation.id,
-            "created_at": conversation.created_at.isoformat(),
-            "updated_at": conversation.updated_at.isoformat(),
-            "messages": messages
+        etag = str(info.version)
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        # Pages are cut from the first `version` messages, so the body always matches the ETag.
+        total = info.message_count
+        if order == "oldest":
+            start = min(cursor or 0, total)
+            end = total if limit is None else min(start + limit, total)
+            next_cursor = end if end < total else None
+        else:
+            end = total if cursor is None else min(cursor, total)
+            start = 0 if limit is None else max(end - limit, 0)
+            next_cursor = start if start > 0 else None
+        messages, _ = await storage.get_messages_range(conversation_id, start, end)
+        if order == "newest":
+            messages.reverse()
+
+        response = jsonify({
+            "id": info.id,
+            "created_at": info.created_at.isoformat(),
+            "updated_at": info.updated_at.isoformat(),
+            "version": info.version,
+            "message_count": total,
+            "messages": messages,
+            "next_cursor": next_cursor,
         })
+        response.set_etag(etag)
+        # Let browsers keep the body but always revalidate it.
+        response.headers["Cache-Control"] = "no-cache"
+        return response
     except Exception as e:
         logger.error(f"Error getting conversation: {e}")
         return jsonify({"error": "Failed to get conversation"}), 500
 
+@chat_ui_bp.post("/conversations/<conversation_id>/fork")
+async def fork_conversation(conversation_id: str):
+    """Branch a conversation: a new conversation with its first `at_index` messages, e.g. to edit and resend one."""
+    try:
+        storage: ConversationStorage = getattr(current_app, 'conversation_storage', None)
+        if not storage:
+            logger.error("Conversation storage not found in current_app.")
+            return jsonify({"error": "Conversation storage not available"}), 500
+
+        data = await request.get_json(silent=True) or {}
+        at_index = data.get("at_index")
+        if not isinstance(at_index, int) or isinstance(at_index, bool):
+            return jsonify({"error": "at_index must be an integer"}), 400
+        info = await storage.get_conversation_info(conversation_id)
+        if not info:
+            return jsonify({"error": "Conversation not found"}), 404
+        if not 0 <= at_index <= info.message_count:
+            return jsonify({"error": f"at_index must be between 0 and {info.message_count}"}), 400
+
+        fork_id = await storage.fork_conversation(conversation_id, at_index)
+        return jsonify({"conversation_id": fork_id})
+    except Exception as e:
+        logger.error(f"Error forking conversation: {e}")
+        return jsonify({"error": "Failed to fork conversation"}), 500
+
 @chat_ui_bp.route("/chat/stream", methods=["POST"])
 async def handle_chat_post():
     """Handles chat messages, streams responses using LangGraph."""
@@ -111,9 +187,19 @@ async def handle_chat_post():
     else:
         logger.info(f"Continuing conversation with ID: {conversation_id}")
 
+    # One turn per conversation at a time; the policy decides what a concurrent turn does.
+    turn_locks: TurnLocks = current_app.turn_locks
+    try:
+        async with turn_locks.turn(conversation_id):
+            return await _chat_turn(storage, compiled_graph, conversation_id, user_message_content)
+    except ConversationBusyError as e:
+        return Response(json.dumps({"error": str(e), "conversation_id": conversation_id}), status=409, content_type="application/json")
+
+async def _chat_turn(storage: ConversationStorage, compiled_graph, conversation_id: str, user_message_content: str) -> Response:
+    """Runs one chat turn: loads the history, runs the graph and stores both messages in one write."""
     # Retrieve and convert chat history for the graph
-    stored_messages_dict = await storage.get_messages(conversation_id)  # Returns List[Dict]
-    chat_history_for_graph = _convert_stored_messages_to_graph_history(stored_messages_dict)
+    graph_history: GraphHistoryCache = current_app.graph_history
+    chat_history_for_graph = await graph_history.load(storage, conversation_id)  # Only new messages are converted
 
     # Patch: LangGraph tool routing expects a 'messages' key in the state
     graph_input = {
@@ -125,9 +211,6 @@ async def handle_chat_post():
 
     full_assistant_response_content = ""
     try:
-        # Add current user message to storage before streaming, so history is up-to-date
-        await storage.add_message(conversation_id, "user", user_message_content)
-        
         logger.info(f"Streaming request to LangGraph for conversation '{conversation_id}'. Input: '{user_message_content[:50]}...'")
         
         # Run the compiled graph and collect the response
@@ -140,9 +223,14 @@ async def handle_chat_post():
                         chunk_content = agent_outcome.content
                         if isinstance(chunk_content, str):
                             full_assistant_response_content += chunk_content
-        # After the graph finishes (all tools run, final agent response), save the full assistant response.
+        # After the graph finishes (all tools run, final agent response), store the whole turn in one write,
+        # so a failed or cancelled turn leaves no user message without its reply. Shielded: once started,
+        # the write completes even if a newer turn cancels this one.
+        turn = [("user", user_message_content)]
+        if full_assistant_response_content:
+            turn.append(("assistant", full_assistant_response_content))
+        await asyncio.shield(storage.add_messages(conversation_id, turn))
         if full_assistant_response_content:
-            await storage.add_message(conversation_id, "assistant", full_assistant_response_content)
             logger.info(f"Saved assistant response to conversation {conversation_id}: '{full_assistant_response_content[:100]}...'")
         # Return the response as JSON
         return Response(json.dumps({
@@ -179,8 +267,8 @@ async def handle_chat_get_stream():
         return Response("data: {\"error\": \"Invalid request: 'conversation_id' is required\"}\n\n", status=400, content_type="text/event-stream")
 
     # Retrieve and convert chat history for the graph
-    stored_messages_dict = await storage.get_messages(conversation_id)  # Returns List[Dict]
-    chat_history_for_graph = _convert_stored_messages_to_graph_history(stored_messages_dict)
+    graph_history: GraphHistoryCache = current_app.graph_history
+    chat_history_for_graph = await graph_history.load(storage, conversation_id)  # Only new messages are converted
 
     @stream_with_context
     async def sse_generator():
@@ -15,3 +15,9 @@ For any question that appears to be about movies, actors, plots, directors, or r
 
 # The old SYSTEM_PROMPT and SYSTEM_PROMPT_TEMPLATE for direct RAG are no longer primary.
 # You might keep them for reference or remove if fully transitioning to agent.
+
+# System prompt for compacting older conversation turns into a rolling summary
+SUMMARY_SYSTEM_PROMPT = """You maintain a running summary of a conversation between a user and a movie assistant.
+Combine the existing summary (if any) with the new messages into one concise summary.
+Keep facts the user stated, questions asked, answers given and any open follow-ups. Do not add new information.
+"""
@@ -0,0 +1,366 @@
+import re
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Words are runs of letters, digits and underscores, compared case-insensitively.
+_WORD_RE = re.compile(r"\w+")
+# A query is a mix of bare terms and "quoted phrases".
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+# Postings pack (message index, token position) into one int64; positions past this are not indexed.
+_POSITION_BITS = 20
+_MAX_POSITION = (1 << _POSITION_BITS) - 1
+# Above this many conversations for the rarest query token, search walks the listing instead.
+_WALK_THRESHOLD = 1000
+# Estimated memory: a conversation's entry, listing tuples and dict slots; a posting array; one posting.
+_ENTRY_BYTES = 320
+_POSTINGS_OVERHEAD_BYTES = 128
+_POSTING_BYTES = 8
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def parse_query(query: str) -> List[List[str]]:
+    """Split a search query into clauses: one token for a term, several for a "phrase"."""
+    clauses = []
+    for phrase, term in _QUERY_RE.findall(query):
+        tokens = tokenize(phrase or term)
+        if tokens:
+            clauses.append(tokens)
+    return clauses
+
+
+def _discard(order: List[Tuple[int, str]], key: Tuple[int, str]) -> None:
+    i = bisect_left(order, key)
+    if i < len(order) and order[i] == key:
+        del order[i]
+
+
+class _Entry:
+    __slots__ = ("created_ns", "updated_ns", "message_count", "parent", "base", "searchable", "bytes")
+
+    def __init__(self, created_ns: int, updated_ns: int, message_count: int):
+        self.created_ns = created_ns
+        self.updated_ns = updated_ns
+        self.message_count = message_count
+        # A fork finds its first `base` messages in the postings of `parent`.
+        self.parent: Optional[str] = None
+        self.base = 0
+        # False while the conversation is listed without postings (see drop_postings).
+        self.searchable = True
+        self.bytes = _ENTRY_BYTES
+
+
+class ConversationIndex:
+    """In-memory listing and full-text index over conversations.
+
+    Listing: `_order` is a list of `(updated_ns, conversation_id)` kept sorted
+    as conversations are touched, so a page is a bisect plus a slice and no
+    conversation is ever scanned. Moving a conversation to the end costs one
+    bisect and a memmove of the list. `_created` is the same by creation
+    time, which never changes, for `list_by_creation`.
+
+    Search: an inverted index maps each token to the conversations containing
+    it and the packed (message, position) of every occurrence, which answers
+    both terms (all must occur in the conversation) and phrases (consecutive
+    tokens within one message). Results are ordered by most recent update:
+    rare tokens are intersected and sorted, while queries made only of common
+    tokens walk the listing newest first and stop once the page is full.
+
+    Forks (`add_fork`) don't re-index the prefix they share: lookups follow
+    the fork to its parent's postings for the first `base` messages. A
+    removed conversation that forks still share is kept, hidden, under an
+    internal key until its last fork is removed.
+
+    `bytes` estimates the index's memory. `drop_postings` frees a
+    conversation's postings but keeps it listed (for conversations moved out
+    of memory), and `restore_postings` makes it searchable again.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self._order: List[Tuple[int, str]] = []
+        self._created: List[Tuple[int, str]] = []
+        self._postings: Dict[str, Dict[str, array]] = {}
+        # Tokens per conversation, so removal doesn't have to walk the whole index.
+        self._terms: Dict[str, set] = {}
+        # Forks sharing each conversation's postings, and removed conversations kept for their forks.
+        self._forks: Dict[str, set] = {}
+        self._retired: Dict[str, _Entry] = {}
+        self._retired_count = 0
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._entries
+
+    def get(self, conversation_id: str) -> Optional[Tuple[int, int, int]]:
+        """Return (created_ns, updated_ns, message_count) for an indexed conversation."""
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        return entry.created_ns, entry.updated_ns, entry.message_count
+
+    def add_conversation(self, conversation_id: str, created_ns: int, updated_ns: int) -> None:
+        self._entries[conversation_id] = entry = _Entry(created_ns, updated_ns, 0)
+        insort(self._order, (updated_ns, conversation_id))
+        insort(self._created, (created_ns, conversation_id))
+        self._terms[conversation_id] = set()
+        self.bytes += entry.bytes
+
+    def add_listed(self, conversation_id: str, created_ns: int, updated_ns: int, message_count: int) -> None:
+        """List a conversation whose messages aren't in memory; it becomes searchable with `restore_postings`."""
+        self.add_conversation(conversation_id, created_ns, updated_ns)
+        entry = self._entries[conversation_id]
+        entry.message_count = message_count
+        entry.searchable = False
+
+    def add_fork(self, conversation_id: str, parent_id: str, at_index: int, created_ns: int) -> None:
+        """Index a fork of `parent_id`'s first `at_index` messages, sharing the parent's postings for them."""
+        parent = self._entries[parent_id]
+        # The prefix lies entirely in the parent's own parent: share that directly and keep the chain short.
+        while parent.parent is not None and at_index <= parent.base:
+            parent_id, parent = parent.parent, self._entry(parent.parent)
+        self.add_conversation(conversation_id, created_ns, created_ns)
+        entry = self._entries[conversation_id]
+        entry.message_count = at_index
+        if at_index:
+            entry.parent, entry.base = parent_id, at_index
+            self._forks.setdefault(parent_id, set()).add(conversation_id)
+
+    def _entry(self, conversation_id: str) -> _Entry:
+        entry = self._entries.get(conversation_id)
+        return entry if entry is not None else self._retired[conversation_id]
+
+    def add_messages(self, conversation_id: str, contents: Sequence[str], updated_ns: int) -> None:
+        """Index messages appended to a conversation and move it to `updated_ns` in the listing."""
+        entry = self._entries[conversation_id]
+        self._add_postings(conversation_id, entry, contents, entry.message_count)
+        entry.message_count += len(contents)
+        self._move(conversation_id, entry, updated_ns)
+
+    def _add_postings(self, conversation_id: str, entry: _Entry, contents: Sequence[str], first: int) -> None:
+        """Index `contents` as the messages from index `first` on."""
+        terms = self._terms[conversation_id]
+        added = 0
+        for offset, content in enumerate(contents):
+            base = (first + offset) << _POSITION_BITS
+            for position, token in enumerate(tokenize(content)):
+                if position > _MAX_POSITION:
+                    break
+                by_conversation = self._postings.get(token)
+                if by_conversation is None:
+                    by_conversation = self._postings[token] = {}
+                positions = by_conversation.get(conversation_id)
+                if positions is None:
+                    positions = by_conversation[conversation_id] = array("q")
+                    terms.add(token)
+                    added += _POSTINGS_OVERHEAD_BYTES
+                positions.append(base | position)
+                added += _POSTING_BYTES
+        entry.bytes += added
+        self.bytes += added
+
+    def drop_postings(self, conversation_id: str) -> None:
+        """Free a conversation's postings, keeping it listed; it no longer matches searches.
+
+        Postings that forks share are kept.
+        """
+        entry = self._entries.get(conversation_id)
+        if entry is None or not entry.searchable or self._forks.get(conversation_id):
+            return
+        self._remove_postings(conversation_id, entry)
+        self._terms[conversation_id] = set()
+        entry.searchable = False
+
+    def restore_postings(self, conversation_id: str, contents: Sequence[str]) -> None:
+        """Re-index the messages of a conversation whose postings were dropped.
+
+        `contents` are all of its messages; a fork's shared prefix is skipped,
+        since it is still found through the parent.
+        """
+        entry = self._entries.get(conversation_id)
+        if entry is None or entry.searchable:
+            return
+        self._add_postings(conversation_id, entry, contents[entry.base:], entry.base)
+        entry.searchable = True
+
+    def _move(self, conversation_id: str, entry: _Entry, updated_ns: int) -> None:
+        _discard(self._order, (entry.updated_ns, conversation_id))
+        entry.updated_ns = updated_ns
+        insort(self._order, (updated_ns, conversation_id))
+
+    def remove(self, conversation_id: str) -> None:
+        entry = self._entries.pop(conversation_id, None)
+        if entry is None:
+            return
+        _discard(self._order, (entry.updated_ns, conversation_id))
+        _discard(self._created, (entry.created_ns, conversation_id))
+        if self._forks.get(conversation_id):
+            self._retire(conversation_id, entry)
+        else:
+            self._drop(conversation_id, entry)
+
+    def _rename(self, old_id: str, new_id: str, entry: _Entry) -> None:
+        for token in self._terms.get(old_id, ()):
+            by_conversation = self._postings[token]
+            by_conversation[new_id] = by_conversation.pop(old_id)
+        if old_id in self._terms:
+            self._terms[new_id] = self._terms.pop(old_id)
+        forks = self._forks.pop(old_id, set())
+        if forks:
+            self._forks[new_id] = forks
+        for fork_id in forks:
+            self._entry(fork_id).parent = new_id
+        if entry.parent is not None:
+            siblings = self._forks[entry.parent]
+            siblings.discard(old_id)
+            siblings.add(new_id)
+
+    def _retire(self, conversation_id: str, entry: _Entry) -> None:
+        """Keep a removed conversation's postings for its forks, under a key no conversation ID can take."""
+        self._retired_count += 1
+        retired_id = f"\0retired-{self._retired_count}"
+        self._rename(conversation_id, retired_id, entry)
+        self._retired[retired_id] = entry
+
+    def _remove_postings(self, conversation_id: str, entry: _Entry) -> None:
+        for token in self._terms.pop(conversation_id, ()):
+            by_conversation = self._postings[token]
+            del by_conversation[conversation_id]
+            if not by_conversation:
+                del self._postings[token]
+        self.bytes -= entry.bytes - _ENTRY_BYTES
+        entry.bytes = _ENTRY_BYTES
+
+    def _drop(self, conversation_id: str, entry: _Entry) -> None:
+        self._remove_postings(conversation_id, entry)
+        self.bytes -= entry.bytes
+        if entry.parent is not None:
+            siblings = self._forks[entry.parent]
+            siblings.discard(conversation_id)
+            if not siblings:
+                # The last fork sharing a removed conversation's postings is gone, so they can go too.
+                del self._forks[entry.parent]
+                parent = self._retired.pop(entry.parent, None)
+                if parent is not None:
+                    self._drop(entry.parent, parent)
+
+    def list(self, limit: int, cursor: Optional[Tuple[int, str]] = None) -> Tuple[List[str], Optional[Tuple[int, str]]]:
+        """Conversation IDs by most recent update first, starting below `cursor`, and the next cursor."""
+        end = len(self._order) if cursor is None else bisect_left(self._order, cursor)
+        start = max(end - limit, 0)
+        page = self._order[start:end]
+        page.reverse()
+        next_cursor = page[-1] if start > 0 and page else None
+        return [conversation_id for _, conversation_id in page], next_cursor
+
+    def list_by_creation(
+        self, limit: int, cursor: Optional[Tuple[int, str]] = None
+    ) -> Tuple[List[str], Optional[Tuple[int, str]]]:
+        """Conversation IDs oldest first, starting after `cursor`, and the next cursor."""
+        start = 0 if cursor is None else bisect_right(self._created, cursor)
+        page = self._created[start:start + limit]
+        next_cursor = page[-1] if start + limit < len(self._created) and page else None
+        return [conversation_id for _, conversation_id in page], next_cursor
+
+    def search(self, query: str, limit: int, offset: int = 0) -> Tuple[List[str], Optional[int]]:
+        """IDs of conversations matching every term and phrase in `query`, most recent first."""
+        clauses = parse_query(query)
+        if not clauses:
+            return [], None
+        postings = []
+        for tokens in clauses:
+            for token in tokens:
+                by_conversation = self._postings.get(token)
+                if not by_conversation:
+                    return [], None
+                postings.append((token, by_conversation))
+        postings.sort(key=lambda posting: len(posting[1]))
+        phrases = [tokens for tokens in clauses if len(tokens) > 1]
+        wanted = offset + limit + 1  # One extra match tells whether there is a next page.
+
+        if len(postings[0][1]) > _WALK_THRESHOLD:
+            # Every token is common: walk the listing newest first and stop once the page is full,
+            # instead of intersecting and sorting huge posting sets.
+            matches = []
+            for _, conversation_id in reversed(self._order):
+                if all(self._contains(token, conversation_id) for token, _ in postings) and all(
+                    self._has_phrase(conversation_id, tokens) for tokens in phrases
+                ):
+                    matches.append(conversation_id)
+                    if len(matches) == wanted:
+                        break
+        else:
+            # Start from the rarest token's conversations (and the forks sharing them), then order the (few) matches.
+            candidates = self._with_forks(*postings[0])
+            for token, by_conversation in postings[1:]:
+                candidates = {
+                    conversation_id for conversation_id in candidates
+                    if conversation_id in by_conversation or self._contains(token, conversation_id)
+                }
+                if not candidates:
+                    return [], None
+            matches = [
+                conversation_id for conversation_id in candidates
+                # Removed conversations kept for their forks never match themselves.
+                if conversation_id in self._entries
+                and all(self._has_phrase(conversation_id, tokens) for tokens in phrases)
+            ]
+            matches.sort(key=lambda conversation_id: (self._entries[conversation_id].updated_ns, conversation_id), reverse=True)
+        page = matches[offset:offset + limit]
+        next_offset = offset + limit if len(matches) > offset + limit else None
+        return page, next_offset
+
+    def _with_forks(self, token: str, by_conversation: Dict[str, array]) -> set:
+        """Conversations containing `token`: those with postings for it, and forks sharing such a prefix."""
+        found = set(by_conversation)
+        if not self._forks:
+            return found
+        pending = [conversation_id for conversation_id in found if conversation_id in self._forks]
+        while pending:
+            for fork_id in self._forks.get(pending.pop(), ()):
+                if fork_id not in found and self._contains(token, fork_id):
+                    found.add(fork_id)
+                    pending.append(fork_id)
+        return found
+
+    def _positions(self, token: str, conversation_id: str) -> List[int]:
+        """Packed positions of `token` in a conversation, including those in the prefix a fork shares."""
+        by_conversation = self._postings.get(token, {})
+        found: List[int] = []
+        end = None  # Only messages below this index are shared with the fork we came from.
+        while conversation_id is not None:
+            positions = by_conversation.get(conversation_id)
+            if positions:
+                found.extend(positions if end is None else positions[:bisect_left(positions, end << _POSITION_BITS)])
+            entry = self._entry(conversation_id)
+            end = entry.base if end is None else min(end, entry.base)
+            conversation_id = entry.parent
+        return found
+
+    def _contains(self, token: str, conversation_id: str) -> bool:
+        by_conversation = self._postings.get(token, {})
+        end = None
+        while conversation_id is not None:
+            positions = by_conversation.get(conversation_id)
+            # Positions are in ascending order, so the first tells whether any lies in the shared prefix.
+            if positions and (end is None or positions[0] < end << _POSITION_BITS):
+                return True
+            entry = self._entry(conversation_id)
+            end = entry.base if end is None else min(end, entry.base)
+            conversation_id = entry.parent
+        return False
+
+    def _has_phrase(self, conversation_id: str, tokens: List[str]) -> bool:
+        starts = set(self._positions(tokens[0], conversation_id))
+        for k, token in enumerate(tokens[1:], 1):
+            following = self._positions(token, conversation_id)
+            starts.intersection_update(p - k for p in following)
+            if not starts:
+                return False
+        return True
@@ -0,0 +1,147 @@
+import logging
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+from .agent_builder import _convert_stored_messages_to_graph_history
+from .storage import ConversationStorage
+from .summarizer import ConversationSummary, RollingSummarizer
+from .tokens import MESSAGE_OVERHEAD_TOKENS, message_tokens
+
+logger = logging.getLogger(__name__)
+
+# The stored roles _convert_stored_messages_to_graph_history turns into messages; others are skipped.
+_GRAPH_ROLES = ("user", "system", "assistant")
+
+
+class _HistoryEntry:
+    __slots__ = ("cursor", "messages", "tokens", "pinned", "pinned_tokens")
+
+    def __init__(self):
+        self.cursor = 0
+        self.messages: List[BaseMessage] = []
+        # Token count per message, as stored with it (or counted once when it enters the entry).
+        self.tokens = array("I")
+        # Indexes of messages that are always kept in the window (system/context messages).
+        self.pinned: List[int] = []
+        self.pinned_tokens = 0
+
+
+class GraphHistoryCache:
+    """Per-worker cache of conversation histories already converted to LangChain messages.
+
+    Each entry holds the storage cursor it was built from, so a turn only
+    fetches and converts the messages appended since the previous turn
+    (including ones written by other workers to a shared backend). The cache
+    is an LRU bounded to `max_conversations` entries.
+
+    With a `token_budget`, `load` returns a window instead of the whole
+    history: every pinned (system) message plus the newest messages that fit
+    in what is left of the budget. Token counts come from the storage, which
+    records them when each message is added, so no worker ever tokenizes the
+    history; building the window only walks the messages it returns. A custom
+    `token_counter` counts each message once as it enters the cache instead.
+
+    With a `summarizer`, long conversations are compacted in the background
+    and `load` returns the pinned messages, the stored summary and the
+    recent tail after it (still windowed by the token budget).
+    """
+
+    def __init__(
+        self,
+        max_conversations: int = 1024,
+        token_budget: Optional[int] = None,
+        token_counter: Optional[Callable[[str], int]] = None,
+        summarizer: Optional[RollingSummarizer] = None,
+    ):
+        self._max_conversations = max_conversations
+        self._token_budget = token_budget
+        self._token_counter = token_counter
+        self.summarizer = summarizer
+        self._entries: "OrderedDict[str, _HistoryEntry]" = OrderedDict()
+
+    def _count(self, content) -> int:
+        content = content if isinstance(content, str) else str(content)
+        if self._token_counter is None:
+            return message_tokens(content)
+        return self._token_counter(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def _extend(self, entry: _HistoryEntry, stored: List[Dict]) -> None:
+        new_messages = _convert_stored_messages_to_graph_history(stored)
+        if self._token_counter is None:
+            counts = [m["tokens"] for m in stored if m.get("role") in _GRAPH_ROLES]
+        else:
+            counts = [self._count(message.content) for message in new_messages]
+        for message, tokens in zip(new_messages, counts):
+            if isinstance(message, SystemMessage):
+                entry.pinned.append(len(entry.messages))
+                entry.pinned_tokens += tokens
+            entry.messages.append(message)
+            entry.tokens.append(tokens)
+
+    def _window(self, entry: _HistoryEntry, summary: Optional[ConversationSummary]) -> List[BaseMessage]:
+        if self._token_budget is None and summary is None:
+            return list(entry.messages)
+        floor = 0
+        remaining = float("inf") if self._token_budget is None else self._token_budget - entry.pinned_tokens
+        if summary is not None:
+            if summary.tokens is None:
+                summary.tokens = self._count(summary.message.content)
+            floor = summary.upto
+            remaining -= summary.tokens
+        pinned = set(entry.pinned)
+        start = len(entry.messages)
+        # Walk back from the newest message until the budget runs out or the summarized range begins.
+        for i in range(len(entry.messages) - 1, floor - 1, -1):
+            if i in pinned:
+                continue
+            if entry.tokens[i] > remaining:
+                break
+            remaining -= entry.tokens[i]
+            start = i
+        # Pinned messages older than the window are prepended in their original order, around the summary.
+        window = [entry.messages[i] for i in entry.pinned if i < floor]
+        if summary is not None:
+            window.append(summary.message)
+        window.extend(entry.messages[i] for i in entry.pinned if floor <= i < start)
+        window.extend(entry.messages[start:])
+        return window
+
+    async def load(self, storage: ConversationStorage, conversation_id: str) -> List[BaseMessage]:
+        """Return the conversation's history (or its token-budgeted window) as LangChain messages.
+
+        The returned list is a fresh shallow copy, so callers may extend it;
+        the message objects themselves are shared and must not be mutated.
+        Raises ValueError if the conversation does not exist.
+        """
+        # Popped rather than read, so a missing conversation (ValueError below) leaves no stale entry.
+        entry = self._entries.pop(conversation_id, None) or _HistoryEntry()
+        rebuilt = entry.cursor == 0
+        with_tokens = self._token_counter is None
+        new_messages, new_cursor = await storage.get_messages_since(conversation_id, entry.cursor, with_tokens)
+        if new_cursor < entry.cursor:
+            # The backend lost messages we had seen (e.g. it was reset); rebuild from scratch.
+            logger.info(f"History cursor for conversation {conversation_id} went backwards; rebuilding.")
+            new_messages, new_cursor = await storage.get_messages_since(conversation_id, 0, with_tokens)
+            entry = _HistoryEntry()
+            rebuilt = True
+        self._extend(entry, new_messages)
+        entry.cursor = new_cursor
+
+        self._entries[conversation_id] = entry
+        if len(self._entries) > self._max_conversations:
+            self._entries.popitem(last=False)
+
+        if self.summarizer is None:
+            return self._window(entry, None)
+        # Freshly built from storage: make sure the summarized range is still what is stored.
+        summary = await self.summarizer.current(storage, conversation_id, entry.messages, entry.tokens, validate=rebuilt)
+        return self._window(entry, summary)
+
+    def stats(self) -> Dict[str, int]:
+        stats = {"conversations": len(self._entries)}
+        if self.summarizer is not None:
+            stats.update(self.summarizer.stats())
+        return stats
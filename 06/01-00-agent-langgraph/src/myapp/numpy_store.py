@@ -0,0 +1,217 @@
+"""Exact-search vector store over one contiguous float32 matrix, which can be memory-mapped from disk.
+
+Every embedding is L2-normalized on the way in, so scoring a batch of
+queries is one matrix product (in blocks of `SEARCH_BLOCK_ROWS` vectors,
+which bounds the temporary score matrix) and the top k are picked with
+`argpartition` rather than a full sort. For corpora up to a few hundred
+thousand chunks this is faster than an approximate index and exact.
+
+Saved with `save()`, the store is a directory holding `vectors.npy` and
+`documents.json` (texts, metadata and ids). `load()` maps the matrix
+read-only, so every process that loads the same directory shares one copy
+of the vectors in the page cache.
+
+Distances are squared L2 on unit vectors, as in a Chroma collection with
+the default "l2" space, so relevance scores and `score_threshold`s carry
+over unchanged from Chroma. `python benchmarks/vector_store.py` compares
+the two.
+"""
+import asyncio
+import json
+import os
+import shutil
+import uuid
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+VECTORS_FILE = "vectors.npy"
+DOCUMENTS_FILE = "documents.json"
+# Vectors scored per matrix product; 64k rows of 1536 dims is 384 MB of float32 per block.
+SEARCH_BLOCK_ROWS = 65536
+# Async searches over more vectors than this run in a thread instead of on the event loop.
+INLINE_SEARCH_ROWS = 50_000
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indexes of the k highest scores in each row, best first."""
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class NumpyVectorStore(VectorStore):
+    """`VectorStore` answering similarity queries with blocked matrix products over normalized vectors."""
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        vectors: Optional[np.ndarray] = None,
+        documents: Optional[List[Document]] = None,
+        ids: Optional[List[str]] = None,
+    ):
+        documents = documents or []
+        ids = ids or []
+        if vectors is None:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        if len(vectors) != len(documents) or len(documents) != len(ids):
+            raise ValueError(f"Got {len(vectors)} vectors for {len(documents)} documents and {len(ids)} ids")
+        self._embedding = embedding
+        # Rows past len(self) are spare capacity for add_texts; a mapped matrix has none.
+        self._buffer = vectors
+        self._documents = documents
+        self._ids = ids
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    @property
+    def _vectors(self) -> np.ndarray:
+        return self._buffer[:len(self._ids)]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        store = cls(embedding)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    @classmethod
+    def from_chroma(cls, vector_store) -> "NumpyVectorStore":
+        """A copy of a LangChain `Chroma` store's vectors and documents."""
+        data = vector_store._collection.get(include=["embeddings", "documents", "metadatas"])
+        documents = [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(data["documents"], data["metadatas"])
+        ]
+        return cls(vector_store.embeddings, _normalize(data["embeddings"]), documents, list(data["ids"]))
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = _normalize(self._embedding.embed_documents(texts))
+        count = len(self)
+        if count and vectors.shape[1] != self._buffer.shape[1]:
+            raise ValueError(f"Got {vectors.shape[1]}-dimensional vectors for a store of {self._buffer.shape[1]}")
+        if count + len(texts) > len(self._buffer) or not self._buffer.flags.writeable:
+            # Doubling keeps appends amortized O(1) and the matrix contiguous; a mapped matrix is copied once.
+            capacity = max(count + len(texts), 2 * count)
+            buffer = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            if count:
+                buffer[:count] = self._vectors
+            self._buffer = buffer
+        self._buffer[count:count + len(texts)] = vectors
+        self._documents.extend(Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas))
+        self._ids.extend(ids)
+        return ids
+
+    # --- Persistence -----------------------------------------------------------------
+
+    def save(self, path: str) -> None:
+        """Write the store to the directory `path`, which appears complete or not at all."""
+        tmp = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        with open(os.path.join(tmp, VECTORS_FILE), "wb") as f:
+            np.save(f, np.ascontiguousarray(self._vectors, dtype=np.float32))
+            f.flush()
+            os.fsync(f.fileno())
+        with open(os.path.join(tmp, DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+            json.dump(
+                [{"id": id_, "text": doc.page_content, "metadata": doc.metadata} for id_, doc in zip(self._ids, self._documents)],
+                f,
+                ensure_ascii=False,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings, mmap: bool = True) -> "NumpyVectorStore":
+        """Open a store written by `save()`; with `mmap` the vectors are mapped read-only, not copied."""
+        vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r" if mmap else None)
+        with open(os.path.join(path, DOCUMENTS_FILE), encoding="utf-8") as f:
+            entries = json.load(f)
+        documents = [Document(page_content=entry["text"], metadata=entry["metadata"]) for entry in entries]
+        return cls(embedding, vectors, documents, [entry["id"] for entry in entries])
+
+    # --- Search ----------------------------------------------------------------------
+
+    def search_by_vectors(self, embeddings: Sequence[Sequence[float]], k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """The k nearest documents and their distances for each of a batch of query vectors."""
+        queries = _normalize(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        k = min(k, len(self))
+        if k <= 0:
+            return [[] for _ in queries]
+        vectors = self._vectors
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for first in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+            scores = queries @ vectors[first:first + SEARCH_BLOCK_ROWS].T
+            top = _top_k(scores, min(k, scores.shape[1]))
+            # Merge this block's winners with the best so far.
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, top + first], axis=1)
+            if best_scores.shape[1] > k:
+                keep = _top_k(best_scores, k)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        # Squared L2 between unit vectors, the distance Chroma's "l2" space reports.
+        return [
+            [(self._documents[row], float(2.0 - 2.0 * score)) for row, score in zip(rows, scores)]
+            for rows, scores in zip(best_rows, best_scores)
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.search_by_vectors([self._embedding.embed_query(query)], k)[0]
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        # The embedding call is the slow part; the product is microseconds for a small corpus.
+        embedding = await self._embedding.aembed_query(query)
+        if len(self) > INLINE_SEARCH_ROWS:
+            return (await asyncio.to_thread(self.search_by_vectors, [embedding], k))[0]
+        return self.search_by_vectors([embedding], k)[0]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.search_by_vectors([embedding], k)[0]]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
@@ -0,0 +1,436 @@
+import asyncio
+import fcntl
+import logging
+import os
+import secrets
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .sharded_storage import merge_pages
+from .sqlite_storage import SQLiteConversationStorage
+from .storage import Conversation, ConversationInfo, ConversationStorage, StoredSummary
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT_PREFIX = "segment-"
+_SEGMENT_SUFFIX = ".db"
+# Segments of IDs that don't carry their creation time (e.g. imported UUID4s), found by probing.
+_MAX_FOREIGN_IDS = 100_000
+
+
+def uuid7() -> str:
+    """A time-ordered UUID (version 7): the first 48 bits are the Unix time in milliseconds."""
+    millis = time.time_ns() // 1_000_000
+    value = (millis << 80) | (0x7 << 76) | (secrets.randbits(12) << 64) | (0b10 << 62) | secrets.randbits(62)
+    return str(uuid.UUID(int=value))
+
+
+def _uuid7_seconds(conversation_id: str) -> Optional[float]:
+    """Creation time embedded in a UUID7 conversation ID, or None for any other ID."""
+    if len(conversation_id) != 36 or conversation_id[14] != "7":
+        return None
+    try:
+        return int(conversation_id[:8] + conversation_id[9:13], 16) / 1000
+    except ValueError:
+        return None
+
+
+@dataclass
+class RetentionPolicy:
+    max_age_seconds: Optional[float] = None  # Since a segment's most recent update
+    max_conversations: Optional[int] = None
+    max_bytes: Optional[int] = None
+
+
+@dataclass
+class SegmentInfo:
+    start: int  # Epoch seconds at which the segment's period begins
+    path: str
+    bytes: int
+    conversations: int
+    last_updated: Optional[datetime]
+
+
+def plan_retention(segments: Sequence[SegmentInfo], policy: RetentionPolicy, now: datetime) -> List[int]:
+    """Starts of the segments `policy` drops, oldest first. The newest segment is never dropped.
+
+    While the totals are over `max_conversations` or `max_bytes` the oldest
+    segments go; after that only the ones idle for longer than `max_age_seconds`.
+    """
+    ordered = sorted(segments, key=lambda segment: segment.start)
+    conversations = sum(segment.conversations for segment in ordered)
+    size = sum(segment.bytes for segment in ordered)
+    cutoff = now - timedelta(seconds=policy.max_age_seconds) if policy.max_age_seconds is not None else None
+    drop = []
+    for segment in ordered[:-1]:
+        over = (policy.max_conversations is not None and conversations > policy.max_conversations) or (
+            policy.max_bytes is not None and size > policy.max_bytes
+        )
+        expired = cutoff is not None and (segment.last_updated is None or segment.last_updated < cutoff)
+        if over or expired:
+            drop.append(segment.start)
+            conversations -= segment.conversations
+            size -= segment.bytes
+    return drop
+
+
+class PartitionedConversationStorage(ConversationStorage):
+    """SQLite conversation storage split into time-partitioned segment files, with retention.
+
+    Each conversation lives in `segment-<start>.db` for the `partition_seconds`
+    period it was created in. New conversations get UUID7 IDs, which carry
+    their creation time, so the segment is known from the ID alone; other IDs
+    (imported ones) are found by probing the segments and remembered.
+
+    With a `retention` policy, `start()` launches a sweeper that every
+    `sweep_interval` seconds drops whole segments, closing them and deleting
+    their files, instead of deleting conversations row by row. Age is measured
+    from a segment's most recent update, so a segment is kept until every
+    conversation created in its period has been idle for `max_age_seconds`.
+    The sweeper throttles itself: it inspects and drops one segment at a
+    time, pausing `sweep_pause` seconds after each drop, and all file work
+    runs off the event loop.
+
+    Every worker can run the sweeper, but only the one holding the directory's
+    `sweeper.lock` drops segments. The others check a segment's file before
+    each use: if it is gone, or was replaced since their connection opened it
+    (a different inode), they close the segment and its conversations are not
+    found, so no worker keeps writing to a deleted file.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        partition_seconds: int = 86400,
+        retention: Optional[RetentionPolicy] = None,
+        sweep_interval: float = 300.0,
+        sweep_pause: float = 1.0,
+    ):
+        self._directory = directory
+        self._partition_seconds = partition_seconds
+        self._retention = retention
+        self._sweep_interval = sweep_interval
+        self._sweep_pause = sweep_pause
+        self._segments: Dict[int, SQLiteConversationStorage] = {}
+        self._foreign: "OrderedDict[str, int]" = OrderedDict()
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._sweeper_lock_file = None
+        self.dropped_segments = 0
+        os.makedirs(directory, exist_ok=True)
+        self._discover()
+
+    def stats(self) -> Dict[str, int]:
+        stats = {"segments": len(self._segments), "dropped_segments": self.dropped_segments}
+        for segment in self._segments.values():
+            for key, value in segment.stats().items():
+                stats[key] = stats.get(key, 0) + value
+        return stats
+
+    def _path(self, start: int) -> str:
+        return os.path.join(self._directory, f"{_SEGMENT_PREFIX}{start}{_SEGMENT_SUFFIX}")
+
+    def _segment_starts_on_disk(self) -> List[int]:
+        starts = []
+        for name in os.listdir(self._directory):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                try:
+                    starts.append(int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return starts
+
+    def _discover(self) -> None:
+        """Pick up segments created by other workers."""
+        for start in self._segment_starts_on_disk():
+            self._open(start)
+
+    def _start_of(self, seconds: float) -> int:
+        return int(seconds // self._partition_seconds * self._partition_seconds)
+
+    def _open(self, start: int) -> SQLiteConversationStorage:
+        segment = self._segments.get(start)
+        if segment is None:
+            # The file itself is only created on the segment's first query.
+            segment = self._segments[start] = SQLiteConversationStorage(self._path(start))
+        return segment
+
+    def _remember(self, conversation_id: str, start: int) -> None:
+        self._foreign[conversation_id] = start
+        self._foreign.move_to_end(conversation_id)
+        if len(self._foreign) > _MAX_FOREIGN_IDS:
+            self._foreign.popitem(last=False)
+
+    def _dropped(self, start: int) -> bool:
+        """Whether the segment's file was deleted, or replaced, since this worker opened it."""
+        try:
+            inode = os.stat(self._path(start)).st_ino
+        except FileNotFoundError:
+            # The current segment may simply not have been written yet; it is never dropped anyway.
+            return self._segments[start].inode is not None or start < self._start_of(time.time())
+        return self._segments[start].inode not in (None, inode)
+
+    async def _live(self, start: int) -> Optional[SQLiteConversationStorage]:
+        """The open segment starting at `start`, or None (closing it) if another worker dropped it."""
+        if start not in self._segments:
+            return None
+        if self._dropped(start):
+            await self._segments.pop(start).close()
+            return None
+        return self._segments[start]
+
+    async def _locate(self, conversation_id: str) -> Optional[SQLiteConversationStorage]:
+        """The segment holding a conversation, or None. Never creates a segment."""
+        seconds = _uuid7_seconds(conversation_id)
+        if seconds is not None:
+            start = self._start_of(seconds)
+            if start not in self._segments and os.path.exists(self._path(start)):
+                self._open(start)  # Created by another worker.
+            return await self._live(start)
+        start = self._foreign.get(conversation_id)
+        if start is not None:
+            segment = await self._live(start)
+            if segment is not None:
+                return segment
+        self._discover()
+        for start in sorted(self._segments, reverse=True):
+            segment = await self._live(start)
+            if segment is not None and await segment.get_conversation_info(conversation_id) is not None:
+                self._remember(conversation_id, start)
+                return segment
+        return None
+
+    async def _require(self, conversation_id: str) -> SQLiteConversationStorage:
+        segment = await self._locate(conversation_id)
+        if segment is None:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        return segment
+
+    async def create_conversation(self) -> str:
+        now = datetime.utcnow()
+        conversation_id = uuid7()
+        segment = self._open(self._start_of(_uuid7_seconds(conversation_id)))
+        await segment.import_conversation(Conversation(id=conversation_id, messages=[], created_at=now, updated_at=now))
+        return conversation_id
+
+    async def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
+        segment = await self._locate(conversation_id)
+        return await segment.get_conversation(conversation_id) if segment else None
+
+    async def add_message(self, conversation_id: str, role: str, content: str) -> None:
+        await self.add_messages(conversation_id, [(role, content)])
+
+    async def add_messages(self, conversation_id: str, messages: Sequence[Tuple[str, str]]) -> None:
+        await (await self._require(conversation_id)).add_messages(conversation_id, messages)
+
+    async def get_messages(self, conversation_id: str) -> List[Dict]:
+        return await (await self._require(conversation_id)).get_messages(conversation_id)
+
+    async def get_messages_since(
+        self, conversation_id: str, cursor: int = 0, with_tokens: bool = False
+    ) -> Tuple[List[Dict], int]:
+        return await (await self._require(conversation_id)).get_messages_since(conversation_id, cursor, with_tokens)
+
+    async def get_messages_range(self, conversation_id: str, start: int, end: int) -> Tuple[List[Dict], int]:
+        return await (await self._require(conversation_id)).get_messages_range(conversation_id, start, end)
+
+    async def get_conversation_info(self, conversation_id: str) -> Optional[ConversationInfo]:
+        segment = await self._locate(conversation_id)
+        return await segment.get_conversation_info(conversation_id) if segment else None
+
+    async def fork_conversation(self, conversation_id: str, at_index: int) -> str:
+        # The fork is a new conversation, so it goes to the current segment with a copy of the prefix.
+        conversation = await (await self._require(conversation_id)).get_conversation(conversation_id)
+        if conversation is None:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        if not 0 <= at_index <= len(conversation.messages):
+            raise ValueError(f"Cannot fork conversation {conversation_id} at message {at_index}")
+        now = datetime.utcnow()
+        fork_id = uuid7()
+        segment = self._open(self._start_of(_uuid7_seconds(fork_id)))
+        await segment.import_conversation(
+            Conversation(id=fork_id, messages=conversation.messages[:at_index], created_at=now, updated_at=now)
+        )
+        return fork_id
+
+    async def import_conversation(self, conversation: Conversation) -> None:
+        if await self._locate(conversation.id) is not None:
+            raise ValueError(f"Conversation {conversation.id} already exists")
+        seconds = _uuid7_seconds(conversation.id)
+        if seconds is None:
+            # Filed under its creation time; the ID alone won't lead back to it.
+            seconds = (conversation.created_at - datetime(1970, 1, 1)).total_seconds()
+            self._remember(conversation.id, self._start_of(seconds))
+        start = self._start_of(seconds)
+        await self._live(start)  # Don't import into a segment another worker has dropped.
+        await self._open(start).import_conversation(conversation)
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        segment = await self._locate(conversation_id)
+        if segment is None:
+            return False
+        self._foreign.pop(conversation_id, None)
+        return await segment.delete_conversation(conversation_id)
+
+    async def _sources(self) -> Dict[str, ConversationStorage]:
+        self._discover()
+        sources = {}
+        for start in list(self._segments):
+            segment = await self._live(start)
+            if segment is not None:
+                sources[str(start)] = segment
+        return sources
+
+    async def list_conversations(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        return await merge_pages(
+            await self._sources(), lambda segment, size, page: segment.list_conversations(size, page), limit, cursor
+        )
+
+    async def list_conversations_by_creation(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        # Imported conversations can sit in a segment other than their creation time's, so these are merged too.
+        return await merge_pages(
+            await self._sources(),
+            lambda segment, size, page: segment.list_conversations_by_creation(size, page),
+            limit,
+            cursor,
+            oldest_first=True,
+        )
+
+    async def search_conversations(
+        self, query: str, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        return await merge_pages(
+            await self._sources(), lambda segment, size, page: segment.search_conversations(query, size, page), limit, cursor
+        )
+
+    async def acquire_turn_lease(self, conversation_id: str, owner: str, ttl_seconds: float) -> bool:
+        # The lease lives in the conversation's segment; a conversation that doesn't exist has no turns to exclude.
+        segment = await self._locate(conversation_id)
+        return await segment.acquire_turn_lease(conversation_id, owner, ttl_seconds) if segment else True
+
+    async def release_turn_lease(self, conversation_id: str, owner: str) -> None:
+        segment = await self._locate(conversation_id)
+        if segment is not None:
+            await segment.release_turn_lease(conversation_id, owner)
+
+    async def get_summary(self, conversation_id: str) -> Optional[StoredSummary]:
+        segment = await self._locate(conversation_id)
+        return await segment.get_summary(conversation_id) if segment else None
+
+    async def save_summary(self, conversation_id: str, summary: StoredSummary) -> None:
+        segment = await self._locate(conversation_id)
+        if segment is not None:
+            await segment.save_summary(conversation_id, summary)
+
+    async def delete_summary(self, conversation_id: str) -> None:
+        segment = await self._locate(conversation_id)
+        if segment is not None:
+            await segment.delete_summary(conversation_id)
+
+    # --- Retention --------------------------------------------------------------------
+
+    def _segment_bytes(self, start: int) -> int:
+        size = 0
+        for suffix in ("", "-wal"):
+            try:
+                size += os.stat(self._path(start) + suffix).st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    async def segments(self) -> List[SegmentInfo]:
+        """Size, conversation count and last update of every segment, oldest first, one segment at a time."""
+        infos = []
+        for start in sorted(self._segments):
+            segment = self._segments.get(start)
+            if segment is None:
+                continue
+            newest, _ = await segment.list_conversations(1)
+            infos.append(SegmentInfo(
+                start=start,
+                path=self._path(start),
+                bytes=await asyncio.to_thread(self._segment_bytes, start),
+                conversations=await segment.count_conversations(),
+                last_updated=newest[0].updated_at if newest else None,
+            ))
+        return infos
+
+    def _remove_files(self, start: int) -> None:
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self._path(start) + suffix)
+            except FileNotFoundError:
+                pass
+
+    async def drop_segment(self, start: int) -> None:
+        """Delete a whole segment: every conversation created in its period."""
+        segment = self._segments.pop(start, None)
+        if segment is not None:
+            # Waits for the segment's queued writes, so none land after the files are gone.
+            await segment.close()
+        await asyncio.to_thread(self._remove_files, start)
+        self.dropped_segments += 1
+        logger.info(f"Dropped conversation segment {self._path(start)}")
+
+    async def _forget_dropped(self) -> None:
+        """Close segments another worker's sweeper has deleted, including ones no request has touched since."""
+        for start in list(self._segments):
+            await self._live(start)
+
+    def _claim_sweeper(self) -> bool:
+        if self._sweeper_lock_file is None:
+            lock = open(os.path.join(self._directory, "sweeper.lock"), "a")
+            try:
+                # Held until the process exits, so exactly one worker drops segments.
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                return False
+            self._sweeper_lock_file = lock
+        return True
+
+    async def sweep(self) -> List[int]:
+        """Apply the retention policy once; returns the starts of the segments dropped."""
+        if self._retention is None:
+            return []
+        if not await asyncio.to_thread(self._claim_sweeper):
+            await self._forget_dropped()
+            return []
+        dropped = []
+        for start in plan_retention(await self.segments(), self._retention, datetime.utcnow()):
+            await self.drop_segment(start)
+            dropped.append(start)
+            # Spread the drops out, so live traffic never waits on a burst of closes and unlinks.
+            await asyncio.sleep(self._sweep_pause)
+        return dropped
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._sweep_interval)
+            try:
+                dropped = await self.sweep()
+                if dropped:
+                    logger.info(f"Retention dropped {len(dropped)} segment(s); {self.stats()}")
+            except Exception as e:
+                logger.error(f"Error applying conversation retention: {e}", exc_info=True)
+
+    async def start(self) -> None:
+        if self._retention is not None and self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def close(self) -> None:
+        if self._sweep_task:
+            self._sweep_task.cancel()
+            await asyncio.gather(self._sweep_task, return_exceptions=True)
+            self._sweep_task = None
+        await asyncio.gather(*(segment.close() for segment in self._segments.values()))
+        if self._sweeper_lock_file is not None:
+            self._sweeper_lock_file.close()
+            self._sweeper_lock_file = None
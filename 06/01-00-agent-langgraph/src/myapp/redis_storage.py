@@ -0,0 +1,473 @@
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from redis.asyncio import Redis
+
+from .storage import Conversation, ConversationInfo, ConversationStorage, Message, StoredSummary
+from .tokens import message_tokens
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Appends the messages (ARGV[4..]) only if the conversation exists, atomically
+# and in a single round trip. ARGV[1] is the new updated_at timestamp, ARGV[2]
+# the same instant as a score and ARGV[3] the conversation ID, which is moved
+# to that score in the updated_at index (KEYS[3]).
+_ADD_MESSAGES_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+redis.call('HSET', KEYS[1], 'updated_at', ARGV[1])
+redis.call('ZADD', KEYS[3], ARGV[2], ARGV[3])
+return redis.call('RPUSH', KEYS[2], unpack(ARGV, 4))
+"""
+
+# Stores a summary (KEYS[2]) of the conversation KEYS[1]'s first ARGV[1]
+# messages, with digest ARGV[2] and text ARGV[3], unless the conversation is
+# gone or the stored summary already covers as many messages.
+_SAVE_SUMMARY_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local upto = tonumber(redis.call('HGET', KEYS[2], 'upto') or '-1')
+if upto >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[2], 'upto', ARGV[1], 'digest', ARGV[2], 'text', ARGV[3])
+return 1
+"""
+
+# Copies the first ARGV[1] messages of a conversation (KEYS[1], KEYS[2]) into a
+# new one (KEYS[3], KEYS[4]) created at ARGV[2] (score ARGV[3]) with ID ARGV[4],
+# and adds it to the updated_at and created_at indexes (KEYS[5], KEYS[6]). The copy stays on the server
+# and is pushed in chunks, since Lua's stack limits how many values one call
+# can take. Returns -1 if the source doesn't exist, -2 if the index is out of range.
+_FORK_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local at_index = tonumber(ARGV[1])
+if at_index < 0 or at_index > redis.call('LLEN', KEYS[2]) then
+    return -2
+end
+redis.call('HSET', KEYS[3], 'created_at', ARGV[2], 'updated_at', ARGV[2])
+redis.call('ZADD', KEYS[5], ARGV[3], ARGV[4])
+redis.call('ZADD', KEYS[6], ARGV[3], ARGV[4])
+for first = 0, at_index - 1, 1000 do
+    local last = math.min(first + 999, at_index - 1)
+    redis.call('RPUSH', KEYS[4], unpack(redis.call('LRANGE', KEYS[2], first, last)))
+end
+return at_index
+"""
+
+# Stores a whole conversation (KEYS[1], KEYS[2]) unless it exists: ARGV[1] and
+# ARGV[2] are created_at and updated_at, ARGV[3] and ARGV[4] their scores in
+# the created_at and updated_at indexes (KEYS[4], KEYS[3]), ARGV[5] the
+# conversation ID and ARGV[6..] the messages, pushed in chunks. Returns -1 if
+# the conversation already exists.
+_IMPORT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return -1
+end
+redis.call('HSET', KEYS[1], 'created_at', ARGV[1], 'updated_at', ARGV[2])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[5])
+redis.call('ZADD', KEYS[4], ARGV[3], ARGV[5])
+for first = 6, #ARGV, 1000 do
+    redis.call('RPUSH', KEYS[2], unpack(ARGV, first, math.min(first + 999, #ARGV)))
+end
+return 0
+"""
+
+# Sets the turn lease KEYS[1] to owner ARGV[1] for ARGV[2] milliseconds unless
+# another owner holds it (SET NX PX that the holder may repeat to extend it).
+_ACQUIRE_LEASE_SCRIPT = """
+local holder = redis.call('GET', KEYS[1])
+if holder and holder ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+
+# Deletes the turn lease KEYS[1] only if owner ARGV[1] still holds it.
+_RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Adds conversations (hashes KEYS[2..]) stored before the created_at index
+# (KEYS[1]) existed to it: ARGV holds each one's score and ID, in KEYS order.
+# Ones deleted since they were read are skipped.
+_BACKFILL_CREATED_SCRIPT = """
+for i = 2, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('ZADD', KEYS[1], ARGV[2 * i - 3], ARGV[2 * i - 2])
+    end
+end
+return 0
+"""
+
+def _score(timestamp: datetime) -> float:
+    """Sorted-set score for a naive UTC timestamp: seconds since the epoch."""
+    return (timestamp - _EPOCH).total_seconds()
+
+
+class RedisConversationStorage(ConversationStorage):
+    """Conversation storage shared by every worker through a Redis-protocol server.
+
+    Each conversation is a hash (`created_at`, `updated_at`) plus a list of
+    JSON-encoded messages. Reads that need both are pipelined into one round
+    trip, and `add_message` is a server-side script so the existence check,
+    the append and the timestamp update happen atomically in one round trip;
+    `add_messages` appends a whole turn the same way. `fork_conversation`
+    copies the prefix with a script too, without it leaving the server.
+
+    A sorted set scores every conversation ID by its `updated_at`, so
+    `list_conversations` pages through it newest first without a scan;
+    another one by `created_at` does the same for
+    `list_conversations_by_creation`.
+    Full-text search would need a server-side search module and is not
+    supported.
+
+    Any client compatible with `redis.asyncio.Redis` can be passed in, e.g.
+    `fakeredis.aioredis.FakeRedis(decode_responses=True)` for local testing.
+    """
+
+    def __init__(self, client: Redis, key_prefix: str = "myapp:"):
+        self._redis = client
+        self._key_prefix = key_prefix
+        self._add_messages_script = client.register_script(_ADD_MESSAGES_SCRIPT)
+        self._fork_script = client.register_script(_FORK_SCRIPT)
+        self._import_script = client.register_script(_IMPORT_SCRIPT)
+        self._acquire_lease_script = client.register_script(_ACQUIRE_LEASE_SCRIPT)
+        self._release_lease_script = client.register_script(_RELEASE_LEASE_SCRIPT)
+        self._save_summary_script = client.register_script(_SAVE_SUMMARY_SCRIPT)
+        self._backfill_created_script = client.register_script(_BACKFILL_CREATED_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str, key_prefix: str = "myapp:") -> "RedisConversationStorage":
+        # Connections are opened lazily, so this is safe to call before gunicorn forks.
+        return cls(Redis.from_url(url, decode_responses=True), key_prefix=key_prefix)
+
+    def _conversation_key(self, conversation_id: str) -> str:
+        return f"{self._key_prefix}conv:{conversation_id}"
+
+    def _messages_key(self, conversation_id: str) -> str:
+        return f"{self._key_prefix}conv:{conversation_id}:messages"
+
+    def _updated_key(self) -> str:
+        return f"{self._key_prefix}conversations:updated"
+
+    def _lease_key(self, conversation_id: str) -> str:
+        return f"{self._key_prefix}conv:{conversation_id}:lease"
+
+    def _created_key(self) -> str:
+        return f"{self._key_prefix}conversations:created"
+
+    def _summary_key(self, conversation_id: str) -> str:
+        return f"{self._key_prefix}conv:{conversation_id}:summary"
+
+    async def create_conversation(self) -> str:
+        conversation_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(
+                self._conversation_key(conversation_id),
+                mapping={"created_at": now.isoformat(), "updated_at": now.isoformat()},
+            )
+            pipe.zadd(self._updated_key(), {conversation_id: _score(now)})
+            pipe.zadd(self._created_key(), {conversation_id: _score(now)})
+            await pipe.execute()
+        return conversation_id
+
+    async def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self._conversation_key(conversation_id))
+            pipe.lrange(self._messages_key(conversation_id), 0, -1)
+            header, raw_messages = await pipe.execute()
+        if not header:
+            return None
+        messages = []
+        for raw in raw_messages:
+            data = json.loads(raw)
+            messages.append(Message(
+                role=data["role"],
+                content=data["content"],
+                timestamp=datetime.fromisoformat(data["timestamp"]),
+                tokens=data.get("tokens"),
+            ))
+        return Conversation(
+            id=conversation_id,
+            messages=messages,
+            created_at=datetime.fromisoformat(header["created_at"]),
+            updated_at=datetime.fromisoformat(header["updated_at"]),
+        )
+
+    async def add_message(self, conversation_id: str, role: str, content: str) -> None:
+        await self.add_messages(conversation_id, [(role, content)])
+
+    async def add_messages(self, conversation_id: str, messages: Sequence[Tuple[str, str]]) -> None:
+        if not messages:
+            return
+        now = datetime.utcnow()
+        payloads = [
+            json.dumps(
+                {"role": role, "content": content, "timestamp": now.isoformat(), "tokens": message_tokens(content)},
+                ensure_ascii=False,
+            )
+            for role, content in messages
+        ]
+        result = await self._add_messages_script(
+            keys=[self._conversation_key(conversation_id), self._messages_key(conversation_id), self._updated_key()],
+            args=[now.isoformat(), _score(now), conversation_id, *payloads],
+        )
+        if result == -1:
+            raise ValueError(f"Conversation {conversation_id} not found")
+
+    async def fork_conversation(self, conversation_id: str, at_index: int) -> str:
+        fork_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        result = await self._fork_script(
+            keys=[
+                self._conversation_key(conversation_id),
+                self._messages_key(conversation_id),
+                self._conversation_key(fork_id),
+                self._messages_key(fork_id),
+                self._updated_key(),
+                self._created_key(),
+            ],
+            args=[at_index, now.isoformat(), _score(now), fork_id],
+        )
+        if result == -1:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        if result == -2:
+            raise ValueError(f"Cannot fork conversation {conversation_id} at message {at_index}")
+        return fork_id
+
+    async def import_conversation(self, conversation: Conversation) -> None:
+        payloads = [
+            json.dumps({
+                "role": m.role,
+                "content": m.content,
+                "timestamp": m.timestamp.isoformat(),
+                "tokens": message_tokens(m.content) if m.tokens is None else m.tokens,
+            }, ensure_ascii=False)
+            for m in conversation.messages
+        ]
+        result = await self._import_script(
+            keys=[
+                self._conversation_key(conversation.id),
+                self._messages_key(conversation.id),
+                self._updated_key(),
+                self._created_key(),
+            ],
+            args=[
+                conversation.created_at.isoformat(),
+                conversation.updated_at.isoformat(),
+                _score(conversation.created_at),
+                _score(conversation.updated_at),
+                conversation.id,
+                *payloads,
+            ],
+        )
+        if result == -1:
+            raise ValueError(f"Conversation {conversation.id} already exists")
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._conversation_key(conversation_id))
+            pipe.delete(self._messages_key(conversation_id))
+            pipe.delete(self._summary_key(conversation_id))
+            pipe.zrem(self._updated_key(), conversation_id)
+            pipe.zrem(self._created_key(), conversation_id)
+            deleted, _, _, _, _ = await pipe.execute()
+        return deleted > 0
+
+    async def get_messages(self, conversation_id: str) -> List[Dict]:
+        messages, _ = await self.get_messages_since(conversation_id, 0)
+        return messages
+
+    async def get_messages_since(
+        self, conversation_id: str, cursor: int = 0, with_tokens: bool = False
+    ) -> Tuple[List[Dict], int]:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.exists(self._conversation_key(conversation_id))
+            pipe.lrange(self._messages_key(conversation_id), cursor, -1)
+            pipe.llen(self._messages_key(conversation_id))
+            exists, raw_messages, total = await pipe.execute()
+        if not exists:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        messages = []
+        for raw in raw_messages:
+            data = json.loads(raw)
+            message = {"role": data["role"], "content": data["content"]}
+            if with_tokens:
+                # Messages written before token counts were stored are counted here.
+                tokens = data.get("tokens")
+                message["tokens"] = message_tokens(data["content"]) if tokens is None else tokens
+            messages.append(message)
+        return messages, total
+
+    async def get_messages_range(self, conversation_id: str, start: int, end: int) -> Tuple[List[Dict], int]:
+        if end <= start:
+            # LRANGE's stop is inclusive, so an empty range can't be expressed as one.
+            info = await self.get_conversation_info(conversation_id)
+            if info is None:
+                raise ValueError(f"Conversation {conversation_id} not found")
+            return [], info.message_count
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.exists(self._conversation_key(conversation_id))
+            pipe.lrange(self._messages_key(conversation_id), start, end - 1)
+            pipe.llen(self._messages_key(conversation_id))
+            exists, raw_messages, total = await pipe.execute()
+        if not exists:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        messages = []
+        for raw in raw_messages:
+            data = json.loads(raw)
+            messages.append({"role": data["role"], "content": data["content"]})
+        return messages, total
+
+    async def get_conversation_info(self, conversation_id: str) -> Optional[ConversationInfo]:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self._conversation_key(conversation_id))
+            pipe.llen(self._messages_key(conversation_id))
+            header, total = await pipe.execute()
+        if not header:
+            return None
+        return ConversationInfo(
+            id=conversation_id,
+            created_at=datetime.fromisoformat(header["created_at"]),
+            updated_at=datetime.fromisoformat(header["updated_at"]),
+            message_count=total,
+        )
+
+    async def list_conversations(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        if cursor:
+            score, after_id = cursor.split(":", 1)
+            max_score = float(score)
+        else:
+            max_score, after_id = "+inf", None
+        # Equal scores come back in descending ID order, so the cursor's ties are skipped by ID.
+        page: List[Tuple[str, float]] = []
+        offset = 0
+        while len(page) <= limit:
+            batch = await self._redis.zrevrangebyscore(
+                self._updated_key(), max_score, "-inf", start=offset, num=limit + 1, withscores=True
+            )
+            if not batch:
+                break
+            offset += len(batch)
+            page.extend(
+                (conversation_id, score) for conversation_id, score in batch
+                if after_id is None or score < max_score or conversation_id < after_id
+            )
+        next_cursor = f"{page[limit - 1][1]!r}:{page[limit - 1][0]}" if len(page) > limit else None
+        return await self._infos([conversation_id for conversation_id, _ in page[:limit]]), next_cursor
+
+    async def list_conversations_by_creation(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        if cursor:
+            score, after_id = cursor.split(":", 1)
+            min_score = float(score)
+        else:
+            min_score, after_id = "-inf", None
+        # Equal scores come back in ascending ID order, so the cursor's ties are skipped by ID.
+        page: List[Tuple[str, float]] = []
+        offset = 0
+        while len(page) <= limit:
+            batch = await self._redis.zrangebyscore(
+                self._created_key(), min_score, "+inf", start=offset, num=limit + 1, withscores=True
+            )
+            if not batch:
+                break
+            offset += len(batch)
+            page.extend(
+                (conversation_id, score) for conversation_id, score in batch
+                if after_id is None or score > min_score or conversation_id > after_id
+            )
+        next_cursor = f"{page[limit - 1][1]!r}:{page[limit - 1][0]}" if len(page) > limit else None
+        return await self._infos([conversation_id for conversation_id, _ in page[:limit]]), next_cursor
+
+    async def _infos(self, conversation_ids: List[str]) -> List[ConversationInfo]:
+        """Infos of the listed conversations in one round trip, leaving out any deleted meanwhile."""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for conversation_id in conversation_ids:
+                pipe.hgetall(self._conversation_key(conversation_id))
+                pipe.llen(self._messages_key(conversation_id))
+            results = await pipe.execute()
+        infos = []
+        for conversation_id, header, total in zip(conversation_ids, results[::2], results[1::2]):
+            if header:
+                infos.append(ConversationInfo(
+                    id=conversation_id,
+                    created_at=datetime.fromisoformat(header["created_at"]),
+                    updated_at=datetime.fromisoformat(header["updated_at"]),
+                    message_count=total,
+                ))
+        return infos
+
+    async def get_summary(self, conversation_id: str) -> Optional[StoredSummary]:
+        stored = await self._redis.hgetall(self._summary_key(conversation_id))
+        if not stored:
+            return None
+        return StoredSummary(upto=int(stored["upto"]), digest=stored["digest"], text=stored["text"])
+
+    async def save_summary(self, conversation_id: str, summary: StoredSummary) -> None:
+        await self._save_summary_script(
+            keys=[self._conversation_key(conversation_id), self._summary_key(conversation_id)],
+            args=[summary.upto, summary.digest, summary.text],
+        )
+
+    async def delete_summary(self, conversation_id: str) -> None:
+        await self._redis.delete(self._summary_key(conversation_id))
+
+    async def start(self) -> None:
+        # Conversations stored before the created_at index existed are added to it, in batches.
+        if await self._redis.zcard(self._created_key()) >= await self._redis.zcard(self._updated_key()):
+            return
+        batch: List[str] = []
+        async for conversation_id, _ in self._redis.zscan_iter(self._updated_key(), count=1000):
+            batch.append(conversation_id)
+            if len(batch) == 1000:
+                await self._backfill_created(batch)
+                batch = []
+        if batch:
+            await self._backfill_created(batch)
+
+    async def _backfill_created(self, conversation_ids: List[str]) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for conversation_id in conversation_ids:
+                pipe.hget(self._conversation_key(conversation_id), "created_at")
+            created = await pipe.execute()
+        found = [(conversation_id, c) for conversation_id, c in zip(conversation_ids, created) if c]
+        args = []
+        for conversation_id, created_at in found:
+            args.extend([_score(datetime.fromisoformat(created_at)), conversation_id])
+        if found:
+            await self._backfill_created_script(
+                keys=[self._created_key(), *(self._conversation_key(conversation_id) for conversation_id, _ in found)],
+                args=args,
+            )
+        logger.info(f"Added {len(found)} conversations to the created_at index.")
+
+    async def acquire_turn_lease(self, conversation_id: str, owner: str, ttl_seconds: float) -> bool:
+        result = await self._acquire_lease_script(
+            keys=[self._lease_key(conversation_id)], args=[owner, max(1, int(ttl_seconds * 1000))]
+        )
+        return result == 1
+
+    async def release_turn_lease(self, conversation_id: str, owner: str) -> None:
+        await self._release_lease_script(keys=[self._lease_key(conversation_id)], args=[owner])
+
+    async def close(self) -> None:
+        await self._redis.aclose()
@@ -0,0 +1,341 @@
+"""Hash-sharded conversation storage, and a tool to rebalance conversations between shards.
+
+Rebalance SQLite shards after adding one (new files go last) or migrate a
+single database into shards:
+
+    python -m myapp.sharded_storage conversations-0.db conversations-1.db conversations-2.db
+    python -m myapp.sharded_storage conversations-0.db conversations-1.db --source conversations.db
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .storage import Conversation, ConversationInfo, ConversationStorage, StoredSummary
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for(conversation_id: str, shard_count: int) -> int:
+    """Shard index of a conversation, by jump consistent hash of its ID.
+
+    Going from N to N + 1 shards only moves the ~1/(N + 1) of conversations
+    that land on the new shard; no conversation moves between old shards.
+    """
+    key = int.from_bytes(hashlib.blake2b(conversation_id.encode("utf-8"), digest_size=8).digest(), "little")
+    bucket, j = -1, 0
+    while j < shard_count:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_paths(path: str, shard_count: int) -> List[str]:
+    """`conversations.db` -> `conversations-0.db`, `conversations-1.db`, ..."""
+    root, ext = os.path.splitext(path)
+    return [f"{root}-{i}{ext}" for i in range(shard_count)]
+
+
+def _encode_cursor(states: Dict[str, Optional[list]]) -> Optional[str]:
+    if all(state is None for state in states.values()):
+        return None
+    return base64.urlsafe_b64encode(json.dumps(states, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def _valid_state(state) -> bool:
+    if state is None:
+        return True
+    if not isinstance(state, list) or len(state) != 3:
+        return False
+    last = state[2]
+    return last is None or (isinstance(last, list) and len(last) == 2 and all(isinstance(part, str) for part in last))
+
+
+def _decode_cursor(cursor: Optional[str], keys: Sequence[str]) -> Dict[str, Optional[list]]:
+    states = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii"))) if cursor else {}
+    if not isinstance(states, dict) or not all(_valid_state(state) for state in states.values()):
+        raise ValueError("Invalid cursor")
+    # Sources the cursor doesn't know (e.g. created since) start from their first page.
+    return {key: states.get(key, [None, 0, None]) for key in keys}
+
+
+def _sort_key(info: ConversationInfo, oldest_first: bool) -> Tuple[datetime, str]:
+    return (info.created_at, info.id) if oldest_first else (info.updated_at, info.id)
+
+
+def _follows(info: ConversationInfo, last: Tuple[datetime, str], oldest_first: bool) -> bool:
+    """Whether `info` comes after `last` in the merged order."""
+    key = _sort_key(info, oldest_first)
+    return key > last if oldest_first else key < last
+
+
+async def merge_pages(
+    sources: Dict[str, ConversationStorage], fetch, limit: int, cursor: Optional[str], oldest_first: bool = False
+) -> Tuple[List[ConversationInfo], Optional[str]]:
+    """Merge the newest-first pages of several storages into one page of `limit`.
+
+    With `oldest_first`, the pages are in creation order instead, as from
+    `list_conversations_by_creation`.
+
+    `fetch(storage, size, storage_cursor)` returns one page of a storage, e.g.
+    its `list_conversations`. The returned cursor holds, per source key,
+    [page cursor, page size, last]: the page is re-fetched with the same
+    cursor and size, and only entries ordered after `last`, the (updated_at,
+    id) (or (created_at, id)) of the last entry taken from that source, are
+    used. Entries that moved since, e.g. conversations updated between two
+    requests, are neither repeated nor shift the others, and the state never
+    depends on a backend's cursor format.
+    """
+    states = _decode_cursor(cursor, list(sources))
+    buffers: Dict[str, List[ConversationInfo]] = {key: [] for key in sources}
+    next_cursors: Dict[str, Optional[str]] = {key: None for key in sources}
+
+    async def load(key: str) -> None:
+        page_cursor, page_size, last = states[key]
+        page, next_cursors[key] = await fetch(sources[key], page_size or limit, page_cursor)
+        states[key] = [page_cursor, page_size or limit, last]
+        if last is not None:
+            after = (datetime.fromisoformat(last[0]), last[1])
+            page = [info for info in page if _follows(info, after, oldest_first)]
+        buffers[key] = page
+        buffers[key].reverse()  # Popped from the end, in page order.
+
+    await asyncio.gather(*(load(key) for key, state in states.items() if state is not None))
+    page: List[ConversationInfo] = []
+    while len(page) < limit:
+        for key in states:
+            # A source that ran out of its page moves on to the next one before anything is compared.
+            while states[key] is not None and not buffers[key]:
+                if next_cursors[key] is None:
+                    states[key] = None
+                else:
+                    states[key] = [next_cursors[key], 0, states[key][2]]
+                    await load(key)
+        live = [key for key, state in states.items() if state is not None]
+        if not live:
+            break
+        if oldest_first:
+            chosen = min(live, key=lambda key: _sort_key(buffers[key][-1], oldest_first))
+        else:
+            chosen = max(live, key=lambda key: _sort_key(buffers[key][-1], oldest_first))
+        info = buffers[chosen].pop()
+        page.append(info)
+        at, _ = _sort_key(info, oldest_first)
+        states[chosen][2] = [at.isoformat(), info.id]
+    for key, state in states.items():
+        if state is not None and not buffers[key]:
+            states[key] = [next_cursors[key], 0, state[2]] if next_cursors[key] is not None else None
+    return page, _encode_cursor(states)
+
+
+class ShardedConversationStorage(ConversationStorage):
+    """Routes each conversation to one of N independent backends by a hash of its ID.
+
+    With one SQLite file, every worker's writes queue on the same database
+    write lock; with N files they only contend when they hit the same shard.
+    The wrapper assigns conversation IDs itself (so it knows the shard before
+    the conversation exists) and creates them with `import_conversation`.
+
+    Listing and search merge the shards' pages by most recent update (see
+    `merge_pages`).
+
+    Shards are addressed by position, so new shards must be appended and
+    `rebalance` run to move the conversations that now hash to them.
+    """
+
+    def __init__(self, shards: Sequence[ConversationStorage]):
+        if not shards:
+            raise ValueError("ShardedConversationStorage needs at least one shard")
+        self._shards = list(shards)
+        self._sources = {str(i): shard for i, shard in enumerate(self._shards)}
+
+    @property
+    def shards(self) -> List[ConversationStorage]:
+        return list(self._shards)
+
+    def stats(self) -> Dict[str, int]:
+        stats = {"shards": len(self._shards)}
+        # Counters are summed over the shards.
+        for shard in self._shards:
+            if hasattr(shard, "stats"):
+                for key, value in shard.stats().items():
+                    stats[key] = stats.get(key, 0) + value
+        return stats
+
+    def _shard(self, conversation_id: str) -> ConversationStorage:
+        return self._shards[shard_for(conversation_id, len(self._shards))]
+
+    async def create_conversation(self) -> str:
+        conversation_id = str(uuid.uuid4())
+        await self._shard(conversation_id).import_conversation(Conversation(id=conversation_id, messages=[]))
+        return conversation_id
+
+    async def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
+        return await self._shard(conversation_id).get_conversation(conversation_id)
+
+    async def add_message(self, conversation_id: str, role: str, content: str) -> None:
+        await self._shard(conversation_id).add_message(conversation_id, role, content)
+
+    async def add_messages(self, conversation_id: str, messages: Sequence[Tuple[str, str]]) -> None:
+        await self._shard(conversation_id).add_messages(conversation_id, messages)
+
+    async def get_messages(self, conversation_id: str) -> List[Dict]:
+        return await self._shard(conversation_id).get_messages(conversation_id)
+
+    async def get_messages_since(
+        self, conversation_id: str, cursor: int = 0, with_tokens: bool = False
+    ) -> Tuple[List[Dict], int]:
+        return await self._shard(conversation_id).get_messages_since(conversation_id, cursor, with_tokens)
+
+    async def get_messages_range(self, conversation_id: str, start: int, end: int) -> Tuple[List[Dict], int]:
+        return await self._shard(conversation_id).get_messages_range(conversation_id, start, end)
+
+    async def get_conversation_info(self, conversation_id: str) -> Optional[ConversationInfo]:
+        return await self._shard(conversation_id).get_conversation_info(conversation_id)
+
+    async def fork_conversation(self, conversation_id: str, at_index: int) -> str:
+        # The fork's ID usually hashes to another shard, so the prefix is copied there.
+        conversation = await self.get_conversation(conversation_id)
+        if conversation is None:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        if not 0 <= at_index <= len(conversation.messages):
+            raise ValueError(f"Cannot fork conversation {conversation_id} at message {at_index}")
+        now = datetime.utcnow()
+        fork = Conversation(
+            id=str(uuid.uuid4()),
+            messages=list(conversation.messages[:at_index]),
+            created_at=now,
+            updated_at=now,
+        )
+        await self._shard(fork.id).import_conversation(fork)
+        return fork.id
+
+    async def import_conversation(self, conversation: Conversation) -> None:
+        await self._shard(conversation.id).import_conversation(conversation)
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        return await self._shard(conversation_id).delete_conversation(conversation_id)
+
+    async def list_conversations(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        return await merge_pages(
+            self._sources, lambda shard, size, shard_cursor: shard.list_conversations(size, shard_cursor), limit, cursor
+        )
+
+    async def list_conversations_by_creation(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        return await merge_pages(
+            self._sources,
+            lambda shard, size, shard_cursor: shard.list_conversations_by_creation(size, shard_cursor),
+            limit,
+            cursor,
+            oldest_first=True,
+        )
+
+    async def search_conversations(
+        self, query: str, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        return await merge_pages(
+            self._sources,
+            lambda shard, size, shard_cursor: shard.search_conversations(query, size, shard_cursor),
+            limit,
+            cursor,
+        )
+
+    async def acquire_turn_lease(self, conversation_id: str, owner: str, ttl_seconds: float) -> bool:
+        return await self._shard(conversation_id).acquire_turn_lease(conversation_id, owner, ttl_seconds)
+
+    async def release_turn_lease(self, conversation_id: str, owner: str) -> None:
+        await self._shard(conversation_id).release_turn_lease(conversation_id, owner)
+
+    async def get_summary(self, conversation_id: str) -> Optional[StoredSummary]:
+        return await self._shard(conversation_id).get_summary(conversation_id)
+
+    async def save_summary(self, conversation_id: str, summary: StoredSummary) -> None:
+        await self._shard(conversation_id).save_summary(conversation_id, summary)
+
+    async def delete_summary(self, conversation_id: str) -> None:
+        await self._shard(conversation_id).delete_summary(conversation_id)
+
+    async def start(self) -> None:
+        await asyncio.gather(*(shard.start() for shard in self._shards))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(shard.close() for shard in self._shards))
+
+
+async def _move(source: ConversationStorage, target: ConversationStorage, conversation_id: str) -> bool:
+    conversation = await source.get_conversation(conversation_id)
+    if conversation is None:
+        return False
+    try:
+        await target.import_conversation(conversation)
+    except ValueError:
+        # Copied by an earlier run that stopped before deleting the original.
+        info = await target.get_conversation_info(conversation_id)
+        if info is None or info.message_count < len(conversation.messages):
+            raise
+    await source.delete_conversation(conversation_id)
+    return True
+
+
+async def rebalance(
+    shards: Sequence[ConversationStorage],
+    sources: Sequence[ConversationStorage] = (),
+    page_size: int = 500,
+) -> int:
+    """Move every conversation to the shard its ID hashes to. Returns how many were moved.
+
+    Conversations in `sources` (e.g. the single database the shards replace)
+    are all moved into the shards. Each one is copied before it is deleted,
+    so an interrupted run can simply be run again. Run it while no worker is
+    writing: a message appended during a move could be lost.
+    """
+    moved = 0
+    for storage in [*shards, *sources]:
+        cursor = None
+        while True:
+            page, cursor = await storage.list_conversations(page_size, cursor)
+            for info in page:
+                target = shards[shard_for(info.id, len(shards))]
+                if target is not storage and await _move(storage, target, info.id):
+                    moved += 1
+            if cursor is None:
+                break
+        logger.info(f"Rebalanced {type(storage).__name__}: {moved} conversation(s) moved so far.")
+    return moved
+
+
+async def _rebalance_sqlite(paths: List[str], source_paths: List[str], page_size: int) -> int:
+    from .sqlite_storage import SQLiteConversationStorage
+
+    shards = [SQLiteConversationStorage(path) for path in paths]
+    sources = [SQLiteConversationStorage(path) for path in source_paths]
+    try:
+        return await rebalance(shards, sources, page_size)
+    finally:
+        await asyncio.gather(*(storage.close() for storage in shards + sources))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Move SQLite conversations to the shard their ID hashes to.")
+    parser.add_argument("shards", nargs="+", help="Shard database files, in shard order (new shards last)")
+    parser.add_argument("--source", action="append", default=[], help="Database to drain into the shards")
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    moved = asyncio.run(_rebalance_sqlite(args.shards, args.source, args.page_size))
+    print(f"Moved {moved} conversation(s) across {len(args.shards)} shard(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# File layout:
+#   header   magic, conversation count, index offset, ID width
+#   segments one opaque blob per conversation, back to back
+#   index    fixed-width entries sorted by ID: ID (NUL-padded), segment offset and
+#            length, created/updated (epoch ns) and message count
+# The header is written last, so a file cut short by a crash never looks valid.
+_MAGIC = b"CONVSNP1"
+_HEADER = struct.Struct("<8sQQI4x")
+
+# (conversation_id, created_ns, updated_ns, message_count, segment)
+SnapshotRecord = Tuple[str, int, int, int, bytes]
+
+
+def _entry_struct(id_width: int) -> struct.Struct:
+    return struct.Struct(f"<{id_width}sQIqqI")
+
+
+def write_snapshot(path: str, records: Iterable[SnapshotRecord]) -> Tuple[int, int]:
+    """Stream `records` into a new snapshot at `path`, atomically replacing any previous one.
+
+    Only the index entries are held in memory; segments go straight to disk.
+    Returns (conversations written, file size).
+    """
+    entries: List[Tuple[bytes, int, int, int, int, int]] = []
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * _HEADER.size)
+        offset = _HEADER.size
+        for conversation_id, created_ns, updated_ns, message_count, segment in records:
+            f.write(segment)
+            entries.append((conversation_id.encode("utf-8"), offset, len(segment), created_ns, updated_ns, message_count))
+            offset += len(segment)
+        entries.sort()
+        id_width = max((len(entry[0]) for entry in entries), default=0)
+        entry_struct = _entry_struct(id_width)
+        f.write(b"".join(entry_struct.pack(*entry) for entry in entries))
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, len(entries), offset, id_width))
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.seek(0, os.SEEK_END)
+    os.replace(tmp_path, path)
+    return len(entries), size
+
+
+class SnapshotReader:
+    """Memory-mapped, lazily parsed view of a snapshot file.
+
+    Opening only maps the file and reads the header, so it takes the same
+    time whatever the snapshot's size. A lookup binary-searches the sorted
+    index in place and copies out one segment; nothing else is parsed until
+    it is asked for.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[IO[bytes]] = None
+        self._map: Optional[mmap.mmap] = None
+        self._count = 0
+        self._index_offset = 0
+        self._entry: Optional[struct.Struct] = None
+        self._id_width = 0
+        try:
+            self._file = open(path, "rb")
+        except FileNotFoundError:
+            return
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _HEADER.size:
+            self.close()
+            return
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, index_offset, id_width = _HEADER.unpack_from(self._map, 0)
+        entry = _entry_struct(id_width)
+        if magic != _MAGIC or index_offset + count * entry.size > size:
+            logger.warning(f"Ignoring invalid conversation snapshot {path}")
+            self.close()
+            return
+        self._count, self._index_offset, self._entry, self._id_width = count, index_offset, entry, id_width
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def size(self) -> int:
+        return len(self._map) if self._map is not None else 0
+
+    def _unpack(self, i: int) -> Tuple[bytes, int, int, int, int, int]:
+        return self._entry.unpack_from(self._map, self._index_offset + i * self._entry.size)
+
+    def _find(self, conversation_id: str) -> Optional[Tuple[bytes, int, int, int, int, int]]:
+        key = conversation_id.encode("utf-8")
+        if self._map is None or len(key) > self._id_width:
+            return None
+        key = key.ljust(self._id_width, b"\0")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._unpack(mid)
+            if entry[0] < key:
+                lo = mid + 1
+            elif entry[0] > key:
+                hi = mid
+            else:
+                return entry
+        return None
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return self._find(conversation_id) is not None
+
+    def segment(self, conversation_id: str) -> Optional[bytes]:
+        """Copy of the conversation's segment, or None if it isn't in the snapshot."""
+        entry = self._find(conversation_id)
+        if entry is None:
+            return None
+        return self._map[entry[1]:entry[1] + entry[2]]
+
+    def entries(self) -> Iterator[Tuple[str, int, int, int]]:
+        """Yield (conversation_id, created_ns, updated_ns, message_count) for every conversation."""
+        for i in range(self._count):
+            raw_id, _, _, created_ns, updated_ns, message_count = self._unpack(i)
+            yield raw_id.rstrip(b"\0").decode("utf-8"), created_ns, updated_ns, message_count
+
+    def records(self, exclude: set) -> Iterator[SnapshotRecord]:
+        """Yield the stored records of every conversation not in `exclude`, for carrying into a new snapshot."""
+        for i in range(self._count):
+            raw_id, offset, length, created_ns, updated_ns, message_count = self._unpack(i)
+            conversation_id = raw_id.rstrip(b"\0").decode("utf-8")
+            if conversation_id not in exclude:
+                yield conversation_id, created_ns, updated_ns, message_count, self._map[offset:offset + length]
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._count = 0
+
+
+def claim_snapshot_path(directory: str) -> Tuple[str, IO]:
+    """Lock and return the first `snapshot-<n>.bin` in `directory` no other live process holds.
+
+    Each worker keeps its own snapshot; a recycled worker takes over the slot
+    (and so the conversations) of the one it replaces. The returned lock file
+    must stay open for as long as the snapshot is in use.
+    """
+    os.makedirs(directory, exist_ok=True)
+    n = 0
+    while True:
+        lock = open(os.path.join(directory, f"snapshot-{n}.lock"), "a")
+        try:
+            # Released by the OS when the process exits.
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            n += 1
+            continue
+        return os.path.join(directory, f"snapshot-{n}.bin"), lock
@@ -0,0 +1,513 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .conversation_index import parse_query
+from .storage import Conversation, ConversationInfo, ConversationStorage, Message, StoredSummary
+from .tokens import message_tokens
+
+logger = logging.getLogger(__name__)
+
+# Statements are module-level constants so sqlite3's statement cache reuses
+# the prepared form on every call instead of re-parsing the SQL.
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS conversations (
+        id TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS messages (
+        conversation_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        tokens INTEGER
+    )""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_conversation_seq ON messages (conversation_id, seq)",
+    # Listing walks this index newest first, so it never scans the table.
+    "CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated_at, id)",
+    # Same for the oldest-first listing that exports page through.
+    "CREATE INDEX IF NOT EXISTS idx_conversations_created ON conversations (created_at, id)",
+    # Rolling summaries of each conversation's first `upto` messages.
+    """CREATE TABLE IF NOT EXISTS summaries (
+        conversation_id TEXT PRIMARY KEY,
+        upto INTEGER NOT NULL,
+        digest TEXT NOT NULL,
+        text TEXT NOT NULL
+    )""",
+    # Cross-process turn leases; expires_at is in epoch seconds.
+    """CREATE TABLE IF NOT EXISTS turn_leases (
+        conversation_id TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )""",
+)
+# Full-text index over message contents; optional, since not every SQLite build has FTS5.
+# Each row shares its message's rowid, so a conversation's rows can be deleted without a scan.
+_FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, conversation_id UNINDEXED)"
+# Token counts are stored with each message; rows from before that have NULL and are counted when read.
+_ADD_TOKENS_COLUMN_SQL = "ALTER TABLE messages ADD COLUMN tokens INTEGER"
+_FTS_BACKFILL_SQL = (
+    "INSERT INTO messages_fts (rowid, content, conversation_id) SELECT rowid, content, conversation_id FROM messages"
+)
+_INSERT_CONVERSATION_SQL = "INSERT INTO conversations (id, created_at, updated_at) VALUES (?, ?, ?)"
+_SELECT_CONVERSATION_SQL = "SELECT id, created_at, updated_at FROM conversations WHERE id = ?"
+_BUMP_CONVERSATION_SQL = (
+    "UPDATE conversations SET message_count = message_count + ?, updated_at = ? "
+    "WHERE id = ? RETURNING message_count"
+)
+_INSERT_MESSAGE_SQL = (
+    "INSERT INTO messages (conversation_id, seq, role, content, created_at, tokens) VALUES (?, ?, ?, ?, ?, ?)"
+)
+_SELECT_MESSAGES_SQL = (
+    "SELECT role, content, created_at, tokens FROM messages WHERE conversation_id = ? ORDER BY seq"
+)
+_COUNT_CONVERSATIONS_SQL = "SELECT COUNT(*) FROM conversations"
+_SELECT_MESSAGE_COUNT_SQL = "SELECT message_count FROM conversations WHERE id = ?"
+_SELECT_CONVERSATION_INFO_SQL = (
+    "SELECT id, created_at, updated_at, message_count FROM conversations WHERE id = ?"
+)
+_INDEX_MESSAGES_FTS_SQL = (
+    "INSERT INTO messages_fts (rowid, content, conversation_id) "
+    "SELECT rowid, content, conversation_id FROM messages WHERE conversation_id = ? AND seq >= ?"
+)
+_DELETE_MESSAGES_FTS_SQL = (
+    "DELETE FROM messages_fts WHERE rowid IN (SELECT rowid FROM messages WHERE conversation_id = ?)"
+)
+_DELETE_MESSAGES_SQL = "DELETE FROM messages WHERE conversation_id = ?"
+_DELETE_CONVERSATION_SQL = "DELETE FROM conversations WHERE id = ?"
+_LIST_CONVERSATIONS_SQL = (
+    "SELECT id, created_at, updated_at, message_count FROM conversations "
+    "ORDER BY updated_at DESC, id DESC LIMIT ?"
+)
+_LIST_CONVERSATIONS_AFTER_SQL = (
+    "SELECT id, created_at, updated_at, message_count FROM conversations "
+    "WHERE (updated_at, id) < (?, ?) ORDER BY updated_at DESC, id DESC LIMIT ?"
+)
+_LIST_CONVERSATIONS_BY_CREATION_SQL = (
+    "SELECT id, created_at, updated_at, message_count FROM conversations "
+    "WHERE (created_at, id) > (?, ?) ORDER BY created_at, id LIMIT ?"
+)
+# Each clause may match a different message, so clauses are intersected per conversation.
+_SEARCH_CLAUSE_SQL = "SELECT conversation_id FROM messages_fts WHERE messages_fts MATCH ?"
+_SEARCH_CONVERSATIONS_SQL = (
+    "SELECT id, created_at, updated_at, message_count FROM conversations WHERE id IN ({clauses}) "
+    "ORDER BY updated_at DESC, id DESC LIMIT ? OFFSET ?"
+)
+_INSERT_CONVERSATION_WITH_COUNT_SQL = (
+    "INSERT INTO conversations (id, created_at, updated_at, message_count) VALUES (?, ?, ?, ?)"
+)
+# The prefix is copied inside SQLite, so a fork never round-trips its messages through Python.
+_COPY_MESSAGES_SQL = (
+    "INSERT INTO messages (conversation_id, seq, role, content, created_at, tokens) "
+    "SELECT ?, seq, role, content, created_at, tokens FROM messages WHERE conversation_id = ? AND seq < ?"
+)
+_SELECT_MESSAGES_RANGE_SQL = (
+    "SELECT role, content FROM messages WHERE conversation_id = ? AND seq >= ? AND seq < ? ORDER BY seq"
+)
+# Takes the lease if it is free, expired or already the owner's; the upsert changes no row otherwise.
+_ACQUIRE_LEASE_SQL = (
+    "INSERT INTO turn_leases (conversation_id, owner, expires_at) VALUES (?, ?, ?) "
+    "ON CONFLICT (conversation_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+    "WHERE turn_leases.owner = excluded.owner OR turn_leases.expires_at < ?"
+)
+_RELEASE_LEASE_SQL = "DELETE FROM turn_leases WHERE conversation_id = ? AND owner = ?"
+_SELECT_MESSAGES_SINCE_SQL = (
+    "SELECT role, content FROM messages WHERE conversation_id = ? AND seq >= ? ORDER BY seq"
+)
+_SELECT_MESSAGES_WITH_TOKENS_SINCE_SQL = (
+    "SELECT role, content, tokens FROM messages WHERE conversation_id = ? AND seq >= ? ORDER BY seq"
+)
+# A summary only replaces one covering fewer messages, so a slower worker never rolls it back.
+_SAVE_SUMMARY_SQL = (
+    "INSERT INTO summaries (conversation_id, upto, digest, text) SELECT id, ?, ?, ? FROM conversations WHERE id = ? "
+    "ON CONFLICT (conversation_id) DO UPDATE SET upto = excluded.upto, digest = excluded.digest, text = excluded.text "
+    "WHERE excluded.upto > summaries.upto"
+)
+_SELECT_SUMMARY_SQL = "SELECT upto, digest, text FROM summaries WHERE conversation_id = ?"
+_DELETE_SUMMARY_SQL = "DELETE FROM summaries WHERE conversation_id = ?"
+
+
+class SQLiteConversationStorage(ConversationStorage):
+    """Conversation storage backed by a SQLite database in WAL mode.
+
+    All database work runs on a single dedicated thread, so the event loop
+    never blocks on disk I/O and the connection is only ever used from one
+    thread.
+
+    Writes go through a group-commit queue: appends from concurrent requests
+    are collected for up to `commit_interval` seconds (or until
+    `commit_batch_size` are waiting) and applied in one transaction with a
+    single commit. Each write still succeeds or fails on its own, and its
+    coroutine only returns once the commit holding it is done.
+
+    Listing uses an index on `updated_at`, and search an FTS5 table kept in
+    the same transaction as the messages (when SQLite is built with FTS5).
+    """
+
+    def __init__(self, db_path: str, commit_interval: float = 0.005, commit_batch_size: int = 256):
+        self._db_path = db_path
+        self._commit_interval = commit_interval
+        self._commit_batch_size = commit_batch_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-storage")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._open_lock = asyncio.Lock()
+        self._write_queue: List[Tuple] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: set = set()
+        self._fts = False
+        # Inode of the database file the connection opened, so owners can tell if it was deleted or replaced.
+        self.inode: Optional[int] = None
+        self.commits = 0
+        self.writes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"commits": self.commits, "writes": self.writes}
+
+    async def _run(self, fn, *args):
+        """Run `fn` on the storage thread, opening the database on first use."""
+        if self._conn is None:
+            async with self._open_lock:
+                if self._conn is None:
+                    await asyncio.get_running_loop().run_in_executor(self._executor, self._open_sync)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open_sync(self) -> None:
+        # isolation_level=None: we manage transactions ourselves to group commits.
+        conn = sqlite3.connect(self._db_path, isolation_level=None, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        if "tokens" not in {row[1] for row in conn.execute("PRAGMA table_info(messages)")}:
+            conn.execute(_ADD_TOKENS_COLUMN_SQL)
+        try:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+            conn.execute(_FTS_SCHEMA)
+            if not exists:
+                # Databases from before the full-text index get their messages indexed once.
+                conn.execute(_FTS_BACKFILL_SQL)
+            self._fts = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite full-text search unavailable ({e}); search_conversations is disabled.")
+        self._conn = conn
+        if self._db_path != ":memory:":
+            self.inode = os.stat(self._db_path).st_ino
+        logger.info(f"SQLite conversation storage opened at {self._db_path}")
+
+    async def _write(self, fn, *args):
+        """Queue a write for the next group commit and wait until it is committed."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._write_queue.append((fn, args, future))
+        if len(self._write_queue) >= self._commit_batch_size:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._commit_interval, self._start_flush)
+        return await future
+
+    def _start_flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._write_queue:
+            batch, self._write_queue = self._write_queue, []
+            task = asyncio.get_running_loop().create_task(self._flush(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, batch: List[Tuple]) -> None:
+        try:
+            results = await self._run(self._apply_batch_sync, [(fn, args) for fn, args, _ in batch])
+        except Exception as e:
+            logger.error(f"Error committing conversation storage batch: {e}", exc_info=True)
+            results = [e] * len(batch)
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _apply_batch_sync(self, batch: List[Tuple]) -> List:
+        """Apply a batch of writes in one transaction; each write gets its own savepoint."""
+        results = []
+        # IMMEDIATE takes the write lock up front so concurrent workers
+        # wait on busy_timeout instead of failing on lock upgrade.
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for fn, args in batch:
+                self._conn.execute("SAVEPOINT write")
+                try:
+                    results.append(fn(*args))
+                    self._conn.execute("RELEASE write")
+                except Exception as e:
+                    self._conn.execute("ROLLBACK TO write")
+                    self._conn.execute("RELEASE write")
+                    results.append(e)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            raise
+        self.commits += 1
+        self.writes += len(batch)
+        return results
+
+    def _create_conversation_sync(self, conversation_id: str, now: str) -> None:
+        self._conn.execute(_INSERT_CONVERSATION_SQL, (conversation_id, now, now))
+
+    def _add_messages_sync(self, conversation_id: str, messages: Sequence[Tuple[str, str]], now: str) -> None:
+        rows = self._conn.execute(_BUMP_CONVERSATION_SQL, (len(messages), now, conversation_id)).fetchall()
+        if not rows:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        first_seq = rows[0][0] - len(messages)
+        self._conn.executemany(
+            _INSERT_MESSAGE_SQL,
+            # Counted here, in the writer thread, so reads never tokenize.
+            [
+                (conversation_id, first_seq + i, role, content, now, message_tokens(content))
+                for i, (role, content) in enumerate(messages)
+            ],
+        )
+        if self._fts:
+            self._conn.execute(_INDEX_MESSAGES_FTS_SQL, (conversation_id, first_seq))
+
+    def _fork_conversation_sync(self, conversation_id: str, at_index: int, fork_id: str, now: str) -> None:
+        row = self._conn.execute(_SELECT_MESSAGE_COUNT_SQL, (conversation_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        if not 0 <= at_index <= row[0]:
+            raise ValueError(f"Cannot fork conversation {conversation_id} at message {at_index}")
+        self._conn.execute(_INSERT_CONVERSATION_WITH_COUNT_SQL, (fork_id, now, now, at_index))
+        self._conn.execute(_COPY_MESSAGES_SQL, (fork_id, conversation_id, at_index))
+        if self._fts:
+            self._conn.execute(_INDEX_MESSAGES_FTS_SQL, (fork_id, 0))
+
+    def _import_conversation_sync(self, conversation: Conversation) -> None:
+        try:
+            self._conn.execute(_INSERT_CONVERSATION_WITH_COUNT_SQL, (
+                conversation.id,
+                conversation.created_at.isoformat(),
+                conversation.updated_at.isoformat(),
+                len(conversation.messages),
+            ))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Conversation {conversation.id} already exists") from None
+        self._conn.executemany(_INSERT_MESSAGE_SQL, [
+            (
+                conversation.id, seq, message.role, message.content, message.timestamp.isoformat(),
+                message_tokens(message.content) if message.tokens is None else message.tokens,
+            )
+            for seq, message in enumerate(conversation.messages)
+        ])
+        if self._fts:
+            self._conn.execute(_INDEX_MESSAGES_FTS_SQL, (conversation.id, 0))
+
+    def _delete_conversation_sync(self, conversation_id: str) -> bool:
+        if self._fts:
+            self._conn.execute(_DELETE_MESSAGES_FTS_SQL, (conversation_id,))
+        self._conn.execute(_DELETE_MESSAGES_SQL, (conversation_id,))
+        self._conn.execute(_DELETE_SUMMARY_SQL, (conversation_id,))
+        return self._conn.execute(_DELETE_CONVERSATION_SQL, (conversation_id,)).rowcount > 0
+
+    def _acquire_turn_lease_sync(self, conversation_id: str, owner: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        return self._conn.execute(_ACQUIRE_LEASE_SQL, (conversation_id, owner, now + ttl_seconds, now)).rowcount > 0
+
+    def _get_conversation_sync(self, conversation_id: str) -> Optional[Conversation]:
+        row = self._conn.execute(_SELECT_CONVERSATION_SQL, (conversation_id,)).fetchone()
+        if row is None:
+            return None
+        messages = [
+            Message(role=role, content=content, timestamp=datetime.fromisoformat(created_at), tokens=tokens)
+            for role, content, created_at, tokens in self._conn.execute(_SELECT_MESSAGES_SQL, (conversation_id,))
+        ]
+        return Conversation(
+            id=row[0],
+            messages=messages,
+            created_at=datetime.fromisoformat(row[1]),
+            updated_at=datetime.fromisoformat(row[2]),
+        )
+
+    def _get_messages_sync(self, conversation_id: str) -> List[Dict]:
+        if self._conn.execute(_SELECT_CONVERSATION_SQL, (conversation_id,)).fetchone() is None:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        return [
+            {"role": role, "content": content}
+            for role, content, _, _ in self._conn.execute(_SELECT_MESSAGES_SQL, (conversation_id,))
+        ]
+
+    def _get_messages_since_sync(self, conversation_id: str, cursor: int, with_tokens: bool) -> Tuple[List[Dict], int]:
+        row = self._conn.execute(_SELECT_MESSAGE_COUNT_SQL, (conversation_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        # Range scan on (conversation_id, seq): cost is proportional to the new messages only.
+        if with_tokens:
+            messages = [
+                {"role": role, "content": content, "tokens": message_tokens(content) if tokens is None else tokens}
+                for role, content, tokens in self._conn.execute(
+                    _SELECT_MESSAGES_WITH_TOKENS_SINCE_SQL, (conversation_id, cursor)
+                )
+            ]
+            return messages, row[0]
+        messages = [
+            {"role": role, "content": content}
+            for role, content in self._conn.execute(_SELECT_MESSAGES_SINCE_SQL, (conversation_id, cursor))
+        ]
+        return messages, row[0]
+
+    def _get_messages_range_sync(self, conversation_id: str, start: int, end: int) -> Tuple[List[Dict], int]:
+        row = self._conn.execute(_SELECT_MESSAGE_COUNT_SQL, (conversation_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        messages = [
+            {"role": role, "content": content}
+            for role, content in self._conn.execute(_SELECT_MESSAGES_RANGE_SQL, (conversation_id, start, end))
+        ]
+        return messages, row[0]
+
+    def _get_conversation_info_sync(self, conversation_id: str) -> Optional[ConversationInfo]:
+        row = self._conn.execute(_SELECT_CONVERSATION_INFO_SQL, (conversation_id,)).fetchone()
+        return self._info(row) if row else None
+
+    def _list_conversations_sync(self, limit: int, cursor: Optional[str]) -> Tuple[List[ConversationInfo], Optional[str]]:
+        if cursor:
+            updated_at, conversation_id = cursor.split("|", 1)
+            rows = self._conn.execute(_LIST_CONVERSATIONS_AFTER_SQL, (updated_at, conversation_id, limit + 1)).fetchall()
+        else:
+            rows = self._conn.execute(_LIST_CONVERSATIONS_SQL, (limit + 1,)).fetchall()
+        # One extra row tells whether there is a next page.
+        next_cursor = f"{rows[limit - 1][2]}|{rows[limit - 1][0]}" if len(rows) > limit else None
+        return [self._info(row) for row in rows[:limit]], next_cursor
+
+    def _list_conversations_by_creation_sync(
+        self, limit: int, cursor: Optional[str]
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        created_at, conversation_id = cursor.split("|", 1) if cursor else ("", "")
+        rows = self._conn.execute(_LIST_CONVERSATIONS_BY_CREATION_SQL, (created_at, conversation_id, limit + 1)).fetchall()
+        next_cursor = f"{rows[limit - 1][1]}|{rows[limit - 1][0]}" if len(rows) > limit else None
+        return [self._info(row) for row in rows[:limit]], next_cursor
+
+    def _search_conversations_sync(self, query: str, limit: int, offset: int) -> Tuple[List[ConversationInfo], Optional[str]]:
+        # Tokens are re-quoted, so user input never reaches FTS5's query syntax.
+        clauses = [f'"{" ".join(tokens)}"' for tokens in parse_query(query)]
+        if not clauses:
+            return [], None
+        sql = _SEARCH_CONVERSATIONS_SQL.format(clauses=" INTERSECT ".join([_SEARCH_CLAUSE_SQL] * len(clauses)))
+        rows = self._conn.execute(sql, (*clauses, limit + 1, offset)).fetchall()
+        next_cursor = str(offset + limit) if len(rows) > limit else None
+        return [self._info(row) for row in rows[:limit]], next_cursor
+
+    @staticmethod
+    def _info(row: Tuple) -> ConversationInfo:
+        return ConversationInfo(
+            id=row[0],
+            created_at=datetime.fromisoformat(row[1]),
+            updated_at=datetime.fromisoformat(row[2]),
+            message_count=row[3],
+        )
+
+    async def create_conversation(self) -> str:
+        conversation_id = str(uuid.uuid4())
+        await self._write(self._create_conversation_sync, conversation_id, datetime.utcnow().isoformat())
+        return conversation_id
+
+    async def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
+        return await self._run(self._get_conversation_sync, conversation_id)
+
+    async def add_message(self, conversation_id: str, role: str, content: str) -> None:
+        await self.add_messages(conversation_id, [(role, content)])
+
+    async def add_messages(self, conversation_id: str, messages: Sequence[Tuple[str, str]]) -> None:
+        if messages:
+            await self._write(self._add_messages_sync, conversation_id, list(messages), datetime.utcnow().isoformat())
+
+    async def fork_conversation(self, conversation_id: str, at_index: int) -> str:
+        fork_id = str(uuid.uuid4())
+        await self._write(
+            self._fork_conversation_sync, conversation_id, at_index, fork_id, datetime.utcnow().isoformat()
+        )
+        return fork_id
+
+    async def import_conversation(self, conversation: Conversation) -> None:
+        await self._write(self._import_conversation_sync, conversation)
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        return await self._write(self._delete_conversation_sync, conversation_id)
+
+    async def acquire_turn_lease(self, conversation_id: str, owner: str, ttl_seconds: float) -> bool:
+        return await self._write(self._acquire_turn_lease_sync, conversation_id, owner, ttl_seconds)
+
+    async def release_turn_lease(self, conversation_id: str, owner: str) -> None:
+        await self._write(lambda: self._conn.execute(_RELEASE_LEASE_SQL, (conversation_id, owner)))
+
+    async def get_messages(self, conversation_id: str) -> List[Dict]:
+        return await self._run(self._get_messages_sync, conversation_id)
+
+    async def get_messages_since(
+        self, conversation_id: str, cursor: int = 0, with_tokens: bool = False
+    ) -> Tuple[List[Dict], int]:
+        return await self._run(self._get_messages_since_sync, conversation_id, cursor, with_tokens)
+
+    async def get_messages_range(self, conversation_id: str, start: int, end: int) -> Tuple[List[Dict], int]:
+        return await self._run(self._get_messages_range_sync, conversation_id, start, end)
+
+    async def get_conversation_info(self, conversation_id: str) -> Optional[ConversationInfo]:
+        return await self._run(self._get_conversation_info_sync, conversation_id)
+
+    async def count_conversations(self) -> int:
+        return await self._run(lambda: self._conn.execute(_COUNT_CONVERSATIONS_SQL).fetchone()[0])
+
+    async def list_conversations(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        return await self._run(self._list_conversations_sync, limit, cursor)
+
+    async def list_conversations_by_creation(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        return await self._run(self._list_conversations_by_creation_sync, limit, cursor)
+
+    async def search_conversations(
+        self, query: str, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        if self._conn is None:
+            await self._run(lambda: None)
+        if not self._fts:
+            return await super().search_conversations(query, limit, cursor)
+        return await self._run(self._search_conversations_sync, query, limit, int(cursor) if cursor else 0)
+
+    async def get_summary(self, conversation_id: str) -> Optional[StoredSummary]:
+        row = await self._run(lambda: self._conn.execute(_SELECT_SUMMARY_SQL, (conversation_id,)).fetchone())
+        return StoredSummary(upto=row[0], digest=row[1], text=row[2]) if row else None
+
+    async def save_summary(self, conversation_id: str, summary: StoredSummary) -> None:
+        await self._write(
+            lambda: self._conn.execute(_SAVE_SUMMARY_SQL, (summary.upto, summary.digest, summary.text, conversation_id))
+        )
+
+    async def delete_summary(self, conversation_id: str) -> None:
+        await self._write(lambda: self._conn.execute(_DELETE_SUMMARY_SQL, (conversation_id,)))
+
+    async def close(self) -> None:
+        self._start_flush()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks)
+        if self._conn is not None:
+            await self._run(self._close_sync)
+        self._executor.shutdown(wait=True)
+
+    def _close_sync(self) -> None:
+        self._conn.close()
+        self._conn = None
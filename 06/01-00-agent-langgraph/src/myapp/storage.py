@@ -1,21 +1,232 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Optional
+from array import array
+from collections import OrderedDict, deque
+from typing import Iterator, List, Dict, Optional, Sequence, Tuple, Union
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
 import uuid
-from dataclasses import dataclass
-from datetime import datetime
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 
-@dataclass
+from .conversation_index import ConversationIndex
+from .snapshot import SnapshotReader, claim_snapshot_path, write_snapshot
+from .tokens import message_tokens
+
+try:
+    import zstandard
+except ImportError:  # Optional: cold segments fall back to zlib.
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+@dataclass(slots=True)
 class Message:
     role: str
     content: str
-    timestamp: datetime = datetime.utcnow()
+    timestamp: datetime = field(default_factory=datetime.utcnow)
+    # Prompt tokens the message costs (see message_tokens); counted when stored if not given.
+    tokens: Optional[int] = None
+
+# Role names are stored as one-byte codes; unknown roles get a code on first use.
+_ROLES: List[str] = ["system", "user", "assistant", "tool"]
+_ROLE_CODES: Dict[str, int] = {role: code for code, role in enumerate(_ROLES)}
+_EPOCH = datetime(1970, 1, 1)
+# Contents up to this length are interned, so repeated short messages share one string.
+_INTERN_MAX_LENGTH = 128
+# Longest chain of forks sharing a prefix before a fork copies it instead.
+_MAX_FORK_DEPTH = 32
+
+def _to_ns(timestamp: datetime) -> int:
+    return (timestamp - _EPOCH) // timedelta(microseconds=1) * 1000
+
+def _from_ns(ns: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=ns // 1000)
+
+def _role_code(role: str) -> int:
+    code = _ROLE_CODES.get(role)
+    if code is None:
+        code = len(_ROLES)
+        _ROLES.append(role)
+        _ROLE_CODES[role] = code
+    return code
+
+class MessageLog:
+    """Append-only, column-oriented sequence of messages.
+
+    Instead of one object per message it keeps four parallel columns: role
+    codes in a byte array, UTC timestamps as epoch nanoseconds in an int64
+    array, token counts in a uint32 array, and the content strings in a list
+    (short ones interned). It behaves like a read-only list of `Message` plus
+    `append`; `Message` objects are only materialized when indexed or iterated.
+
+    `fork(n)` returns a new log that shares the first `n` messages with this
+    one instead of copying them: it only holds a reference to its parent, and
+    its own columns hold what is appended to the fork afterwards. Logs are
+    append-only, so the shared prefix never changes under either of them.
+    """
+
+    __slots__ = ("_roles", "_timestamps", "_tokens", "_contents", "_parent", "_base", "_depth")
+
+    def __init__(self, messages: Sequence[Message] = ()):
+        self._roles = array("B")
+        self._timestamps = array("q")
+        self._tokens = array("I")
+        self._contents: List[str] = []
+        # Messages [0, _base) live in _parent; the columns hold the rest.
+        self._parent: Optional["MessageLog"] = None
+        self._base = 0
+        self._depth = 0
+        for message in messages:
+            self.append(message)
+
+    def append(self, message: Message) -> None:
+        content = message.content
+        if len(content) <= _INTERN_MAX_LENGTH:
+            content = sys.intern(content)
+        self._roles.append(_role_code(message.role))
+        self._timestamps.append(_to_ns(message.timestamp))
+        self._tokens.append(message_tokens(content) if message.tokens is None else message.tokens)
+        self._contents.append(content)
+
+    def fork(self, at_index: int) -> "MessageLog":
+        """A new log sharing this log's first `at_index` messages, in O(1) time and memory."""
+        if not 0 <= at_index <= len(self):
+            raise IndexError("MessageLog fork index out of range")
+        if at_index <= self._base and self._parent is not None:
+            # The prefix lies entirely in our parent: share it directly and keep the chain short.
+            return self._parent.fork(at_index)
+        if self._depth >= _MAX_FORK_DEPTH:
+            # Forks of forks of forks...: copy the prefix once so reads don't walk a long chain.
+            return MessageLog.from_columns(*self.columns(at_index))
+        log = MessageLog()
+        if at_index:
+            log._parent = self
+            log._base = at_index
+            log._depth = self._depth + 1
+        return log
+
+    @property
+    def parent(self) -> Optional["MessageLog"]:
+        """The log this fork shares its prefix with, or None."""
+        return self._parent
+
+    def own_contents(self) -> List[str]:
+        """Contents of the messages this log holds itself, i.e. appended since the fork."""
+        return self._contents
+
+    def __len__(self) -> int:
+        return self._base + len(self._contents)
+
+    def _message(self, index: int) -> Message:
+        if index < self._base:
+            return self._parent._message(index)
+        index -= self._base
+        return Message(
+            role=_ROLES[self._roles[index]],
+            content=self._contents[index],
+            timestamp=_from_ns(self._timestamps[index]),
+            tokens=self._tokens[index],
+        )
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Message, List[Message]]:
+        if isinstance(index, slice):
+            return [self._message(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("MessageLog index out of range")
+        return self._message(index)
+
+    def __iter__(self) -> Iterator[Message]:
+        for i in range(len(self)):
+            yield self._message(i)
+
+    def __repr__(self) -> str:
+        return f"MessageLog({list(self)!r})"
+
+    def columns(self, end: Optional[int] = None) -> Tuple[List[str], List[int], List[str], List[int]]:
+        """Role names, epoch-ns timestamps, contents and token counts of the first `end` messages.
+
+        Used for serialization. Each column is sliced in one step, so this is
+        safe to call from a thread while the event loop keeps appending.
+        """
+        own_end = None if end is None else max(end - self._base, 0)
+        roles, timestamps, contents = self._roles[:own_end], self._timestamps[:own_end], self._contents[:own_end]
+        tokens = self._tokens[:own_end].tolist()
+        roles, timestamps = [_ROLES[code] for code in roles], timestamps.tolist()
+        if self._base:
+            shared = self._parent.columns(self._base if end is None else min(end, self._base))
+            return shared[0] + roles, shared[1] + timestamps, shared[2] + contents, shared[3] + tokens
+        return roles, timestamps, contents, tokens
+
+    @classmethod
+    def from_columns(
+        cls, roles: List[str], timestamps: List[int], contents: List[str], tokens: Optional[List[int]] = None
+    ) -> "MessageLog":
+        """Rebuild a log from `columns()`; token counts are recomputed if `tokens` is None."""
+        log = cls()
+        log._roles = array("B", [_role_code(role) for role in roles])
+        log._timestamps = array("q", timestamps)
+        log._tokens = array("I", [message_tokens(c) for c in contents] if tokens is None else tokens)
+        log._contents = [sys.intern(c) if len(c) <= _INTERN_MAX_LENGTH else c for c in contents]
+        return log
+
+    def dicts(self, start: int = 0, end: Optional[int] = None, with_tokens: bool = False) -> List[Dict]:
+        """OpenAI-format dicts for the messages in [start, end), without building `Message` objects.
+
+        With `with_tokens`, each dict also carries the message's stored
+        "tokens". On a fork the shared prefix comes from the parent, so the
+        cost stays linear in the number of messages returned.
+        """
+        end = len(self) if end is None else min(end, len(self))
+        dicts = self._parent.dicts(start, min(end, self._base), with_tokens) if start < self._base else []
+        roles = self._roles
+        contents = self._contents
+        base = self._base
+        if with_tokens:
+            tokens = self._tokens
+            dicts.extend(
+                {"role": _ROLES[roles[i - base]], "content": contents[i - base], "tokens": tokens[i - base]}
+                for i in range(max(start, base), end)
+            )
+            return dicts
+        dicts.extend(
+            {"role": _ROLES[roles[i - base]], "content": contents[i - base]}
+            for i in range(max(start, base), end)
+        )
+        return dicts
 
 @dataclass
 class Conversation:
     id: str
-    messages: List[Message]
-    created_at: datetime = datetime.utcnow()
-    updated_at: datetime = datetime.utcnow()
+    messages: Union[List[Message], MessageLog]
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    updated_at: datetime = field(default_factory=datetime.utcnow)
+
+@dataclass
+class ConversationInfo:
+    """A conversation's metadata, without its messages."""
+    id: str
+    created_at: datetime
+    updated_at: datetime
+    message_count: int
+
+    @property
+    def version(self) -> int:
+        # Conversations are append-only, so the message count increases with every change.
+        return self.message_count
+
+@dataclass
+class StoredSummary:
+    """A rolling summary of a conversation's first `upto` messages."""
+    upto: int
+    digest: str  # Fingerprint of the summarized messages, to tell when they changed
+    text: str
 
 class ConversationStorage(ABC):
     @abstractmethod
@@ -38,33 +249,886 @@ class ConversationStorage(ABC):
         """Get all messages from a conversation in the format expected by OpenAI."""
         pass
 
-class InMemoryConversationStorage(ConversationStorage):
+    async def add_messages(self, conversation_id: str, messages: Sequence[Tuple[str, str]]) -> None:
+        """Append several (role, content) messages to a conversation in one operation.
+
+        Backends should override this to make the append atomic and a single
+        round trip; the default just calls `add_message` for each message.
+        """
+        for role, content in messages:
+            await self.add_message(conversation_id, role, content)
+
+    async def get_messages_since(
+        self, conversation_id: str, cursor: int = 0, with_tokens: bool = False
+    ) -> Tuple[List[Dict], int]:
+        """Get the messages appended after `cursor` and the cursor to pass next time.
+
+        Conversations are append-only, so the cursor is simply the number of
+        messages already seen, and the returned cursor is the conversation's
+        total message count. With `with_tokens`, each message also carries
+        its "tokens" (see `message_tokens`). Backends should override this to
+        avoid reading the whole history, and store the token counts with the
+        messages instead of counting them on every read like the default.
+        """
+        messages = await self.get_messages(conversation_id)
+        if with_tokens:
+            return [{**m, "tokens": message_tokens(m["content"])} for m in messages[cursor:]], len(messages)
+        return messages[cursor:], len(messages)
+
+    async def get_conversation_info(self, conversation_id: str) -> Optional[ConversationInfo]:
+        """Get a conversation's metadata and version, or None if it doesn't exist.
+
+        Backends should override this to answer without reading the messages.
+        """
+        conversation = await self.get_conversation(conversation_id)
+        if conversation is None:
+            return None
+        return ConversationInfo(
+            id=conversation.id,
+            created_at=conversation.created_at,
+            updated_at=conversation.updated_at,
+            message_count=len(conversation.messages),
+        )
+
+    async def get_messages_range(self, conversation_id: str, start: int, end: int) -> Tuple[List[Dict], int]:
+        """Get the messages at positions [start, end) and the conversation's total message count.
+
+        The default reads everything from `start` on; backends should
+        override this to read only the requested range.
+        """
+        messages, total = await self.get_messages_since(conversation_id, start)
+        return messages[:max(0, end - start)], total
+
+    async def fork_conversation(self, conversation_id: str, at_index: int) -> str:
+        """Create a new conversation holding the first `at_index` messages of another and return its ID.
+
+        The fork is independent from then on: messages added to either
+        conversation don't show up in the other. The default copies the
+        messages; backends should override this to share or copy them
+        without a round trip per message.
+        """
+        messages = await self.get_messages(conversation_id)
+        if not 0 <= at_index <= len(messages):
+            raise ValueError(f"Cannot fork conversation {conversation_id} at message {at_index}")
+        fork_id = await self.create_conversation()
+        await self.add_messages(fork_id, [(m["role"], m["content"]) for m in messages[:at_index]])
+        return fork_id
+
+    async def import_conversation(self, conversation: Conversation) -> None:
+        """Store a complete conversation under its own ID, timestamps and messages.
+
+        Used to move conversations between backends. Raises ValueError if a
+        conversation with that ID already exists.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support importing conversations")
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        """Delete a conversation and its messages; returns False if it didn't exist."""
+        raise NotImplementedError(f"{type(self).__name__} does not support deleting conversations")
+
+    async def list_conversations(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        """List conversations by most recent update first, one page at a time.
+
+        Pass the returned cursor back to get the next page; it is None after
+        the last page. Backends that can't list without a scan don't
+        implement this.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support listing conversations")
+
+    async def list_conversations_by_creation(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        """List conversations oldest first by (created_at, id), paged like `list_conversations`.
+
+        A conversation's position never changes, so paging through this while
+        others write misses nothing except what is deleted meanwhile, and
+        conversations created meanwhile come last.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support listing conversations")
+
+    async def search_conversations(
+        self, query: str, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        """Find conversations whose messages contain every term and "quoted phrase" in `query`.
+
+        Results are ordered by most recent update and paged like
+        `list_conversations`.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support searching conversations")
+
+    async def acquire_turn_lease(self, conversation_id: str, owner: str, ttl_seconds: float) -> bool:
+        """Claim the conversation's turn lease for `owner` for `ttl_seconds`; False while another owner holds it.
+
+        Claiming again as the same owner extends the lease. Backends shared by
+        several workers override this so a turn excludes turns of the same
+        conversation in other processes; the default grants every claim,
+        which is enough for storage private to one process.
+        """
+        return True
+
+    async def release_turn_lease(self, conversation_id: str, owner: str) -> None:
+        """Give up a lease taken with `acquire_turn_lease`, if `owner` still holds it."""
+        pass
+
+    async def get_summary(self, conversation_id: str) -> Optional[StoredSummary]:
+        """Get the conversation's stored rolling summary, or None."""
+        return None
+
+    async def save_summary(self, conversation_id: str, summary: StoredSummary) -> None:
+        """Store a rolling summary, unless the stored one already covers as many messages.
+
+        Summaries are shared by every worker using the storage and deleted with
+        the conversation. Backends that don't override this keep none, and
+        each worker only has the summaries it made itself.
+        """
+        pass
+
+    async def delete_summary(self, conversation_id: str) -> None:
+        """Drop the conversation's summary, e.g. because the messages it covers changed."""
+        pass
+
+    async def start(self) -> None:
+        """Start any background tasks the storage needs. Called once the event loop is running."""
+        pass
+
+    async def close(self) -> None:
+        """Release any resources held by the storage (connections, files, tasks)."""
+        pass
+
+class ColdTier(ABC):
+    """Secondary store that evicted conversations are spilled to instead of being dropped."""
+
+    @abstractmethod
+    async def put(self, conversation: Conversation) -> None:
+        """Store an evicted conversation."""
+        pass
+
+    @abstractmethod
+    async def take(self, conversation_id: str) -> Optional[Conversation]:
+        """Remove a conversation from the tier and return it, or None if it isn't there."""
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        """Size of the tier: `cold_conversations` and `cold_bytes` (as stored, i.e. compressed)."""
+        return {}
+
+# First byte of a cold segment names its codec, so segments written with and
+# without zstandard installed can both be read back.
+_CODEC_ZLIB = b"z"
+_CODEC_ZSTD = b"s"
+
+def _compress_segment(conversation: Conversation, end: Optional[int] = None) -> bytes:
+    """Serialize a conversation (its first `end` messages) column by column and compress it."""
+    messages = conversation.messages
+    if not isinstance(messages, MessageLog):
+        messages = MessageLog(messages)
+    roles, timestamps, contents, tokens = messages.columns(end)
+    data = json.dumps({
+        "id": conversation.id,
+        "created_at": conversation.created_at.isoformat(),
+        "updated_at": conversation.updated_at.isoformat(),
+        "roles": roles,
+        "timestamps": timestamps,
+        "contents": contents,
+        "tokens": tokens,
+    }, ensure_ascii=False).encode("utf-8")
+    if zstandard is not None:
+        return _CODEC_ZSTD + zstandard.ZstdCompressor(level=3).compress(data)
+    return _CODEC_ZLIB + zlib.compress(data, 6)
+
+def _decompress_segment(segment: bytes) -> Conversation:
+    codec, payload = segment[:1], segment[1:]
+    if codec == _CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Cold segment is zstd-compressed but zstandard is not installed")
+        data = json.loads(zstandard.ZstdDecompressor().decompress(payload))
+    else:
+        data = json.loads(zlib.decompress(payload))
+    return Conversation(
+        id=data["id"],
+        # Segments written before token counts were stored have none; they are counted again.
+        messages=MessageLog.from_columns(data["roles"], data["timestamps"], data["contents"], data.get("tokens")),
+        created_at=datetime.fromisoformat(data["created_at"]),
+        updated_at=datetime.fromisoformat(data["updated_at"]),
+    )
+
+class CompressedMemoryColdTier(ColdTier):
+    """Cold tier that keeps each evicted conversation as a compressed blob in process memory."""
+
     def __init__(self):
-        self._conversations: Dict[str, Conversation] = {}
+        self._segments: Dict[str, bytes] = {}
+        self.cold_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"cold_conversations": len(self._segments), "cold_bytes": self.cold_bytes}
+
+    async def put(self, conversation: Conversation) -> None:
+        # zlib and zstandard release the GIL, so compressing off the loop really runs in parallel.
+        segment = await asyncio.to_thread(_compress_segment, conversation)
+        old = self._segments.get(conversation.id)
+        if old is not None:
+            self.cold_bytes -= len(old)
+        self._segments[conversation.id] = segment
+        self.cold_bytes += len(segment)
+
+    async def take(self, conversation_id: str) -> Optional[Conversation]:
+        segment = self._segments.pop(conversation_id, None)
+        if segment is None:
+            return None
+        self.cold_bytes -= len(segment)
+        return await asyncio.to_thread(_decompress_segment, segment)
+
+class DirectoryColdTier(ColdTier):
+    """Cold tier that keeps one compressed segment file per conversation in a directory."""
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # Segments left by earlier processes count too; they are still rehydrated on access.
+        self._sizes: Dict[str, int] = {
+            entry.name[:-len(".seg")]: entry.stat().st_size
+            for entry in os.scandir(directory)
+            if entry.name.endswith(".seg")
+        }
+        self.cold_bytes = sum(self._sizes.values())
+
+    def stats(self) -> Dict[str, int]:
+        return {"cold_conversations": len(self._sizes), "cold_bytes": self.cold_bytes}
+
+    def _path(self, conversation_id: str) -> str:
+        # Conversation IDs are UUIDs; basename() guards against path traversal anyway.
+        return os.path.join(self._directory, os.path.basename(conversation_id) + ".seg")
+
+    def _put_sync(self, conversation: Conversation) -> int:
+        segment = _compress_segment(conversation)
+        path = self._path(conversation.id)
+        # Written under a temporary name so a crash never leaves a truncated segment behind.
+        with open(path + ".tmp", "wb") as f:
+            f.write(segment)
+        os.replace(path + ".tmp", path)
+        return len(segment)
+
+    def _take_sync(self, conversation_id: str) -> Optional[Conversation]:
+        path = self._path(conversation_id)
+        try:
+            with open(path, "rb") as f:
+                segment = f.read()
+        except FileNotFoundError:
+            return None
+        os.remove(path)
+        return _decompress_segment(segment)
+
+    async def put(self, conversation: Conversation) -> None:
+        size = await asyncio.to_thread(self._put_sync, conversation)
+        self.cold_bytes += size - self._sizes.get(conversation.id, 0)
+        self._sizes[conversation.id] = size
+
+    async def take(self, conversation_id: str) -> Optional[Conversation]:
+        conversation = await asyncio.to_thread(self._take_sync, conversation_id)
+        self.cold_bytes -= self._sizes.pop(conversation_id, 0)
+        return conversation
+
+# Rough overheads used for the resident-size estimate: a MessageLog row costs a
+# role byte, an int64 timestamp, a uint32 token count and a list slot on top of
+# the content string.
+_CONVERSATION_OVERHEAD_BYTES = 512
+_MESSAGE_OVERHEAD_BYTES = 28
+
+# Rehydration latencies kept for the percentiles in stats().
+_LATENCY_SAMPLES = 1024
+
+def _message_size(content: str) -> int:
+    return _MESSAGE_OVERHEAD_BYTES + sys.getsizeof(content)
+
+class _ColdSpill:
+    """Moves evicted conversations to a `ColdTier`, keeping them readable while the spill is in flight."""
+
+    def __init__(self, tier: ColdTier):
+        self.tier = tier
+        # Conversations on their way to the tier, so readers don't miss them mid-spill.
+        self._spilling: Dict[str, Conversation] = {}
+
+    async def put(self, conversation: Conversation) -> None:
+        self._spilling[conversation.id] = conversation
+        try:
+            await self.tier.put(conversation)
+        finally:
+            self._spilling.pop(conversation.id, None)
+
+    async def take(self, conversation_id: str) -> Optional[Conversation]:
+        return self._spilling.get(conversation_id) or await self.tier.take(conversation_id)
+
+class _Snapshots:
+    """Per-worker snapshots of the resident conversations for warm restarts.
+
+    Every `interval` seconds the conversations changed since the last snapshot
+    are serialized off the event loop; the rest are copied over as stored
+    bytes. On `start()` the previous snapshot is memory-mapped, conversations
+    are parsed on their first access, and the listing catches up in the
+    background. Conversations spilled to a cold tier are left to that tier.
+    """
+
+    def __init__(self, directory: str, interval: float):
+        self._directory = directory
+        self._interval = interval
+        self._path: Optional[str] = None
+        self._lock_file = None
+        self._reader: Optional[SnapshotReader] = None
+        self._write_lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+        # Changed since the last snapshot, and no longer to be carried over from it.
+        self._dirty: set = set()
+        self._superseded: set = set()
+        self.loads = 0
+
+    def changed(self, conversation_id: str) -> None:
+        self._dirty.add(conversation_id)
+
+    def removed(self, conversation_id: str) -> None:
+        self._dirty.discard(conversation_id)
+        self._superseded.add(conversation_id)
+
+    def replaced(self, conversation_id: str) -> None:
+        self._superseded.discard(conversation_id)
+        self._dirty.add(conversation_id)
+
+    async def load(self, conversation_id: str) -> Optional[Conversation]:
+        if self._reader is None or conversation_id in self._superseded:
+            return None
+        segment = self._reader.segment(conversation_id)
+        if segment is None:
+            return None
+        return await asyncio.to_thread(_decompress_segment, segment)
+
+    def stats(self) -> Dict[str, int]:
+        if self._reader is None:
+            return {}
+        return {
+            "snapshot_conversations": len(self._reader),
+            "snapshot_bytes": self._reader.size,
+            "snapshot_loads": self.loads,
+        }
+
+    def _write_sync(self, captured: List[Tuple], previous: Optional[SnapshotReader], exclude: set) -> Tuple[int, int]:
+        def records():
+            for conversation, message_count in captured:
+                segment = _compress_segment(conversation, message_count)
+                yield (
+                    conversation.id,
+                    _to_ns(conversation.created_at),
+                    _to_ns(conversation.updated_at),
+                    message_count,
+                    segment,
+                )
+            if previous is not None:
+                # Unchanged conversations are copied as stored, without being parsed.
+                yield from previous.records(exclude)
+        return write_snapshot(self._path, records())
+
+    async def write(self, conversations: Dict[str, Conversation]) -> None:
+        if self._path is None:
+            return
+        async with self._write_lock:
+            dirty, self._dirty = self._dirty, set()
+            superseded, self._superseded = self._superseded, set()
+            # Message counts are captured here; the thread only ever reads up to them.
+            captured = []
+            for conversation_id in dirty:
+                conversation = conversations.get(conversation_id)
+                if conversation is not None:
+                    captured.append((
+                        Conversation(conversation.id, conversation.messages, conversation.created_at, conversation.updated_at),
+                        len(conversation.messages),
+                    ))
+            previous = self._reader
+            exclude = superseded | dirty
+            started = time.perf_counter()
+            try:
+                count, size = await asyncio.to_thread(self._write_sync, captured, previous, exclude)
+            except Exception:
+                self._dirty |= dirty
+                self._superseded |= superseded
+                raise
+            self._reader = SnapshotReader(self._path)
+            if previous is not None:
+                previous.close()
+            logger.info(
+                f"Wrote conversation snapshot: {count} conversation(s), {len(captured)} re-serialized, "
+                f"{size} bytes in {time.perf_counter() - started:.3f}s"
+            )
+
+    async def _write_loop(self, conversations: Dict[str, Conversation]) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            if not (self._dirty or self._superseded):
+                continue
+            try:
+                await self.write(conversations)
+            except Exception as e:
+                logger.error(f"Error writing conversation snapshot: {e}", exc_info=True)
+
+    async def _list(self, index: ConversationIndex) -> None:
+        """List the snapshot's conversations in the index, a chunk at a time; each becomes searchable once loaded."""
+        entries = await asyncio.to_thread(lambda: list(self._reader.entries()))
+        for first in range(0, len(entries), 256):
+            for conversation_id, created_ns, updated_ns, message_count in entries[first:first + 256]:
+                if conversation_id not in index and conversation_id not in self._superseded:
+                    index.add_listed(conversation_id, created_ns, updated_ns, message_count)
+            await asyncio.sleep(0)
+        logger.info(f"Listed {len(entries)} conversation(s) from the snapshot.")
+
+    async def start(self, conversations: Dict[str, Conversation], index: Optional[ConversationIndex]) -> None:
+        if self._path is not None:
+            return
+        started = time.perf_counter()
+        self._path, self._lock_file = await asyncio.to_thread(claim_snapshot_path, self._directory)
+        self._reader = SnapshotReader(self._path)
+        logger.info(
+            f"Opened conversation snapshot {self._path} with {len(self._reader)} conversation(s) "
+            f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+        if index is not None and len(self._reader):
+            self._tasks.append(asyncio.create_task(self._list(index)))
+        self._tasks.append(asyncio.create_task(self._write_loop(conversations)))
+
+    async def close(self, conversations: Dict[str, Conversation]) -> None:
+        if self._path is None:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.write(conversations)
+        self._reader.close()
+        self._reader = None
+        self._lock_file.close()
+        self._path = None
+
+class InMemoryConversationStorage(ConversationStorage):
+    """Keeps conversations in process memory.
+
+    Conversations are kept in least-recently-written order, so eviction is
+    O(1), and their messages in a columnar `MessageLog`; the most recently
+    read ones (up to `max_dict_views`) also keep their OpenAI-format dicts,
+    which are shared between calls and must not be mutated. `max_bytes` and
+    `ttl_seconds` evict by resident size and idle time, spilling to
+    `cold_tier` when one is given; `snapshot_dir` enables warm restarts (see
+    `_Snapshots`). Unless `indexed` is False, a `ConversationIndex` serves
+    listing and search for the resident conversations.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        cold_tier: Optional[ColdTier] = None,
+        sweep_interval: float = 60.0,
+        max_dict_views: int = 256,
+        indexed: bool = True,
+        snapshot_dir: Optional[str] = None,
+        snapshot_interval: float = 60.0,
+    ):
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._dict_views: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._max_dict_views = max_dict_views
+        self._last_write: Dict[str, float] = {}
+        self._max_bytes = max_bytes
+        self._ttl_seconds = ttl_seconds
+        self._cold = _ColdSpill(cold_tier) if cold_tier else None
+        self._sweep_interval = sweep_interval
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._index: Optional[ConversationIndex] = ConversationIndex() if indexed else None
+        # Forks referencing each shared log, and logs of removed conversations that forks still hold,
+        # whose bytes stay charged until the last of those forks is gone.
+        self._fork_refs: Dict[MessageLog, int] = {}
+        self._shared_logs: Dict[MessageLog, int] = {}
+        # Rolling summaries of resident conversations; dropped with them, since they can be made again.
+        self._summaries: Dict[str, StoredSummary] = {}
+        self._message_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rehydrations = 0
+        self._rehydration_seconds: "deque[float]" = deque(maxlen=_LATENCY_SAMPLES)
+        self._snapshots = _Snapshots(snapshot_dir, snapshot_interval) if snapshot_dir else None
+
+    def stats(self) -> Dict[str, float]:
+        stats = {
+            "conversations": len(self._conversations),
+            "resident_bytes": self.resident_bytes,
+            "index_bytes": self._index.bytes if self._index is not None else 0,
+            "shared_parent_bytes": sum(self._shared_logs.values()),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rehydrations": self.rehydrations,
+        }
+        if self._cold:
+            stats.update(self._cold.tier.stats())
+        if self._snapshots:
+            stats.update(self._snapshots.stats())
+        if self._rehydration_seconds:
+            latencies = sorted(self._rehydration_seconds)
+            stats["rehydration_ms_p50"] = round(latencies[len(latencies) // 2] * 1000, 3)
+            stats["rehydration_ms_p99"] = round(latencies[int(len(latencies) * 0.99)] * 1000, 3)
+            stats["rehydration_ms_max"] = round(latencies[-1] * 1000, 3)
+        return stats
+
+    @property
+    def resident_bytes(self) -> int:
+        """Estimated memory of the resident conversations plus the listing/search index."""
+        return self._message_bytes + (self._index.bytes if self._index is not None else 0)
+
+    def _touch(self, conversation_id: str) -> None:
+        self._conversations.move_to_end(conversation_id)
+        self._last_write[conversation_id] = time.monotonic()
+
+    def _insert(self, conversation: Conversation) -> None:
+        if not isinstance(conversation.messages, MessageLog):
+            conversation.messages = MessageLog(conversation.messages)
+        # A fork only accounts for the messages it holds itself; the shared prefix is its parent's.
+        size = _CONVERSATION_OVERHEAD_BYTES + sum(_message_size(c) for c in conversation.messages.own_contents())
+        self._conversations[conversation.id] = conversation
+        self._sizes[conversation.id] = size
+        self._last_write[conversation.id] = time.monotonic()
+        self._message_bytes += size
+        parent = conversation.messages.parent
+        if parent is not None:
+            self._fork_refs[parent] = self._fork_refs.get(parent, 0) + 1
+
+    def _remove(self, conversation_id: str) -> Conversation:
+        conversation = self._conversations.pop(conversation_id)
+        size = self._sizes.pop(conversation_id)
+        if self._fork_refs.get(conversation.messages):
+            # Forks still read their prefix from this log, so its memory stays in use and charged.
+            self._shared_logs[conversation.messages] = size
+        else:
+            self._message_bytes -= size
+            self._release_log(conversation.messages.parent)
+        self._dict_views.pop(conversation_id, None)
+        self._summaries.pop(conversation_id, None)
+        del self._last_write[conversation_id]
+        return conversation
+
+    def _release_log(self, log: Optional[MessageLog]) -> None:
+        """Drop one fork's reference to a shared log, uncharging it once no fork or conversation holds it."""
+        while log is not None:
+            refs = self._fork_refs[log] - 1
+            if refs:
+                self._fork_refs[log] = refs
+                return
+            del self._fork_refs[log]
+            size = self._shared_logs.pop(log, None)
+            if size is None:
+                return  # Still a resident conversation's log.
+            self._message_bytes -= size
+            log = log.parent
+
+    async def _evict(self, conversation_id: str) -> None:
+        conversation = self._remove(conversation_id)
+        if self._snapshots:
+            self._snapshots.removed(conversation_id)
+        if self._index is not None:
+            if self._cold:
+                # Still listed, but only searchable again once rehydrated, so the index shrinks with the memory.
+                self._index.drop_postings(conversation_id)
+            else:
+                # Dropped for good, so it must stop showing up in listings.
+                self._index.remove(conversation_id)
+        if self._cold:
+            await self._cold.put(conversation)
+
+    async def _enforce_budget(self, keep_id: str) -> None:
+        if self._max_bytes is None:
+            return
+        while self.resident_bytes > self._max_bytes and len(self._conversations) > 1:
+            oldest_id = next(iter(self._conversations))
+            if oldest_id == keep_id:
+                break
+            await self._evict(oldest_id)
+            self.evictions += 1
+
+    async def _lookup(self, conversation_id: str) -> Optional[Conversation]:
+        """Find a resident conversation, rehydrating it from the cold tier or the snapshot if needed."""
+        conversation = self._conversations.get(conversation_id)
+        if conversation or not (self._cold or self._snapshots):
+            return conversation
+        started = time.perf_counter()
+        from_snapshot = False
+        if self._cold:
+            conversation = await self._cold.take(conversation_id)
+        if conversation is None and self._snapshots:
+            conversation = await self._snapshots.load(conversation_id)
+            from_snapshot = conversation is not None
+        # Another task may have rehydrated it while we were waiting on the tier.
+        if conversation_id in self._conversations:
+            return self._conversations[conversation_id]
+        if conversation:
+            self._insert(conversation)
+            self.rehydrations += 1
+            if from_snapshot:
+                self._snapshots.loads += 1
+            elif self._snapshots:
+                # Back from the cold tier: the next snapshot has to write it out again.
+                self._snapshots.changed(conversation_id)
+            if self._index is not None:
+                if conversation_id not in self._index:
+                    # Spilled by an earlier process, so this one never indexed it.
+                    self._index_conversation(conversation)
+                else:
+                    # Its postings were dropped when it left memory.
+                    self._index.restore_postings(conversation_id, conversation.messages.columns()[2])
+            self._rehydration_seconds.append(time.perf_counter() - started)
+            await self._enforce_budget(keep_id=conversation_id)
+        return conversation
+
+    def _index_conversation(self, conversation: Conversation) -> None:
+        self._index.add_conversation(conversation.id, _to_ns(conversation.created_at), _to_ns(conversation.created_at))
+        self._index.add_messages(
+            conversation.id, conversation.messages.columns()[2], _to_ns(conversation.updated_at)
+        )
 
     async def create_conversation(self) -> str:
         conversation_id = str(uuid.uuid4())
-        self._conversations[conversation_id] = Conversation(
+        conversation = Conversation(
             id=conversation_id,
-            messages=[]
+            messages=MessageLog()
         )
+        self._insert(conversation)
+        if self._snapshots:
+            self._snapshots.changed(conversation_id)
+        if self._index is not None:
+            created_ns = _to_ns(conversation.created_at)
+            self._index.add_conversation(conversation_id, created_ns, created_ns)
+        await self._enforce_budget(keep_id=conversation_id)
         return conversation_id
 
     async def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
-        return self._conversations.get(conversation_id)
+        return await self._lookup(conversation_id)
 
     async def add_message(self, conversation_id: str, role: str, content: str) -> None:
-        conversation = self._conversations.get(conversation_id)
+        await self.add_messages(conversation_id, [(role, content)])
+
+    async def add_messages(self, conversation_id: str, messages: Sequence[Tuple[str, str]]) -> None:
+        conversation = await self._lookup(conversation_id)
+        if not conversation:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        if not messages:
+            return
+
+        # No awaits between the appends, so other tasks never see a partial batch.
+        now = datetime.utcnow()
+        for role, content in messages:
+            conversation.messages.append(Message(role=role, content=content, timestamp=now))
+            size = _message_size(content)
+            self._sizes[conversation_id] += size
+            self._message_bytes += size
+        conversation.updated_at = now
+        self._touch(conversation_id)
+        if self._snapshots:
+            self._snapshots.changed(conversation_id)
+        if self._index is not None:
+            self._index.add_messages(conversation_id, [content for _, content in messages], _to_ns(now))
+        await self._enforce_budget(keep_id=conversation_id)
+
+    async def _dict_view(self, conversation_id: str) -> List[Dict]:
+        """Return the cached OpenAI-format view, converting only messages added since last time."""
+        conversation = await self._lookup(conversation_id)
         if not conversation:
             raise ValueError(f"Conversation {conversation_id} not found")
-        
-        message = Message(role=role, content=content)
-        conversation.messages.append(message)
-        conversation.updated_at = datetime.utcnow()
+
+        view = self._dict_views.pop(conversation_id, None) or []
+        if len(view) < len(conversation.messages):
+            view.extend(conversation.messages.dicts(len(view)))
+        self._dict_views[conversation_id] = view
+        if len(self._dict_views) > self._max_dict_views:
+            self._dict_views.popitem(last=False)
+        return view
 
     async def get_messages(self, conversation_id: str) -> List[Dict]:
-        conversation = self._conversations.get(conversation_id)
+        return list(await self._dict_view(conversation_id))
+
+    async def get_messages_since(
+        self, conversation_id: str, cursor: int = 0, with_tokens: bool = False
+    ) -> Tuple[List[Dict], int]:
+        conversation = await self._lookup(conversation_id)
+        if not conversation:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        # Straight from the columns: cost is proportional to the new messages only.
+        return conversation.messages.dicts(cursor, with_tokens=with_tokens), len(conversation.messages)
+
+    async def get_messages_range(self, conversation_id: str, start: int, end: int) -> Tuple[List[Dict], int]:
+        conversation = await self._lookup(conversation_id)
         if not conversation:
             raise ValueError(f"Conversation {conversation_id} not found")
-        
-        return [{"role": msg.role, "content": msg.content} for msg in conversation.messages] 
\ No newline at end of file
+        return conversation.messages.dicts(start, end), len(conversation.messages)
+
+    async def get_conversation_info(self, conversation_id: str) -> Optional[ConversationInfo]:
+        conversation = await self._lookup(conversation_id)
+        if not conversation:
+            return None
+        return ConversationInfo(
+            id=conversation.id,
+            created_at=conversation.created_at,
+            updated_at=conversation.updated_at,
+            message_count=len(conversation.messages),
+        )
+
+    async def fork_conversation(self, conversation_id: str, at_index: int) -> str:
+        conversation = await self._lookup(conversation_id)
+        if not conversation:
+            raise ValueError(f"Conversation {conversation_id} not found")
+        if not 0 <= at_index <= len(conversation.messages):
+            raise ValueError(f"Cannot fork conversation {conversation_id} at message {at_index}")
+        now = datetime.utcnow()
+        fork = Conversation(
+            id=str(uuid.uuid4()),
+            messages=conversation.messages.fork(at_index),
+            created_at=now,
+            updated_at=now,
+        )
+        self._insert(fork)
+        if self._snapshots:
+            self._snapshots.changed(fork.id)
+        if self._index is not None:
+            if fork.messages.parent is None:
+                # The prefix was copied (or is empty), so index it as a conversation of its own.
+                self._index_conversation(fork)
+            else:
+                # Searches find the shared prefix through the parent's postings: O(1), not O(prefix).
+                self._index.add_fork(fork.id, conversation_id, at_index, _to_ns(now))
+        await self._enforce_budget(keep_id=fork.id)
+        return fork.id
+
+    async def import_conversation(self, conversation: Conversation) -> None:
+        if await self._lookup(conversation.id):
+            raise ValueError(f"Conversation {conversation.id} already exists")
+        conversation = Conversation(
+            id=conversation.id,
+            messages=MessageLog(conversation.messages),
+            created_at=conversation.created_at,
+            updated_at=conversation.updated_at,
+        )
+        self._insert(conversation)
+        if self._snapshots:
+            self._snapshots.replaced(conversation.id)
+        if self._index is not None:
+            self._index_conversation(conversation)
+        await self._enforce_budget(keep_id=conversation.id)
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        # Looked up first so a copy in the cold tier or the snapshot goes too.
+        if not await self._lookup(conversation_id):
+            return False
+        self._remove(conversation_id)
+        if self._snapshots:
+            self._snapshots.removed(conversation_id)
+        if self._index is not None:
+            self._index.remove(conversation_id)
+        return True
+
+    def _indexed_info(self, conversation_id: str) -> ConversationInfo:
+        created_ns, updated_ns, message_count = self._index.get(conversation_id)
+        return ConversationInfo(
+            id=conversation_id,
+            created_at=_from_ns(created_ns),
+            updated_at=_from_ns(updated_ns),
+            message_count=message_count,
+        )
+
+    async def list_conversations(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        if self._index is None:
+            return await super().list_conversations(limit, cursor)
+        position = None
+        if cursor:
+            updated_ns, conversation_id = cursor.split(":", 1)
+            position = (int(updated_ns), conversation_id)
+        conversation_ids, next_position = self._index.list(limit, position)
+        next_cursor = f"{next_position[0]}:{next_position[1]}" if next_position else None
+        return [self._indexed_info(conversation_id) for conversation_id in conversation_ids], next_cursor
+
+    async def list_conversations_by_creation(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        if self._index is None:
+            return await super().list_conversations_by_creation(limit, cursor)
+        position = None
+        if cursor:
+            created_ns, conversation_id = cursor.split(":", 1)
+            position = (int(created_ns), conversation_id)
+        conversation_ids, next_position = self._index.list_by_creation(limit, position)
+        next_cursor = f"{next_position[0]}:{next_position[1]}" if next_position else None
+        return [self._indexed_info(conversation_id) for conversation_id in conversation_ids], next_cursor
+
+    async def search_conversations(
+        self, query: str, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        if self._index is None:
+            return await super().search_conversations(query, limit, cursor)
+        conversation_ids, next_offset = self._index.search(query, limit, int(cursor) if cursor else 0)
+        next_cursor = str(next_offset) if next_offset is not None else None
+        return [self._indexed_info(conversation_id) for conversation_id in conversation_ids], next_cursor
+
+    async def get_summary(self, conversation_id: str) -> Optional[StoredSummary]:
+        return self._summaries.get(conversation_id)
+
+    async def save_summary(self, conversation_id: str, summary: StoredSummary) -> None:
+        if conversation_id not in self._conversations:
+            return
+        current = self._summaries.get(conversation_id)
+        if current is None or summary.upto > current.upto:
+            self._summaries[conversation_id] = summary
+
+    async def delete_summary(self, conversation_id: str) -> None:
+        self._summaries.pop(conversation_id, None)
+
+    async def sweep_expired(self) -> int:
+        """Evict every conversation idle for longer than the TTL. Returns how many were evicted."""
+        if self._ttl_seconds is None:
+            return 0
+        cutoff = time.monotonic() - self._ttl_seconds
+        expired = []
+        # Oldest writes come first, so stop at the first live conversation.
+        for conversation_id in self._conversations:
+            if self._last_write[conversation_id] > cutoff:
+                break
+            expired.append(conversation_id)
+        evicted = 0
+        for conversation_id in expired:
+            # Spills yield to the loop, so a candidate may have been deleted, evicted or written to meanwhile.
+            if conversation_id in self._conversations and self._last_write[conversation_id] <= cutoff:
+                await self._evict(conversation_id)
+                self.expirations += 1
+                evicted += 1
+        return evicted
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._sweep_interval)
+            try:
+                expired = await self.sweep_expired()
+                if expired:
+                    logger.info(f"Expired {expired} idle conversation(s); {self.stats()}")
+            except Exception as e:
+                logger.error(f"Error sweeping expired conversations: {e}", exc_info=True)
+
+    async def snapshot(self) -> None:
+        """Write the snapshot now, re-serializing only conversations changed since the last one."""
+        if self._snapshots:
+            await self._snapshots.write(self._conversations)
+
+    async def start(self) -> None:
+        if self._ttl_seconds is not None and self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+        if self._snapshots:
+            await self._snapshots.start(self._conversations, self._index)
+
+    async def close(self) -> None:
+        if self._sweep_task:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+        if self._snapshots:
+            await self._snapshots.close(self._conversations)
@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from .config import SUMMARY_SYSTEM_PROMPT
+from .storage import ConversationStorage, StoredSummary
+
+logger = logging.getLogger(__name__)
+
+# (previous summary or None, messages to fold in) -> new summary text.
+SummarizeFn = Callable[[Optional[str], List[BaseMessage]], Awaitable[str]]
+
+_SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def _covers(summary: "ConversationSummary", history: List[BaseMessage]) -> bool:
+    return summary.upto <= len(history) and _range_digest(history[:summary.upto]) == summary.digest
+
+
+def _range_digest(messages: List[BaseMessage]) -> str:
+    """Fingerprint of a range of messages, used to detect that a summarized range changed."""
+    digest = hashlib.sha256()
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        digest.update(f"{message.type}\x00{content}\x00".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ChatModelSummarizer:
+    """Summarizes messages with a LangChain chat model (e.g. the app's ChatOpenAI instance)."""
+
+    def __init__(self, chat_model):
+        self._chat_model = chat_model
+
+    async def __call__(self, previous_summary: Optional[str], messages: List[BaseMessage]) -> str:
+        transcript = "\n".join(f"{message.type}: {message.content}" for message in messages)
+        prompt = f"Existing summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+        response = await self._chat_model.ainvoke(
+            [SystemMessage(content=SUMMARY_SYSTEM_PROMPT), HumanMessage(content=prompt)]
+        )
+        return response.content
+
+
+@dataclass
+class ConversationSummary:
+    upto: int  # Number of leading history messages the summary replaces
+    digest: str  # _range_digest of those messages
+    text: str
+    message: SystemMessage
+    tokens: Optional[int] = None  # Filled in (once) by the history window
+
+
+class RollingSummarizer:
+    """Compacts older turns of long conversations into a stored summary, off the request path.
+
+    `GraphHistoryCache` calls `current` on each load; once the unsummarized
+    part of a conversation exceeds `summarize_after_tokens`, a background
+    task folds everything but the last `keep_recent` messages into the
+    conversation's summary with `summarize`. Loaders then send the summary
+    plus the recent tail instead of the full history.
+
+    `summarize` is any async callable `(previous_summary, messages) -> str`,
+    so tests can pass a local stub instead of `ChatModelSummarizer`. System
+    messages are never summarized; the history window keeps them as they are.
+
+    Summaries are saved through the conversation storage, so every worker
+    uses and extends the same one; this worker keeps the ones it uses in an
+    LRU of `max_conversations`. Storage is only asked once the tail has
+    grown past the threshold, i.e. before summarizing, so a summary another
+    worker already made is picked up instead of made again. A summary
+    records a digest of the range it covers and is dropped, in the storage
+    too, when that range changes.
+    """
+
+    def __init__(
+        self,
+        summarize: SummarizeFn,
+        summarize_after_tokens: int = 4000,
+        keep_recent: int = 6,
+        max_conversations: int = 4096,
+    ):
+        self._summarize = summarize
+        self._summarize_after_tokens = summarize_after_tokens
+        self._keep_recent = keep_recent
+        self._max_conversations = max_conversations
+        self._summaries: "OrderedDict[str, ConversationSummary]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.summaries_created = 0
+        self.summaries_invalidated = 0
+        self.failures = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "summaries": len(self._summaries),
+            "in_progress": len(self._tasks),
+            "summaries_created": self.summaries_created,
+            "summaries_invalidated": self.summaries_invalidated,
+            "failures": self.failures,
+        }
+
+    async def current(
+        self,
+        storage: ConversationStorage,
+        conversation_id: str,
+        history: List[BaseMessage],
+        tokens: Sequence[int],
+        validate: bool = False,
+    ) -> Optional[ConversationSummary]:
+        """The summary to send with `history` (token counts per message in `tokens`), or None.
+
+        Starts a background summarization once the unsummarized tail has grown
+        past the threshold. With `validate` (a history freshly read from
+        storage), a summary held here is checked against the messages it covers.
+        """
+        summary = self._summaries.get(conversation_id)
+        if summary is not None and (summary.upto > len(history) or (validate and not _covers(summary, history))):
+            await self.invalidate(storage, conversation_id)
+            summary = None
+        unsummarized = sum(tokens[summary.upto if summary else 0:])
+        if unsummarized < self._summarize_after_tokens or conversation_id in self._tasks:
+            return summary
+        stored = await storage.get_summary(conversation_id)
+        if stored is not None and (summary is None or stored.upto > summary.upto):
+            if stored.upto <= len(history) and _range_digest(history[:stored.upto]) == stored.digest:
+                # Made by another worker (or before this one started).
+                summary = self._remember(conversation_id, stored)
+                unsummarized = sum(tokens[summary.upto:])
+            else:
+                await self.invalidate(storage, conversation_id)
+                summary = None
+        if unsummarized >= self._summarize_after_tokens:
+            self._schedule(storage, conversation_id, history, summary)
+        return summary
+
+    async def invalidate(self, storage: ConversationStorage, conversation_id: str) -> None:
+        """Drop the conversation's summary here and in the storage."""
+        task = self._tasks.pop(conversation_id, None)
+        if task is not None:
+            task.cancel()
+        self._summaries.pop(conversation_id, None)
+        await storage.delete_summary(conversation_id)
+        self.summaries_invalidated += 1
+        logger.info(f"Summary for conversation {conversation_id} invalidated.")
+
+    def _remember(self, conversation_id: str, stored: StoredSummary) -> ConversationSummary:
+        summary = ConversationSummary(
+            upto=stored.upto,
+            digest=stored.digest,
+            text=stored.text,
+            message=SystemMessage(content=_SUMMARY_PREFIX + stored.text),
+        )
+        self._summaries[conversation_id] = summary
+        self._summaries.move_to_end(conversation_id)
+        if len(self._summaries) > self._max_conversations:
+            self._summaries.popitem(last=False)
+        return summary
+
+    def _schedule(
+        self,
+        storage: ConversationStorage,
+        conversation_id: str,
+        history: List[BaseMessage],
+        previous: Optional[ConversationSummary],
+    ) -> None:
+        start = previous.upto if previous else 0
+        upto = len(history) - self._keep_recent
+        if upto <= start:
+            return
+        task = asyncio.create_task(self._run(storage, conversation_id, history, previous, start, upto))
+        self._tasks[conversation_id] = task
+        task.add_done_callback(lambda t: self._forget_task(conversation_id, t))
+
+    def _forget_task(self, conversation_id: str, task: asyncio.Task) -> None:
+        if self._tasks.get(conversation_id) is task:
+            del self._tasks[conversation_id]
+
+    async def _run(
+        self,
+        storage: ConversationStorage,
+        conversation_id: str,
+        history: List[BaseMessage],
+        previous: Optional[ConversationSummary],
+        start: int,
+        upto: int,
+    ) -> None:
+        # `history` is only ever appended to, so the range stays stable while we await the model.
+        messages = [m for m in history[start:upto] if not isinstance(m, SystemMessage)]
+        try:
+            text = await self._summarize(previous.text if previous else None, messages)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Error summarizing conversation {conversation_id}: {e}", exc_info=True)
+            return
+        stored = StoredSummary(upto=upto, digest=_range_digest(history[:upto]), text=text)
+        self._remember(conversation_id, stored)
+        try:
+            await storage.save_summary(conversation_id, stored)
+        except Exception as e:
+            # Still used by this worker; the others summarize for themselves.
+            logger.error(f"Error storing the summary of conversation {conversation_id}: {e}", exc_info=True)
+        self.summaries_created += 1
+        logger.info(f"Summarized {upto} message(s) of conversation {conversation_id}.")
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,31 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Every chat message costs a few tokens of framing on top of its content.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """Count the tokens in `text` with tiktoken, or estimate ~4 characters per token without it."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # tiktoken missing, or its encoding file can't be downloaded: fall back to the estimate.
+            logger.warning(f"tiktoken unavailable ({e}); estimating token counts.")
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+def message_tokens(content: str) -> int:
+    """Tokens a message with `content` takes up in a prompt, framing included.
+
+    Storage backends record this for every message when it is added, so the
+    history window never has to tokenize a conversation again.
+    """
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .storage import ConversationStorage
+
+logger = logging.getLogger(__name__)
+
+TURN_POLICIES = ("queue", "reject", "cancel")
+# How often a queued turn retries a lease held by another worker.
+LEASE_POLL_SECONDS = 0.1
+
+
+class ConversationBusyError(Exception):
+    """Raised when a turn can't start because another turn of the same conversation is running."""
+
+    def __init__(self, conversation_id: str):
+        super().__init__(f"Conversation {conversation_id} is busy with another turn")
+        self.conversation_id = conversation_id
+
+
+class _Stripe:
+    __slots__ = ("lock", "holder", "waiters")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # (conversation_id, task) of the running turn and of the turns waiting for this stripe.
+        self.holder: Optional[Tuple[str, asyncio.Task]] = None
+        self.waiters: List[Tuple[str, asyncio.Task]] = []
+
+
+class TurnLocks:
+    """Serializes chat turns per conversation within a worker, using a fixed set of striped locks.
+
+    A turn (load history, call the model, store the reply) holds the stripe
+    its conversation hashes to, so two turns of one conversation never
+    interleave and memory doesn't grow with the number of conversations.
+    When a turn arrives while the same conversation already has one,
+    `policy` decides:
+
+        queue   wait for it (up to `wait_timeout` seconds, then busy)
+        reject  raise ConversationBusyError at once (the handlers answer 409)
+        cancel  cancel the older turn(s) and run the new one
+
+    Unrelated conversations that share a stripe always queue.
+
+    The stripes only cover one process. With `leases` (a storage shared by
+    the workers), a turn that holds its stripe also takes the conversation's
+    lease in the storage, valid for `lease_seconds` and renewed while the
+    turn runs, so turns of one conversation are serialized across workers
+    too. A turn of another worker can't be cancelled, so under "cancel" a
+    turn waits for it as under "queue"; "reject" and `wait_timeout` apply as
+    in-process. The lease of a crashed worker expires after `lease_seconds`.
+    """
+
+    def __init__(
+        self,
+        stripes: int = 1024,
+        policy: str = "queue",
+        wait_timeout: Optional[float] = None,
+        leases: Optional[ConversationStorage] = None,
+        lease_seconds: float = 30.0,
+    ):
+        if policy not in TURN_POLICIES:
+            raise ValueError(f"Unknown turn policy '{policy}', expected one of {', '.join(TURN_POLICIES)}")
+        self._stripes = [_Stripe() for _ in range(max(1, stripes))]
+        self.policy = policy
+        self._wait_timeout = wait_timeout
+        self._leases = leases
+        self._lease_seconds = lease_seconds
+        self.turns = 0
+        self.contended = 0
+        self.stripe_collisions = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.lease_contended = 0
+        self.leases_lost = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "turn_stripes": len(self._stripes),
+            "turns_running": sum(1 for stripe in self._stripes if stripe.holder is not None),
+            "turns_waiting": sum(len(stripe.waiters) for stripe in self._stripes),
+            "turns": self.turns,
+            "turns_contended": self.contended,
+            "turn_stripe_collisions": self.stripe_collisions,
+            "turns_rejected": self.rejected,
+            "turns_cancelled": self.cancelled,
+            "turns_timed_out": self.timed_out,
+            "turn_leases_contended": self.lease_contended,
+            "turn_leases_lost": self.leases_lost,
+            "turn_wait_seconds_total": round(self._wait_seconds, 6),
+            "turn_wait_seconds_max": round(self._max_wait_seconds, 6),
+        }
+
+    def _stripe(self, conversation_id: str) -> _Stripe:
+        return self._stripes[hash(conversation_id) % len(self._stripes)]
+
+    def busy(self, conversation_id: str) -> bool:
+        """Whether a turn of this conversation is running or waiting in this worker."""
+        stripe = self._stripe(conversation_id)
+        turns = ([stripe.holder] if stripe.holder else []) + stripe.waiters
+        return any(turn_id == conversation_id for turn_id, _ in turns)
+
+    def check(self, conversation_id: str) -> None:
+        """Raise ConversationBusyError now if `turn()` would reject this conversation.
+
+        For streaming handlers, which take the lock inside the response body
+        but must pick the status code before it starts.
+        """
+        if self.policy == "reject" and self.busy(conversation_id):
+            self.rejected += 1
+            raise ConversationBusyError(conversation_id)
+
+    async def _acquire_lease(self, conversation_id: str, owner: str, started: float) -> None:
+        """Wait for the conversation's lease, held by a turn in another worker, applying the policy."""
+        if await self._leases.acquire_turn_lease(conversation_id, owner, self._lease_seconds):
+            return
+        self.lease_contended += 1
+        while True:
+            if self.policy == "reject":
+                self.rejected += 1
+                raise ConversationBusyError(conversation_id)
+            if self._wait_timeout is not None and time.perf_counter() - started >= self._wait_timeout:
+                self.timed_out += 1
+                raise ConversationBusyError(conversation_id)
+            await asyncio.sleep(LEASE_POLL_SECONDS)
+            if await self._leases.acquire_turn_lease(conversation_id, owner, self._lease_seconds):
+                return
+
+    async def _renew_lease(self, conversation_id: str, owner: str) -> None:
+        """Extend the lease while the turn runs, so only a crashed worker's lease expires."""
+        while True:
+            await asyncio.sleep(self._lease_seconds / 3)
+            try:
+                if not await self._leases.acquire_turn_lease(conversation_id, owner, self._lease_seconds):
+                    self.leases_lost += 1
+                    logger.warning(f"Turn lease of conversation {conversation_id} expired and was taken by another worker")
+                    return
+            except Exception as e:
+                logger.error(f"Error renewing the turn lease of conversation {conversation_id}: {e}")
+
+    async def _release_lease(self, conversation_id: str, owner: str, renewal: asyncio.Task) -> None:
+        renewal.cancel()
+        try:
+            await self._leases.release_turn_lease(conversation_id, owner)
+        except Exception as e:
+            # Left to expire after lease_seconds.
+            logger.error(f"Error releasing the turn lease of conversation {conversation_id}: {e}")
+
+    @asynccontextmanager
+    async def turn(self, conversation_id: str) -> AsyncIterator[None]:
+        """Hold the conversation's stripe for the duration of one turn, applying the policy."""
+        stripe = self._stripe(conversation_id)
+        if stripe.lock.locked():
+            self.contended += 1
+            if not self.busy(conversation_id):
+                self.stripe_collisions += 1
+            elif self.policy == "reject":
+                self.rejected += 1
+                raise ConversationBusyError(conversation_id)
+            elif self.policy == "cancel":
+                # Newest turn wins: the running turn and any queued ones give way.
+                for turn_id, task in ([stripe.holder] if stripe.holder else []) + stripe.waiters:
+                    if turn_id == conversation_id and not task.done():
+                        task.cancel(f"Superseded by a newer turn of conversation {conversation_id}")
+                        self.cancelled += 1
+                        logger.info(f"Cancelled an older turn of conversation {conversation_id}")
+
+        waiter = (conversation_id, asyncio.current_task())
+        stripe.waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(self._wait_timeout):
+                await stripe.lock.acquire()
+        except TimeoutError:
+            self.timed_out += 1
+            raise ConversationBusyError(conversation_id) from None
+        finally:
+            stripe.waiters.remove(waiter)
+        stripe.holder = waiter
+        owner = renewal = None
+        try:
+            if self._leases is not None:
+                # The stripe stays held while another worker's turn finishes, so this worker's turns keep their order.
+                owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+                await self._acquire_lease(conversation_id, owner, started)
+                renewal = asyncio.create_task(self._renew_lease(conversation_id, owner))
+            waited = time.perf_counter() - started
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+            self.turns += 1
+            yield
+        finally:
+            try:
+                if renewal is not None:
+                    await self._release_lease(conversation_id, owner, renewal)
+            finally:
+                stripe.holder = None
+                stripe.lock.release()
@@ -0,0 +1,334 @@
+"""Persistent Chroma index, updated incrementally when its source changes.
+
+Each index lives in `<index_dir>/<key>-<source>/`, where the key hashes what
+the vectors depend on (the splitter parameters and the embedding model) and
+`<source>` is the start of the source file's SHA-256. Each chunk is stored
+under the SHA-256 of its content, and `manifest.json` records the source's
+SHA-256 and the chunk hashes. A worker that finds the directory for the
+current source opens it without embedding anything. Otherwise one worker,
+under a file lock, splits the new source, copies the most recent index for
+the same key into a staging directory, diffs the chunk hashes there and
+embeds only the chunks that are new, deleting the ones that are gone; the
+others wait and then open the result.
+
+An index directory is never changed once it is in place: the staging
+directory is renamed to its final name when it is complete, so workers of a
+previous deploy keep reading their own index untouched. Every process that
+opens an index holds a shared lock on its `.readers` file, and the builder
+only prunes the directories it can lock exclusively, i.e. that nobody reads.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import IO, Dict, List, Optional
+
+from langchain_community.document_loaders import TextLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import Chroma
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of a persisted index changes, so old ones are rebuilt.
+INDEX_FORMAT = 2
+COLLECTION_NAME = "movies"
+MANIFEST_FILE = "manifest.json"
+# Shared-locked by every process reading an index (must match gunicorn.conf.py).
+READERS_FILE = ".readers"
+_STAGING_PREFIX = ".staging-"
+# Records in the source are split apart before chunking, so an edit only re-chunks its own record.
+SECTION_SEPARATOR = "\n---\n"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_manifest(chunk_size: int, chunk_overlap: int, embedding_model: str) -> Dict:
+    """Everything a stored vector depends on besides its chunk's content."""
+    return {
+        "format": INDEX_FORMAT,
+        "splitter": {
+            "type": "RecursiveCharacterTextSplitter",
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "section_separator": SECTION_SEPARATOR,
+        },
+        "embedding_model": embedding_model,
+    }
+
+
+def _manifest_key(manifest: Dict) -> str:
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_id(doc) -> str:
+    """SHA-256 of a chunk's metadata and text: its id in the collection."""
+    digest = hashlib.sha256(json.dumps(doc.metadata, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(doc.page_content.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _chunk_ids(docs: List) -> List[str]:
+    ids = []
+    seen: Dict[str, int] = {}
+    for doc in docs:
+        digest = chunk_id(doc)
+        # A chunk repeated verbatim is stored once per occurrence.
+        seen[digest] = seen.get(digest, 0) + 1
+        ids.append(digest if seen[digest] == 1 else f"{digest}-{seen[digest]}")
+    return ids
+
+
+def _read_manifest(path: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(path: str, manifest: Dict) -> None:
+    tmp = os.path.join(path, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, MANIFEST_FILE))
+
+
+def _remove_manifest(path: str) -> None:
+    try:
+        os.remove(os.path.join(path, MANIFEST_FILE))
+    except FileNotFoundError:
+        pass
+
+
+def _chroma(path: str, embeddings) -> Chroma:
+    return Chroma(collection_name=COLLECTION_NAME, embedding_function=embeddings, persist_directory=path)
+
+
+def _complete(stored: Optional[Dict], manifest: Dict, vector_store: Chroma) -> bool:
+    """Whether `stored` is a manifest for these parameters that the collection matches."""
+    if stored is None or not isinstance(stored.get("chunks"), list):
+        return False
+    if {k: v for k, v in stored.items() if k not in ("source_sha256", "chunks")} != manifest:
+        return False
+    count = vector_store._collection.count()
+    if count != len(stored["chunks"]):
+        logger.warning(f"Vector index holds {count} chunks, its manifest lists {len(stored['chunks'])}.")
+        return False
+    return True
+
+
+# Reader locks this process holds, by index path; kept open for as long as the process runs.
+_readers: Dict[str, IO] = {}
+
+
+def _hold(path: str) -> bool:
+    """Take a shared lock on the index at `path`; False if it was pruned meanwhile."""
+    if path in _readers:
+        return True
+    try:
+        reader = open(os.path.join(path, READERS_FILE), "a")
+    except FileNotFoundError:
+        return False
+    fcntl.flock(reader.fileno(), fcntl.LOCK_SH)
+    if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        # Pruned while we waited for the lock.
+        reader.close()
+        return False
+    _readers[path] = reader
+    return True
+
+
+def _release(path: str) -> None:
+    reader = _readers.pop(path, None)
+    if reader is not None:
+        reader.close()
+
+
+def _open_index(path: str, manifest: Dict, source_sha256: str, embeddings) -> Optional[Chroma]:
+    """The persisted index at `path` if it is complete and built from this source, else None.
+
+    The index is held for this process (see `_hold`) so no builder prunes it.
+    """
+    stored = _read_manifest(path)
+    if stored is None or stored.get("source_sha256") != source_sha256 or not _hold(path):
+        return None
+    vector_store = _chroma(path, embeddings)
+    if _complete(stored, manifest, vector_store):
+        return vector_store
+    _release(path)
+    return None
+
+
+def split_source(source_path: str, chunk_size: int, chunk_overlap: int) -> List:
+    """The chunks the index holds for `source_path`, chunked record by record."""
+    sections, metadatas = [], []
+    for document in TextLoader(source_path, encoding="utf-8").load():
+        for section in document.page_content.split(SECTION_SEPARATOR):
+            if section.strip():
+                sections.append(section)
+                metadatas.append(document.metadata)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return splitter.create_documents(sections, metadatas=metadatas)
+
+
+def _discard(path: str, embeddings) -> None:
+    """Clear an unfinished or inconsistent build at `path` before rebuilding it."""
+    logger.warning(f"Discarding incomplete vector index {path}.")
+    _remove_manifest(path)
+    try:
+        # Through Chroma, which caches its client per directory.
+        _chroma(path, embeddings).delete_collection()
+    except Exception:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _latest_index(index_dir: str, key: str, manifest: Dict) -> Optional[str]:
+    """The most recently built index for these parameters (any source), to start an update from."""
+    latest, latest_mtime = None, 0.0
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        # `<key>` alone is the layout from before indexes were kept per source.
+        if name != key and not name.startswith(f"{key}-"):
+            continue
+        stored = _read_manifest(path)
+        if stored is None or {k: v for k, v in stored.items() if k not in ("source_sha256", "chunks")} != manifest:
+            continue
+        mtime = os.path.getmtime(os.path.join(path, MANIFEST_FILE))
+        if mtime > latest_mtime:
+            latest, latest_mtime = path, mtime
+    return latest
+
+
+def _prune(index_dir: str, keep: str) -> None:
+    """Remove the other indexes and staging directories that no process reads. Called under the build lock."""
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if name == keep or not os.path.isdir(path):
+            continue
+        if name.startswith(_STAGING_PREFIX):
+            # Left by a builder that died; only the lock holder writes staging directories.
+            shutil.rmtree(path, ignore_errors=True)
+            continue
+        try:
+            reader = open(os.path.join(path, READERS_FILE), "r")
+        except FileNotFoundError:
+            if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+                # From before reader locks, so there is no telling whether it is in use.
+                logger.info(f"Keeping vector index {path}; remove it once no worker of a previous deploy uses it.")
+            else:
+                shutil.rmtree(path, ignore_errors=True)
+            continue
+        with reader:
+            try:
+                fcntl.flock(reader.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info(f"Keeping outdated vector index {path} while workers still read it.")
+                continue
+            # Readers waiting for the lock find no manifest and look elsewhere.
+            _remove_manifest(path)
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info(f"Removed outdated vector index {path}.")
+
+
+def _build(path: str, docs: List, ids: List[str], embeddings) -> Chroma:
+    return Chroma.from_documents(docs, embeddings, ids=ids, collection_name=COLLECTION_NAME, persist_directory=path)
+
+
+def _update(path: str, docs: List, ids: List[str], manifest: Dict, embeddings) -> Chroma:
+    """Bring the collection at `path` to exactly `ids`, embedding only the chunks it lacks."""
+    vector_store = _chroma(path, embeddings)
+    stored = _read_manifest(path)
+    if _complete(stored, manifest, vector_store):
+        previous = stored["chunks"]
+    else:
+        # No trustworthy manifest (an interrupted build or update): ask the collection.
+        previous = vector_store._collection.get(include=[])["ids"]
+    _remove_manifest(path)
+
+    wanted = set(ids)
+    present = set(previous)
+    removed = [chunk for chunk in previous if chunk not in wanted]
+    added = [i for i, chunk in enumerate(ids) if chunk not in present]
+    logger.info(f"Updating vector index {path}: {len(added)} new, {len(removed)} removed, "
+                f"{len(ids) - len(added)} unchanged chunks.")
+    if removed:
+        vector_store.delete(ids=removed)
+    if added:
+        vector_store.add_documents([docs[i] for i in added], ids=[ids[i] for i in added])
+    if vector_store._collection.count() != len(ids):
+        logger.warning(f"Vector index {path} doesn't match its source after the update; rebuilding it.")
+        _discard(path, embeddings)
+        vector_store = _build(path, docs, ids, embeddings)
+    return vector_store
+
+
+def load_or_build_index(
+    source_path: str,
+    index_dir: str,
+    embeddings,
+    embedding_model: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+) -> Optional[Chroma]:
+    """Open the persisted index for this source, first building or updating it if needed.
+
+    Returns None if the source has no content to index.
+    """
+    manifest = index_manifest(chunk_size, chunk_overlap, embedding_model)
+    key = _manifest_key(manifest)
+    source_sha256 = file_sha256(source_path)
+    name = f"{key}-{source_sha256[:16]}"
+    path = os.path.join(index_dir, name)
+
+    started = time.perf_counter()
+    vector_store = _open_index(path, manifest, source_sha256, embeddings)
+    if vector_store is not None:
+        logger.info(f"Loaded vector index {path} in {(time.perf_counter() - started) * 1000:.1f} ms.")
+        return vector_store
+
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, ".lock"), "a") as lock:
+        # Workers booting together queue here; only the first one embeds.
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        vector_store = _open_index(path, manifest, source_sha256, embeddings)
+        if vector_store is not None:
+            logger.info(f"Loaded vector index {path} built by another worker.")
+            return vector_store
+
+        docs = split_source(source_path, chunk_size, chunk_overlap)
+        if not docs:
+            logger.error(f"No documents to index from {source_path}.")
+            return None
+        ids = _chunk_ids(docs)
+        staging = os.path.join(index_dir, _STAGING_PREFIX + name)
+        shutil.rmtree(staging, ignore_errors=True)
+        base = _latest_index(index_dir, key, manifest)
+        if base is not None:
+            # Snapshots and reader locks belong to the base; the manifest is written once the update is done.
+            shutil.copytree(base, staging, ignore=shutil.ignore_patterns("snapshot-*", READERS_FILE, MANIFEST_FILE))
+            _update(staging, docs, ids, manifest, embeddings)
+        else:
+            logger.info(f"Building vector index {path} from {len(docs)} chunks of {source_path}.")
+            _build(staging, docs, ids, embeddings)
+        _write_manifest(staging, {**manifest, "source_sha256": source_sha256, "chunks": ids})
+        if os.path.isdir(path):
+            # Complete but inconsistent (see _complete), so nobody could have opened it.
+            _discard(path, embeddings)
+            shutil.rmtree(path, ignore_errors=True)
+        os.rename(staging, path)
+        vector_store = _open_index(path, manifest, source_sha256, embeddings)
+        logger.info(f"Vector index {path} ready in {time.perf_counter() - started:.1f} s.")
+        _prune(index_dir, keep=name)
+        return vector_store
@@ -1,17 +1,61 @@
+import hashlib
 import logging
 import os
+import shutil
+import sys
+from typing import Optional
+
 from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 
+from .embedding_cache import CachedEmbeddings
+from .numpy_store import NumpyVectorStore
+from .vector_index import load_or_build_index
+
 logger = logging.getLogger(__name__)
 
-def initialize_vector_store(embeddings_api_key: str):
+EMBEDDING_MODEL = "text-embedding-3-small"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+def _embeddings(embeddings_api_key: str, embedding_cache_path: str = None):
+    logger.info(f"Initializing embeddings with model '{EMBEDDING_MODEL}'.")
+    embeddings = OpenAIEmbeddings(
+        openai_api_key=embeddings_api_key, # Use the passed API key
+        model=EMBEDDING_MODEL
+    )
+    if embedding_cache_path:
+        embeddings = CachedEmbeddings(embeddings, embedding_cache_path, model=EMBEDDING_MODEL)
+    return embeddings
+
+def initialize_vector_store(
+    embeddings_api_key: str,
+    index_dir: str = None,
+    embedding_cache_path: str = None,
+    snapshot_path: str = None,
+    store: str = "chroma",
+):
     """
     Initializes the vector store with movie data using TextLoader and Chroma.
     Constructs an absolute path to 'movies.txt' relative to this file.
+    With `index_dir`, the index is persisted there and only re-embedded when
+    movies.txt, the splitter settings or the embedding model change.
+    With `embedding_cache_path`, embeddings (documents and queries) are
+    cached in that SQLite file, shared with other workers and scripts.
+    With `snapshot_path` (written by `preload_vector_store`), the vectors are
+    memory-mapped from the snapshot into a NumpyVectorStore instead.
+    With `store="numpy"`, queries are answered by exact search over a
+    NumpyVectorStore copy of the vectors; the persisted index stays Chroma.
     """
+    if snapshot_path:
+        try:
+            vector_store = NumpyVectorStore.load(snapshot_path, _embeddings(embeddings_api_key, embedding_cache_path))
+            logger.info(f"Attached to the shared vector index {snapshot_path} ({len(vector_store)} chunks).")
+            return vector_store
+        except Exception as e:
+            logger.error(f"Error attaching to the shared vector index {snapshot_path}, loading it per worker: {e}")
     try:
         # Determine the absolute path to 'movies.txt'
         # This assumes 'movies.txt' is in the same directory as this manager.
@@ -38,6 +82,21 @@ def initialize_vector_store(embeddings_api_key: str):
                     return None
 
 
+        embeddings = _embeddings(embeddings_api_key, embedding_cache_path)
+
+        if index_dir:
+            vector_store = load_or_build_index(
+                movies_file_path, index_dir, embeddings, EMBEDDING_MODEL, CHUNK_SIZE, CHUNK_OVERLAP
+            )
+            if vector_store is None:
+                return None
+            if store == "numpy":
+                vector_store = NumpyVectorStore.from_chroma(vector_store)
+                logger.info(f"NumPy vector store initialized with {len(vector_store)} chunks.")
+                return vector_store
+            logger.info("Chroma vector store initialized successfully.")
+            return vector_store
+
         logger.info(f"Loading documents from: {movies_file_path}")
         loader = TextLoader(movies_file_path, encoding="utf-8")
         documents = loader.load()
@@ -46,18 +105,16 @@ def initialize_vector_store(embeddings_api_key: str):
             logger.error(f"No documents loaded from {movies_file_path}. Check the file content and permissions.")
             return None
 
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
         docs = text_splitter.split_documents(documents)
 
         if not docs:
             logger.error(f"No documents to process after text splitting from {movies_file_path}.")
             return None
 
-        logger.info(f"Initializing embeddings with model 'text-embedding-3-small'.")
-        embeddings = OpenAIEmbeddings(
-            openai_api_key=embeddings_api_key, # Use the passed API key
-            model="text-embedding-3-small"
-        )
+        if store == "numpy":
+            logger.info(f"Creating NumPy vector store from {len(docs)} documents.")
+            return NumpyVectorStore.from_documents(docs, embeddings)
 
         logger.info(f"Creating Chroma vector store from {len(docs)} documents.")
         vector_store = Chroma.from_documents(docs, embeddings)
@@ -66,3 +123,46 @@ def initialize_vector_store(embeddings_api_key: str):
     except Exception as e:
         logger.error(f"Error initializing vector store: {e}", exc_info=True)
         return None
+
+
+def preload_vector_store(embeddings_api_key: str, index_dir: str, embedding_cache_path: str = None) -> Optional[str]:
+    """
+    Builds or loads the persisted index and exports it as a NumpyVectorStore
+    snapshot next to it, for workers to memory-map. Returns the snapshot's
+    path, or None if there is no index.
+    """
+    vector_store = initialize_vector_store(embeddings_api_key, index_dir, embedding_cache_path)
+    if vector_store is None:
+        return None
+    index_path = vector_store._persist_directory
+    snapshot = NumpyVectorStore.from_chroma(vector_store)
+    # Named after its content (chunk ids are content hashes), so a running worker's snapshot is never rewritten.
+    digest = hashlib.sha256("\n".join(sorted(snapshot._ids)).encode("utf-8")).hexdigest()[:16]
+    name = f"snapshot-{digest}"
+    path = os.path.join(index_path, name)
+    if not os.path.isdir(path):
+        snapshot.save(path)
+        logger.info(f"Exported {len(snapshot)} chunks to the shared vector index {path}.")
+    for other in os.listdir(index_path):
+        if other.startswith("snapshot-") and other != name:
+            # Workers still mapping an old snapshot keep reading it until they exit.
+            shutil.rmtree(os.path.join(index_path, other), ignore_errors=True)
+    return path
+
+def main() -> None:
+    """Preloads the index for gunicorn's master and prints the snapshot path (see gunicorn.conf.py)."""
+    from dotenv import load_dotenv
+
+    load_dotenv(override=True)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    path = preload_vector_store(
+        os.getenv("OPENAI_KEY"),
+        os.getenv("VECTOR_INDEX_DIR") or "vector_index",
+        os.getenv("EMBEDDING_CACHE_PATH", "embeddings.db"),
+    )
+    if path is None:
+        sys.exit(1)
+    print(os.path.abspath(path))
+
+if __name__ == "__main__":
+    main()
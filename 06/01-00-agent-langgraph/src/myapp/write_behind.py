@@ -0,0 +1,427 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .storage import Conversation, ConversationInfo, ConversationStorage, Message, StoredSummary
+from .tokens import message_tokens
+
+logger = logging.getLogger(__name__)
+
+# IDs already confirmed to exist in the backend, so appends to them skip the lookup.
+_MAX_KNOWN_IDS = 100_000
+
+
+class WriteBehindConversationStorage(ConversationStorage):
+    """Write-behind queue and journal in front of any `ConversationStorage`.
+
+    `add_message`/`add_messages` only record the messages in memory and
+    return; a background task appends them to a JSONL journal, fsyncs it in
+    batches every `flush_interval` seconds, then applies them to the backend.
+    Reads merge the not-yet-applied messages into the backend's answer, so a
+    caller always sees its own writes.
+
+    Each worker process claims its own `journal-<n>.jsonl` in `journal_dir`
+    with an exclusive file lock. On `start()` it replays whatever the
+    journal's previous owner (e.g. a recycled worker) never acknowledged.
+
+    A batch the backend fails to apply stays queued and in the journal, and
+    is retried with exponential backoff (`retry_delay` doubling up to
+    `max_retry_delay`); later batches of the same conversation wait behind
+    it, those of other conversations don't. Acknowledgements cover the
+    applied prefix of the journal plus the batches applied beyond it, and
+    the journal is only truncated once nothing in it is left unapplied. A
+    `ValueError` from the backend (e.g. the conversation was deleted) can't
+    be fixed by retrying, so that batch is dropped.
+
+    Creating a conversation is passed straight through, since the backend
+    assigns the ID. Messages written in the last `flush_interval` before a
+    crash can be lost, and a crash between applying a batch and journaling
+    its acknowledgement replays that batch once more.
+    """
+
+    def __init__(
+        self,
+        backend: ConversationStorage,
+        journal_dir: str,
+        flush_interval: float = 0.01,
+        retry_delay: float = 0.5,
+        max_retry_delay: float = 30.0,
+    ):
+        self._backend = backend
+        self._journal_dir = journal_dir
+        self._journal_path: Optional[str] = None
+        self._flush_interval = flush_interval
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._journal = None
+        self._seq = 0
+        # Journal records waiting to be written, and journaled records waiting to be applied, in seq order.
+        self._unjournaled: List[Dict] = []
+        self._unapplied: List[Dict] = []
+        self._journaled_seq = 0
+        # Every seq up to _acked is applied; _done holds the seqs applied beyond it.
+        self._acked = 0
+        self._done: set = set()
+        # The last ack record journaled, so an unchanged one isn't written again.
+        self._last_ack: Optional[Dict] = None
+        # Conversations whose front batch failed: (consecutive failures, monotonic time of the next attempt).
+        self._retry: Dict[str, Tuple[int, float]] = {}
+        # Messages not yet applied to the backend, per conversation, in order.
+        self._pending: Dict[str, List[Message]] = {}
+        # Held while a conversation's pending messages are applied, so readers never see them twice.
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._known_ids: set = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self.applied_batches = 0
+        self.failed_batches = 0
+        self.dropped_batches = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending_conversations": len(self._pending),
+            "pending_messages": sum(len(messages) for messages in self._pending.values()),
+            "retrying_conversations": len(self._retry),
+            "applied_batches": self.applied_batches,
+            "failed_batches": self.failed_batches,
+            "dropped_batches": self.dropped_batches,
+        }
+
+    # --- Journal -----------------------------------------------------------------
+
+    def _claim_journal_sync(self) -> None:
+        """Open and lock the first journal file no other live process holds."""
+        os.makedirs(self._journal_dir, exist_ok=True)
+        n = 0
+        while True:
+            path = os.path.join(self._journal_dir, f"journal-{n}.jsonl")
+            journal = open(path, "a+", encoding="utf-8")
+            try:
+                # Released by the OS when the process exits, so a recycled worker's journal is free again.
+                fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                journal.close()
+                n += 1
+                continue
+            self._journal, self._journal_path = journal, path
+            return
+
+    def _write_journal_sync(self, records: List[Dict]) -> None:
+        self._journal.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _truncate_journal_sync(self) -> None:
+        self._journal.truncate(0)
+        os.fsync(self._journal.fileno())
+
+    def _read_unacknowledged_sync(self) -> Tuple[List[Dict], int, set, int]:
+        """Return the batches never acknowledged as applied, the last ack with its done seqs, and the highest seq."""
+        batches: List[Dict] = []
+        acked, done = 0, []
+        self._journal.seek(0)
+        for line in self._journal:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from a crash mid-write; it was never acknowledged to anyone.
+                logger.warning(f"Skipping unreadable journal line in {self._journal_path}")
+                continue
+            if "ack" in record:
+                # Acks only grow, and each one lists every batch applied beyond its prefix.
+                if record["ack"] >= acked:
+                    acked, done = record["ack"], record.get("done", [])
+            else:
+                batches.append(record)
+        last_seq = max([acked] + [b["seq"] for b in batches])
+        done = set(done)
+        return [b for b in batches if b["seq"] > acked and b["seq"] not in done], acked, done, last_seq
+
+    async def _replay(self) -> None:
+        await asyncio.to_thread(self._claim_journal_sync)
+        batches, self._acked, self._done, last_seq = await asyncio.to_thread(self._read_unacknowledged_sync)
+        self._seq = self._journaled_seq = last_seq
+        for batch in batches:
+            conversation_id = batch["conversation_id"]
+            self._pending.setdefault(conversation_id, []).extend(
+                Message(role=role, content=content) for role, content in batch["messages"]
+            )
+            self._remember(conversation_id)
+        self._unapplied = batches
+        # Applies what it can; anything the backend refuses for now stays queued, and in the journal.
+        await self._flush()
+        if not self._unapplied:
+            await asyncio.to_thread(self._truncate_journal_sync)
+        if batches:
+            logger.info(
+                f"Replayed {len(batches) - len(self._unapplied)} of {len(batches)} journaled write batch(es) "
+                f"into {type(self._backend).__name__}."
+            )
+
+    # --- Background flushing ------------------------------------------------------
+
+    def _next_retry_in(self) -> Optional[float]:
+        """Seconds until the earliest failed batch is due for another attempt, or None if none is queued."""
+        if not self._retry:
+            return None
+        return max(0.0, min(retry_at for _, retry_at in self._retry.values()) - time.monotonic())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), self._next_retry_in())
+            except asyncio.TimeoutError:
+                pass
+            await asyncio.sleep(self._flush_interval)
+            self._flush_wakeup.clear()
+            try:
+                # Shielded so close() cancelling the loop never interrupts a batch half-applied.
+                await asyncio.shield(self._flush())
+            except Exception as e:
+                logger.error(f"Error flushing write-behind journal: {e}", exc_info=True)
+
+    async def _flush(self, retry_now: Optional[str] = None) -> None:
+        async with self._flush_lock:
+            await self._flush_locked(retry_now)
+
+    async def _flush_locked(self, retry_now: Optional[str] = None) -> None:
+        """Journal the new batches, apply every batch that isn't backing off, then acknowledge.
+
+        `retry_now` names a conversation to retry at once, whatever its backoff.
+        """
+        records, self._unjournaled = self._unjournaled, []
+        if records:
+            await asyncio.to_thread(self._write_journal_sync, records)
+            self._journaled_seq = records[-1]["seq"]
+            self._unapplied.extend(records)
+
+        now = time.monotonic()
+        # A conversation's batches are applied in order, so one that must wait holds back the rest.
+        waiting = {c for c, (_, retry_at) in self._retry.items() if retry_at > now and c != retry_now}
+        remaining: List[Dict] = []
+        for record in self._unapplied:
+            conversation_id = record["conversation_id"]
+            if conversation_id in waiting:
+                remaining.append(record)
+                continue
+            async with self._locks[conversation_id]:
+                try:
+                    await self._backend.add_messages(conversation_id, [tuple(m) for m in record["messages"]])
+                    self.applied_batches += 1
+                except ValueError as e:
+                    self.dropped_batches += 1
+                    logger.error(f"Dropping write-behind batch {record['seq']} for conversation {conversation_id}: {e}")
+                except Exception as e:
+                    self.failed_batches += 1
+                    failures = self._retry.get(conversation_id, (0, 0.0))[0] + 1
+                    delay = min(self._max_retry_delay, self._retry_delay * 2 ** (failures - 1))
+                    self._retry[conversation_id] = (failures, now + delay)
+                    waiting.add(conversation_id)
+                    remaining.append(record)
+                    logger.warning(
+                        f"Failed to apply write-behind batch for conversation {conversation_id}, "
+                        f"retrying in {delay:.2f}s: {e}"
+                    )
+                    continue
+                self._retry.pop(conversation_id, None)
+                self._settle(record)
+        self._unapplied = remaining
+        await self._acknowledge()
+
+    def _settle(self, record: Dict) -> None:
+        """Mark a journaled batch as done and drop its messages from the pending ones. Call under its lock."""
+        conversation_id = record["conversation_id"]
+        self._done.add(record["seq"])
+        pending = self._pending.get(conversation_id, [])
+        del pending[:len(record["messages"])]
+        if not pending:
+            self._pending.pop(conversation_id, None)
+            self._locks.pop(conversation_id, None)
+
+    async def _acknowledge(self) -> None:
+        if not self._unapplied:
+            if self._acked < self._journaled_seq or self._done:
+                # Everything journaled is in the backend: the journal can start over.
+                await asyncio.to_thread(self._truncate_journal_sync)
+                self._acked, self._done, self._last_ack = self._journaled_seq, set(), None
+            return
+        # Only the contiguous prefix counts as acknowledged; later batches that got through are listed.
+        self._acked = self._unapplied[0]["seq"] - 1
+        self._done = {seq for seq in self._done if seq > self._acked}
+        ack = {"ack": self._acked, "done": sorted(self._done)}
+        if ack != self._last_ack:
+            await asyncio.to_thread(self._write_journal_sync, [ack])
+            self._last_ack = ack
+
+    # --- ConversationStorage --------------------------------------------------------
+
+    def _remember(self, conversation_id: str) -> None:
+        if len(self._known_ids) >= _MAX_KNOWN_IDS:
+            self._known_ids.clear()
+        self._known_ids.add(conversation_id)
+
+    async def create_conversation(self) -> str:
+        conversation_id = await self._backend.create_conversation()
+        self._remember(conversation_id)
+        return conversation_id
+
+    async def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
+        if conversation_id not in self._pending:
+            return await self._backend.get_conversation(conversation_id)
+        async with self._locks[conversation_id]:
+            conversation = await self._backend.get_conversation(conversation_id)
+            pending = list(self._pending.get(conversation_id, []))
+        if conversation is None or not pending:
+            return conversation
+        # Never extend the backend's own message list; it may be its live state.
+        return Conversation(
+            id=conversation.id,
+            messages=list(conversation.messages) + pending,
+            created_at=conversation.created_at,
+            updated_at=pending[-1].timestamp,
+        )
+
+    async def get_conversation_info(self, conversation_id: str) -> Optional[ConversationInfo]:
+        if conversation_id not in self._pending:
+            return await self._backend.get_conversation_info(conversation_id)
+        async with self._locks[conversation_id]:
+            info = await self._backend.get_conversation_info(conversation_id)
+            pending = self._pending.get(conversation_id, [])
+            if info is None or not pending:
+                return info
+            return ConversationInfo(
+                id=info.id,
+                created_at=info.created_at,
+                updated_at=pending[-1].timestamp,
+                message_count=info.message_count + len(pending),
+            )
+
+    async def add_message(self, conversation_id: str, role: str, content: str) -> None:
+        await self.add_messages(conversation_id, [(role, content)])
+
+    async def add_messages(self, conversation_id: str, messages: Sequence[Tuple[str, str]]) -> None:
+        if not messages:
+            return
+        if conversation_id not in self._known_ids and conversation_id not in self._pending:
+            # One backend lookup per unknown ID, so bad IDs still fail fast.
+            if await self._backend.get_conversation_info(conversation_id) is None:
+                raise ValueError(f"Conversation {conversation_id} not found")
+            self._remember(conversation_id)
+        self._seq += 1
+        self._unjournaled.append({
+            "seq": self._seq,
+            "conversation_id": conversation_id,
+            "messages": [[role, content] for role, content in messages],
+        })
+        self._pending.setdefault(conversation_id, []).extend(
+            Message(role=role, content=content) for role, content in messages
+        )
+        self._flush_wakeup.set()
+
+    async def get_messages(self, conversation_id: str) -> List[Dict]:
+        messages, _ = await self.get_messages_since(conversation_id, 0)
+        return messages
+
+    async def get_messages_since(
+        self, conversation_id: str, cursor: int = 0, with_tokens: bool = False
+    ) -> Tuple[List[Dict], int]:
+        if conversation_id not in self._pending:
+            messages, next_cursor = await self._backend.get_messages_since(conversation_id, cursor, with_tokens)
+            self._remember(conversation_id)
+            return messages, next_cursor
+        async with self._locks[conversation_id]:
+            messages, backend_cursor = await self._backend.get_messages_since(conversation_id, cursor, with_tokens)
+            pending = [{"role": m.role, "content": m.content} for m in self._pending.get(conversation_id, [])]
+        if with_tokens:
+            # Not stored yet, so counted here; the backend counts them again when it stores them.
+            for message in pending:
+                message["tokens"] = message_tokens(message["content"])
+        if backend_cursor < cursor:
+            # The cursor already points into the pending messages.
+            skip = cursor - backend_cursor
+            return pending[skip:], backend_cursor + len(pending)
+        return messages + pending, backend_cursor + len(pending)
+
+    async def fork_conversation(self, conversation_id: str, at_index: int) -> str:
+        if conversation_id in self._pending:
+            # The prefix may include queued messages; the backend has to hold them before it can fork.
+            await self._flush(retry_now=conversation_id)
+            if conversation_id in self._pending:
+                raise RuntimeError(f"Conversation {conversation_id} has writes the backend hasn't accepted yet")
+        fork_id = await self._backend.fork_conversation(conversation_id, at_index)
+        self._remember(fork_id)
+        return fork_id
+
+    async def import_conversation(self, conversation: Conversation) -> None:
+        await self._backend.import_conversation(conversation)
+        self._remember(conversation.id)
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        if conversation_id in self._pending:
+            # Otherwise the queued messages would be applied to a conversation that no longer exists.
+            async with self._flush_lock:
+                self._unjournaled = [r for r in self._unjournaled if r["conversation_id"] != conversation_id]
+                for record in [r for r in self._unapplied if r["conversation_id"] == conversation_id]:
+                    self._unapplied.remove(record)
+                    self._done.add(record["seq"])
+                self._pending.pop(conversation_id, None)
+                self._locks.pop(conversation_id, None)
+                self._retry.pop(conversation_id, None)
+        self._known_ids.discard(conversation_id)
+        return await self._backend.delete_conversation(conversation_id)
+
+    async def list_conversations(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        # Served by the backend's index, so messages still in the queue show up within one flush interval.
+        return await self._backend.list_conversations(limit, cursor)
+
+    async def list_conversations_by_creation(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        return await self._backend.list_conversations_by_creation(limit, cursor)
+
+    async def search_conversations(
+        self, query: str, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationInfo], Optional[str]]:
+        return await self._backend.search_conversations(query, limit, cursor)
+
+    async def acquire_turn_lease(self, conversation_id: str, owner: str, ttl_seconds: float) -> bool:
+        return await self._backend.acquire_turn_lease(conversation_id, owner, ttl_seconds)
+
+    async def release_turn_lease(self, conversation_id: str, owner: str) -> None:
+        await self._backend.release_turn_lease(conversation_id, owner)
+
+    async def get_summary(self, conversation_id: str) -> Optional[StoredSummary]:
+        return await self._backend.get_summary(conversation_id)
+
+    async def save_summary(self, conversation_id: str, summary: StoredSummary) -> None:
+        await self._backend.save_summary(conversation_id, summary)
+
+    async def delete_summary(self, conversation_id: str) -> None:
+        await self._backend.delete_summary(conversation_id)
+
+    async def start(self) -> None:
+        await self._backend.start()
+        await self._replay()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        # Waits for a flush already in progress, then drains whatever is left.
+        if self._journal is not None:
+            await self._flush()
+            if self._unapplied:
+                logger.warning(f"Leaving {len(self._unapplied)} unapplied batch(es) in {self._journal_path} for replay.")
+            self._journal.close()
+            self._journal = None
+        await self._backend.close()
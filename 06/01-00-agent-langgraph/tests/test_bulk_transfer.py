@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+import pytest
+
+from myapp.bulk_transfer import _resume_point, export_ndjson, import_ndjson
+from myapp.storage import InMemoryConversationStorage
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def collect(lines):
+    return [line async for line in lines]
+
+
+async def chunks(data, size=7):
+    # Small chunks, so lines are split across them.
+    for first in range(0, len(data), size):
+        yield data[first:first + size]
+
+
+async def populated(count):
+    storage = InMemoryConversationStorage()
+    ids = []
+    for n in range(count):
+        conversation_id = await storage.create_conversation()
+        await storage.add_messages(conversation_id, [("user", f"question {n}"), ("assistant", f"answer {n}")])
+        ids.append(conversation_id)
+    return storage, ids
+
+
+def test_export_and_import_round_trip():
+    async def scenario():
+        source, ids = await populated(5)
+        lines = await collect(export_ndjson(source, page_size=2))
+        records = [json.loads(line) for line in lines]
+        assert [r["type"] for r in records] == ["conversation"] * 2 + ["cursor"] + ["conversation"] * 2 + ["cursor"] + [
+            "conversation", "end"
+        ]
+        assert [r["id"] for r in records if r["type"] == "conversation"] == ids
+        assert records[-1]["conversations"] == 5
+
+        target = InMemoryConversationStorage()
+        await target.import_conversation((await source.get_conversation(ids[0])))
+        counts = await import_ndjson(target, chunks("".join(lines).encode("utf-8")))
+        assert counts == {"imported": 4, "skipped": 1}
+        for conversation_id in ids:
+            original, copy = await source.get_conversation(conversation_id), await target.get_conversation(conversation_id)
+            assert list(copy.messages) == list(original.messages) and copy.created_at == original.created_at
+
+        with pytest.raises(ValueError, match="Line 2"):
+            await import_ndjson(target, chunks(lines[0].encode("utf-8") + b"{not json\n"))
+
+    run(scenario())
+
+
+def test_export_resumes_after_the_last_complete_page(tmp_path):
+    async def scenario():
+        source, ids = await populated(5)
+        lines = await collect(export_ndjson(source, page_size=2))
+        path = tmp_path / "export.ndjson"
+        # Interrupted in the middle of the second page.
+        path.write_text("".join(lines[:4]) + lines[4][:10])
+
+        cursor = _resume_point(str(path))
+        assert path.read_text() == "".join(lines[:3])
+        rest = await collect(export_ndjson(source, cursor, page_size=2))
+        exported = [json.loads(line) for line in lines[:3] + rest]
+        assert [r["id"] for r in exported if r["type"] == "conversation"] == ids
+
+        path.write_text("".join(lines))
+        with pytest.raises(SystemExit):
+            _resume_point(str(path))
+
+    run(scenario())
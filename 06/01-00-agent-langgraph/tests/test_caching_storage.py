@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime
+
+from myapp.caching_storage import CachingConversationStorage
+from myapp.sqlite_storage import SQLiteConversationStorage
+from myapp.storage import Conversation, Message
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def contents(messages):
+    return [message["content"] for message in messages]
+
+
+def test_cache_follows_writes_from_other_workers(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "conversations.db")
+        # Two workers sharing one database, each with its own cache.
+        this = CachingConversationStorage(SQLiteConversationStorage(path))
+        other = CachingConversationStorage(SQLiteConversationStorage(path))
+        conversation_id = await this.create_conversation()
+        await this.add_messages(conversation_id, [("user", "hi"), ("assistant", "hello")])
+
+        assert contents(await this.get_messages(conversation_id)) == ["hi", "hello"]
+        assert contents(await this.get_messages(conversation_id)) == ["hi", "hello"]
+        assert this.hits == 2 and this.misses == 0
+
+        await other.add_message(conversation_id, "user", "from the other worker")
+        assert await this.get_messages_since(conversation_id, 2) == (
+            [{"role": "user", "content": "from the other worker"}], 3
+        )
+        assert this.partial_hits == 1
+
+        # Replaced behind the cache's back: same ID, different conversation.
+        await other.delete_conversation(conversation_id)
+        assert await this.get_conversation_info(conversation_id) is None
+        created = datetime(2024, 1, 1)
+        await other.import_conversation(Conversation(
+            id=conversation_id,
+            messages=[Message(role="user", content="replaced", timestamp=created)],
+            created_at=created,
+            updated_at=created,
+        ))
+        assert contents(await this.get_messages(conversation_id)) == ["replaced"]
+        assert this.invalidations == 1
+        await this.close()
+        await other.close()
+
+    run(scenario())
+
+
+def test_cache_budget_evicts_least_recently_used(tmp_path):
+    async def scenario():
+        storage = CachingConversationStorage(SQLiteConversationStorage(str(tmp_path / "c.db")), max_conversations=2)
+        ids = [await storage.create_conversation() for _ in range(3)]
+        for conversation_id in ids:
+            await storage.add_message(conversation_id, "user", "x" * 100)
+        assert storage.stats()["cache_conversations"] == 2 and storage.evictions == 1
+        # Evicted, so read from the backend.
+        assert contents(await storage.get_messages(ids[0])) == ["x" * 100]
+        assert storage.misses == 1
+        await storage.close()
+
+    run(scenario())
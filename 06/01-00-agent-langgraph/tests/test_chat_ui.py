@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("langgraph")
+
+from quart import Quart  # noqa: E402
+
+from myapp.chat_ui import chat_ui_bp  # noqa: E402
+from myapp.storage import InMemoryConversationStorage  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_app():
+    app = Quart(__name__)
+    app.register_blueprint(chat_ui_bp)
+    app.conversation_storage = InMemoryConversationStorage()
+    return app
+
+
+def contents(body):
+    return [message["content"] for message in body["messages"]]
+
+
+def test_conversation_pages_and_etag():
+    async def scenario():
+        app = make_app()
+        storage = app.conversation_storage
+        conversation_id = await storage.create_conversation()
+        await storage.add_messages(conversation_id, [("user", str(n)) for n in range(5)])
+        client = app.test_client()
+
+        response = await client.get(f"/conversations/{conversation_id}?limit=2")
+        body = await response.get_json()
+        assert contents(body) == ["0", "1"] and body["next_cursor"] == 2 and body["version"] == 5
+        etag = response.headers["ETag"]
+        response = await client.get(f"/conversations/{conversation_id}?limit=2&cursor=4")
+        body = await response.get_json()
+        assert contents(body) == ["4"] and body["next_cursor"] is None
+
+        response = await client.get(f"/conversations/{conversation_id}?order=newest&limit=2")
+        body = await response.get_json()
+        assert contents(body) == ["4", "3"] and body["next_cursor"] == 3
+        response = await client.get(f"/conversations/{conversation_id}?order=newest&limit=2&cursor=1")
+        assert contents(await response.get_json()) == ["0"]
+
+        response = await client.get(f"/conversations/{conversation_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        await storage.add_message(conversation_id, "assistant", "5")
+        response = await client.get(f"/conversations/{conversation_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200 and response.headers["ETag"] != etag
+
+        response = await client.get(f"/conversations/{conversation_id}?limit=0")
+        assert response.status_code == 400
+        response = await client.get("/conversations/missing")
+        assert response.status_code == 404
+
+    run(scenario())
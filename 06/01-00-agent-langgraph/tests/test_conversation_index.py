@@ -0,0 +1,74 @@
+from myapp.conversation_index import ConversationIndex, parse_query
+
+
+def make_index(conversations):
+    """Index `{id: [message, ...]}`, the first created (and updated) first."""
+    index = ConversationIndex()
+    for n, (conversation_id, messages) in enumerate(conversations.items()):
+        index.add_conversation(conversation_id, n, n)
+        index.add_messages(conversation_id, messages, n)
+    return index
+
+
+def test_parse_query():
+    assert parse_query('Alien "the GODFATHER" ') == [["alien"], ["the", "godfather"]]
+    assert parse_query('"" !!') == []
+
+
+def test_list_pages_by_update():
+    index = make_index({"a": [], "b": [], "c": []})
+    index.add_messages("a", ["bump"], 10)
+
+    page, cursor = index.list(2)
+    assert page == ["a", "c"]
+    page, cursor = index.list(2, cursor)
+    assert page == ["b"] and cursor is None
+
+    page, cursor = index.list_by_creation(2)
+    assert page == ["a", "b"]
+    assert index.list_by_creation(2, cursor) == (["c"], None)
+
+
+def test_search_terms_and_phrases():
+    index = make_index({
+        "a": ["I love the movie Alien", "It is scary"],
+        "b": ["The Godfather is great"],
+        "c": ["godfather the sequel"],
+    })
+    assert index.search("alien scary", 10) == (["a"], None)
+    assert sorted(index.search("godfather", 10)[0]) == ["b", "c"]
+    assert index.search('"the godfather"', 10) == (["b"], None)
+    # A phrase doesn't span two messages.
+    assert index.search('"alien it"', 10) == ([], None)
+    assert index.search("missing", 10) == ([], None)
+
+
+def test_fork_shares_the_parent_postings():
+    index = make_index({"parent": ["first alien", "second godfather", "third"]})
+    before = index.bytes
+    index.add_fork("fork", "parent", 1, 5)
+    index.add_messages("fork", ["branch casablanca"], 6)
+
+    # Only an entry and the fork's own message were added.
+    assert index.get("fork")[2] == 2
+    assert sorted(index.search("alien", 10)[0]) == ["fork", "parent"]
+    # Past the fork point the parent's messages aren't the fork's.
+    assert index.search("godfather", 10) == (["parent"], None)
+    assert index.search("casablanca", 10) == (["fork"], None)
+
+    # Removed, the parent stops being listed, but the fork still finds its prefix.
+    index.remove("parent")
+    assert "parent" not in index
+    assert index.search("alien", 10) == (["fork"], None)
+    index.remove("fork")
+    assert index.bytes == 0 and before > 0
+
+
+def test_dropped_postings_keep_the_listing():
+    index = make_index({"a": ["alien"], "b": ["alien"]})
+    index.drop_postings("a")
+    assert "a" in index and index.list(10)[0] == ["b", "a"]
+    assert index.search("alien", 10) == (["b"], None)
+
+    index.restore_postings("a", ["alien"])
+    assert sorted(index.search("alien", 10)[0]) == ["a", "b"]
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from myapp.embedding_cache import CachedEmbeddings  # noqa: E402
+
+
+class CountingEmbeddings(Embeddings):
+    model = "test-model"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0, 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_only_misses_go_upstream(tmp_path):
+    upstream = CountingEmbeddings()
+    cache = CachedEmbeddings(upstream, str(tmp_path / "embeddings.db"))
+    assert cache.embed_documents(["a", "bb", "a"]) == [[1.0, 1.0, 0.5], [2.0, 1.0, 0.5], [1.0, 1.0, 0.5]]
+    assert upstream.embedded == ["a", "bb"]
+
+    assert cache.embed_query("bb") == [2.0, 1.0, 0.5]
+    assert cache.embed_documents(["ccc", "a"])[0] == [3.0, 1.0, 0.5]
+    assert upstream.embedded == ["a", "bb", "ccc"]
+    assert (cache.hits, cache.misses, cache.upstream_calls) == (2, 4, 2)
+    cache.close()
+
+
+def test_cache_is_shared_through_the_file_and_keyed_on_the_model(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    CachedEmbeddings(CountingEmbeddings(), path).embed_documents(["a", "bb"])
+
+    upstream = CountingEmbeddings()
+    other_process = CachedEmbeddings(upstream, path)
+    assert asyncio.run(other_process.aembed_documents(["a", "bb"])) == [[1.0, 1.0, 0.5], [2.0, 1.0, 0.5]]
+    assert upstream.embedded == []
+
+    other_dimensions = CachedEmbeddings(upstream, path, dimensions=256)
+    other_dimensions.embed_query("a")
+    assert upstream.embedded == ["a"]
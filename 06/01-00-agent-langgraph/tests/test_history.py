@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from myapp.history import GraphHistoryCache  # noqa: E402
+from myapp.storage import InMemoryConversationStorage  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class WordCounter:
+    """One token per word; remembers what it was asked to count."""
+
+    def __init__(self):
+        self.counted = []
+
+    def __call__(self, text):
+        self.counted.append(text)
+        return len(text.split())
+
+
+def test_history_is_extended_incrementally():
+    async def scenario():
+        storage = InMemoryConversationStorage()
+        conversation_id = await storage.create_conversation()
+        await storage.add_messages(conversation_id, [("user", "hi"), ("assistant", "hello")])
+        counter = WordCounter()
+        cache = GraphHistoryCache(token_counter=counter)
+
+        first = await cache.load(storage, conversation_id)
+        assert [m.content for m in first] == ["hi", "hello"]
+        await storage.add_message(conversation_id, "user", "again")
+        second = await cache.load(storage, conversation_id)
+        assert [m.content for m in second] == ["hi", "hello", "again"]
+        # The messages converted last turn are reused, not converted again.
+        assert all(a is b for a, b in zip(first, second))
+        # Each message is tokenized once, when it enters the cache.
+        assert counter.counted == ["hi", "hello", "again"]
+        with pytest.raises(ValueError, match="not found"):
+            await cache.load(storage, "missing")
+
+    run(scenario())
+
+
+def test_window_uses_the_token_counts_stored_with_the_messages(monkeypatch):
+    async def scenario():
+        storage = InMemoryConversationStorage()
+        conversation_id = await storage.create_conversation()
+        await storage.add_messages(conversation_id, [("user", "one two three"), ("assistant", "four five")])
+        stored = [m.tokens for m in (await storage.get_conversation(conversation_id)).messages]
+
+        def no_tokenizing(content):
+            raise AssertionError("the history cache tokenized a stored message")
+
+        monkeypatch.setattr("myapp.history.message_tokens", no_tokenizing)
+        cache = GraphHistoryCache(token_budget=stored[1])
+        assert [m.content for m in await cache.load(storage, conversation_id)] == ["four five"]
+
+    run(scenario())
+
+
+def test_window_keeps_system_messages_and_the_newest_that_fit():
+    async def scenario():
+        storage = InMemoryConversationStorage()
+        conversation_id = await storage.create_conversation()
+        await storage.add_messages(conversation_id, [
+            ("system", "rules"),  # 1 + 4 tokens of framing
+            ("user", "one two three"),  # 7
+            ("assistant", "four five"),  # 6
+            ("user", "six"),  # 5
+        ])
+        window = await GraphHistoryCache(token_budget=16, token_counter=WordCounter()).load(storage, conversation_id)
+        assert [m.content for m in window] == ["rules", "four five", "six"]
+
+        # The system message is kept even when nothing else fits.
+        window = await GraphHistoryCache(token_budget=5, token_counter=WordCounter()).load(storage, conversation_id)
+        assert [m.content for m in window] == ["rules"]
+
+    run(scenario())
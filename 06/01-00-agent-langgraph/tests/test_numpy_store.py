@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain_core")
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from myapp import numpy_store  # noqa: E402
+from myapp.numpy_store import NumpyVectorStore  # noqa: E402
+
+DIRECTIONS = {
+    "north": [0.0, 2.0],
+    "northeast": [1.0, 1.0],
+    "east": [3.0, 0.0],
+    "south": [0.0, -1.0],
+    "west": [-1.0, 0.0],
+}
+
+
+class CompassEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [DIRECTIONS[text] for text in texts]
+
+    def embed_query(self, text):
+        return DIRECTIONS[text]
+
+
+def texts(documents):
+    return [document.page_content for document in documents]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    # Blocks of two vectors, so the top k are merged across blocks.
+    monkeypatch.setattr(numpy_store, "SEARCH_BLOCK_ROWS", 2)
+    return NumpyVectorStore.from_texts(list(DIRECTIONS), CompassEmbeddings(), ids=list(DIRECTIONS))
+
+
+def test_top_k_nearest_first(store):
+    assert texts(store.similarity_search("north", k=3)) == ["north", "northeast", "east"]
+    (nearest, distance), = store.similarity_search_with_score("east", k=1)
+    assert nearest.page_content == "east" and distance == pytest.approx(0.0, abs=1e-6)
+    assert len(store.similarity_search("north", k=10)) == 5
+
+
+@pytest.mark.filterwarnings("ignore:Relevance scores must be between 0 and 1")
+def test_score_threshold(store):
+    retriever = store.as_retriever(search_type="similarity_score_threshold", search_kwargs={"k": 4, "score_threshold": 0.5})
+    assert texts(retriever.invoke("north")) == ["north", "northeast"]
+
+
+def test_saved_store_is_mapped_and_still_accepts_texts(store, tmp_path):
+    path = str(tmp_path / "index")
+    store.save(path)
+    loaded = NumpyVectorStore.load(path, CompassEmbeddings())
+    assert len(loaded) == 5 and texts(loaded.similarity_search("south", k=1)) == ["south"]
+
+    DIRECTIONS["up"] = [0.1, 1.0]
+    try:
+        loaded.add_texts(["up"])
+    finally:
+        del DIRECTIONS["up"]
+    assert texts(loaded.similarity_search_by_vector([0.2, 2.0], k=2)) == ["up", "north"]
@@ -0,0 +1,78 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from myapp.partitioned_storage import (
+    PartitionedConversationStorage,
+    RetentionPolicy,
+    SegmentInfo,
+    _uuid7_seconds,
+    plan_retention,
+    uuid7,
+)
+from myapp.storage import Conversation, Message
+
+NOW = datetime(2024, 6, 1)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def segment(start, conversations=10, size=1000, idle_days=0):
+    return SegmentInfo(start, f"segment-{start}.db", size, conversations, NOW - timedelta(days=idle_days))
+
+
+def test_plan_retention():
+    segments = [segment(3, idle_days=1), segment(1, idle_days=3), segment(2, idle_days=2)]
+    assert plan_retention(segments, RetentionPolicy(), NOW) == []
+    # Oldest first, until the totals fit.
+    assert plan_retention(segments, RetentionPolicy(max_conversations=15), NOW) == [1, 2]
+    assert plan_retention(segments, RetentionPolicy(max_bytes=2500), NOW) == [1]
+    assert plan_retention(segments, RetentionPolicy(max_age_seconds=36 * 3600), NOW) == [1, 2]
+    # The newest segment is kept however old it is.
+    assert plan_retention(segments, RetentionPolicy(max_age_seconds=1), NOW) == [1, 2]
+
+
+def test_uuid7_carries_the_creation_time():
+    conversation_id = uuid7()
+    assert abs(_uuid7_seconds(conversation_id) - datetime.now().timestamp()) < 5
+    assert _uuid7_seconds("not-a-uuid7") is None
+
+
+def old_conversation(conversation_id, days):
+    created = datetime.utcnow() - timedelta(days=days)
+    return Conversation(
+        id=conversation_id,
+        messages=[Message(role="user", content="old", timestamp=created)],
+        created_at=created,
+        updated_at=created,
+    )
+
+
+def test_retention_drops_whole_segments(tmp_path):
+    async def scenario():
+        policy = RetentionPolicy(max_age_seconds=86400)
+        sweeper = PartitionedConversationStorage(str(tmp_path), 3600, retention=policy, sweep_pause=0)
+        other = PartitionedConversationStorage(str(tmp_path), 3600, retention=policy, sweep_pause=0)
+        await sweeper.import_conversation(old_conversation("old", days=3))
+        recent = await sweeper.create_conversation()
+        assert [m["content"] for m in await other.get_messages("old")] == ["old"]
+        page, _ = await other.list_conversations_by_creation(10)
+        assert [info.id for info in page] == ["old", recent]
+
+        dropped = await sweeper.sweep()
+        assert len(dropped) == 1 and not os.path.exists(sweeper._path(dropped[0]))
+        # Only one worker drops segments; the other notices the file is gone.
+        assert await other.sweep() == []
+        assert await other.get_conversation("old") is None
+        with pytest.raises(ValueError, match="not found"):
+            await other.add_message("old", "user", "still there?")
+        await other.add_message(recent, "user", "hello")
+        assert len(await sweeper.get_messages(recent)) == 1
+        await sweeper.close()
+        await other.close()
+
+    run(scenario())
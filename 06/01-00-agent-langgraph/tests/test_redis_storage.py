@@ -0,0 +1,207 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+from fakeredis.aioredis import FakeRedis  # noqa: E402
+
+from myapp.redis_storage import RedisConversationStorage  # noqa: E402
+from myapp.storage import Conversation, Message, StoredSummary  # noqa: E402
+from myapp.tokens import message_tokens  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_storage(server=None, key_prefix="test:"):
+    client = FakeRedis(server=server or fakeredis.FakeServer(), decode_responses=True)
+    return RedisConversationStorage(client, key_prefix=key_prefix)
+
+
+def test_messages_round_trip():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        storage = make_storage(server)
+        conversation_id = await storage.create_conversation()
+        await storage.add_message(conversation_id, "user", "Recommend a movie")
+        await storage.add_messages(conversation_id, [("assistant", "Alien"), ("user", "Why?")])
+
+        conversation = await storage.get_conversation(conversation_id)
+        assert [m.content for m in conversation.messages] == ["Recommend a movie", "Alien", "Why?"]
+        assert conversation.updated_at >= conversation.created_at
+        # Another worker sees the same conversation.
+        other_worker = make_storage(server)
+        assert await other_worker.get_messages(conversation_id) == [
+            {"role": "user", "content": "Recommend a movie"},
+            {"role": "assistant", "content": "Alien"},
+            {"role": "user", "content": "Why?"},
+        ]
+        assert await storage.get_messages_since(conversation_id, 2) == ([{"role": "user", "content": "Why?"}], 3)
+        assert await storage.get_messages_range(conversation_id, 1, 2) == ([{"role": "assistant", "content": "Alien"}], 3)
+        assert await storage.get_messages_range(conversation_id, 2, 2) == ([], 3)
+        info = await storage.get_conversation_info(conversation_id)
+        assert info.message_count == 3 and info.updated_at >= info.created_at
+        await storage.close()
+        await other_worker.close()
+
+    run(scenario())
+
+
+def test_missing_conversation():
+    async def scenario():
+        storage = make_storage()
+        assert await storage.get_conversation("missing") is None
+        assert await storage.get_conversation_info("missing") is None
+        with pytest.raises(ValueError, match="not found"):
+            await storage.add_messages("missing", [("user", "hi")])
+        with pytest.raises(ValueError, match="not found"):
+            await storage.get_messages("missing")
+        with pytest.raises(ValueError, match="not found"):
+            await storage.get_messages_since("missing")
+        await storage.close()
+
+    run(scenario())
+
+
+def test_fork_copies_the_prefix():
+    async def scenario():
+        storage = make_storage()
+        conversation_id = await storage.create_conversation()
+        await storage.add_messages(conversation_id, [("user", f"m{i}") for i in range(5)])
+        fork_id = await storage.fork_conversation(conversation_id, 3)
+        await storage.add_message(fork_id, "user", "branch")
+
+        assert [m["content"] for m in await storage.get_messages(fork_id)] == ["m0", "m1", "m2", "branch"]
+        assert len(await storage.get_messages(conversation_id)) == 5
+        with pytest.raises(ValueError):
+            await storage.fork_conversation(conversation_id, 6)
+        with pytest.raises(ValueError, match="not found"):
+            await storage.fork_conversation("missing", 0)
+        await storage.close()
+
+    run(scenario())
+
+
+def test_import_and_delete():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        storage = make_storage(server)
+        created = datetime(2024, 1, 1, 12, 0)
+        conversation = Conversation(
+            id="imported",
+            messages=[Message(role="user", content="hello", timestamp=created)],
+            created_at=created,
+            updated_at=created,
+        )
+        await storage.import_conversation(conversation)
+        with pytest.raises(ValueError, match="already exists"):
+            await storage.import_conversation(conversation)
+        assert (await storage.get_conversation_info("imported")).created_at == created
+
+        await storage.save_summary("imported", StoredSummary(upto=1, digest="d", text="t"))
+        assert await storage.delete_conversation("imported") is True
+        assert await FakeRedis(server=server, decode_responses=True).keys("test:*") == []
+        await storage.close()
+
+    run(scenario())
+
+
+def test_list_pages_newest_first_and_by_creation():
+    async def scenario():
+        storage = make_storage()
+        ids = []
+        for _ in range(7):
+            ids.append(await storage.create_conversation())
+            await asyncio.sleep(0.002)
+        await storage.add_message(ids[0], "user", "bump")
+
+        listed, cursor = [], None
+        while True:
+            page, cursor = await storage.list_conversations(3, cursor)
+            listed += [info.id for info in page]
+            if cursor is None:
+                break
+        assert listed == [ids[0]] + list(reversed(ids[1:]))
+
+        created, cursor = [], None
+        while True:
+            page, cursor = await storage.list_conversations_by_creation(3, cursor)
+            created += [info.id for info in page]
+            if cursor is None:
+                break
+        assert created == ids
+        await storage.close()
+
+    run(scenario())
+
+
+def test_creation_index_is_backfilled_on_start():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        storage = make_storage(server)
+        ids = [await storage.create_conversation() for _ in range(3)]
+        # As stored before the created_at index existed.
+        await FakeRedis(server=server, decode_responses=True).delete("test:conversations:created")
+
+        restarted = make_storage(server)
+        await restarted.start()
+        page, _ = await restarted.list_conversations_by_creation(10)
+        assert sorted(info.id for info in page) == sorted(ids)
+        await storage.close()
+        await restarted.close()
+
+    run(scenario())
+
+
+def test_summary_only_grows():
+    async def scenario():
+        storage = make_storage()
+        conversation_id = await storage.create_conversation()
+        await storage.save_summary(conversation_id, StoredSummary(upto=4, digest="a", text="four"))
+        await storage.save_summary(conversation_id, StoredSummary(upto=2, digest="b", text="two"))
+        assert (await storage.get_summary(conversation_id)).text == "four"
+        await storage.save_summary(conversation_id, StoredSummary(upto=6, digest="c", text="six"))
+        assert (await storage.get_summary(conversation_id)).upto == 6
+        await storage.delete_summary(conversation_id)
+        assert await storage.get_summary(conversation_id) is None
+        # Not stored for a conversation that doesn't exist.
+        await storage.save_summary("missing", StoredSummary(upto=1, digest="d", text="t"))
+        assert await storage.get_summary("missing") is None
+        await storage.close()
+
+    run(scenario())
+
+
+def test_turn_lease():
+    async def scenario():
+        storage = make_storage()
+        assert await storage.acquire_turn_lease("c", "worker-1", 5)
+        assert not await storage.acquire_turn_lease("c", "worker-2", 5)
+        # The holder may extend it.
+        assert await storage.acquire_turn_lease("c", "worker-1", 5)
+        # Only the holder can release it.
+        await storage.release_turn_lease("c", "worker-2")
+        assert not await storage.acquire_turn_lease("c", "worker-2", 5)
+        await storage.release_turn_lease("c", "worker-1")
+        assert await storage.acquire_turn_lease("c", "worker-2", 0.05)
+        await asyncio.sleep(0.1)
+        assert await storage.acquire_turn_lease("c", "worker-1", 5)
+        await storage.close()
+
+    run(scenario())
+
+
+def test_token_counts_are_stored_with_the_messages():
+    async def scenario():
+        storage = make_storage()
+        conversation_id = await storage.create_conversation()
+        await storage.add_messages(conversation_id, [("user", "Recommend a movie"), ("assistant", "Alien")])
+        messages, cursor = await storage.get_messages_since(conversation_id, 1, with_tokens=True)
+        assert (messages, cursor) == ([{"role": "assistant", "content": "Alien", "tokens": message_tokens("Alien")}], 2)
+        conversation = await storage.get_conversation(conversation_id)
+        assert [m.tokens for m in conversation.messages] == [message_tokens("Recommend a movie"), message_tokens("Alien")]
+        await storage.close()
+
+    run(scenario())
@@ -0,0 +1,57 @@
+import asyncio
+import uuid
+
+from myapp.sharded_storage import ShardedConversationStorage, shard_for, shard_paths
+from myapp.storage import InMemoryConversationStorage
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_shard_for_only_moves_to_the_new_shard():
+    ids = [str(uuid.uuid4()) for _ in range(2000)]
+    for count in (1, 2, 5):
+        moved = 0
+        for conversation_id in ids:
+            before, after = shard_for(conversation_id, count), shard_for(conversation_id, count + 1)
+            assert after in (before, count)
+            moved += after != before
+        # About 1/(count + 1) of them.
+        assert abs(moved / len(ids) - 1 / (count + 1)) < 0.05
+
+
+def test_shard_paths():
+    assert shard_paths("data/conversations.db", 2) == ["data/conversations-0.db", "data/conversations-1.db"]
+
+
+def test_listing_while_conversations_are_updated():
+    async def scenario():
+        storage = ShardedConversationStorage([InMemoryConversationStorage() for _ in range(3)])
+        ids = []
+        for _ in range(12):
+            ids.append(await storage.create_conversation())
+            await asyncio.sleep(0.001)
+
+        listed, cursor = [], None
+        while True:
+            page, cursor = await storage.list_conversations(4, cursor)
+            listed += [info.id for info in page]
+            if cursor is None:
+                break
+            # Moves to the front of the listing, behind the pages already read.
+            await storage.add_message(listed[-1] if len(listed) < 8 else ids[0], "user", "bump")
+        # Not repeated, and none of the others skipped.
+        assert len(listed) == len(set(listed))
+        assert set(ids) - set(listed) <= {ids[0]}
+
+        created, cursor = [], None
+        while True:
+            page, cursor = await storage.list_conversations_by_creation(5, cursor)
+            created += [info.id for info in page]
+            if cursor is None:
+                break
+            await storage.add_message(created[0], "user", "bump")
+        assert created == ids
+
+    run(scenario())
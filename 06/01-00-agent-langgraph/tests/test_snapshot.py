@@ -0,0 +1,57 @@
+import asyncio
+
+from myapp.snapshot import SnapshotReader, write_snapshot
+from myapp.storage import InMemoryConversationStorage
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    records = [("b", 1, 2, 3, b"second"), ("a", 4, 5, 6, b"first"), ("long-id", 7, 8, 0, b"")]
+    assert write_snapshot(path, iter(records))[0] == 3
+
+    reader = SnapshotReader(path)
+    assert len(reader) == 3
+    assert reader.segment("a") == b"first" and reader.segment("long-id") == b""
+    assert reader.segment("c") is None and "b" in reader
+    assert list(reader.entries()) == [("a", 4, 5, 6), ("b", 1, 2, 3), ("long-id", 7, 8, 0)]
+    assert [record[0] for record in reader.records(exclude={"b"})] == ["a", "long-id"]
+    reader.close()
+
+
+def test_truncated_or_missing_snapshot_reads_as_empty(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    assert len(SnapshotReader(str(path))) == 0
+
+    write_snapshot(str(path), iter([("a", 1, 2, 3, b"x" * 100)]))
+    data = path.read_bytes()
+    path.write_bytes(data[:-10])  # The index is cut short.
+    assert len(SnapshotReader(str(path))) == 0
+    path.write_bytes(data[:10])  # Not even a header.
+    assert len(SnapshotReader(str(path))) == 0
+
+
+def test_restarted_worker_restores_its_conversations(tmp_path):
+    async def scenario():
+        storage = InMemoryConversationStorage(snapshot_dir=str(tmp_path))
+        await storage.start()
+        kept = await storage.create_conversation()
+        await storage.add_messages(kept, [("user", "hi"), ("assistant", "hello")])
+        deleted = await storage.create_conversation()
+        await storage.snapshot()
+        await storage.delete_conversation(deleted)
+        await storage.close()
+
+        restarted = InMemoryConversationStorage(snapshot_dir=str(tmp_path))
+        await restarted.start()
+        assert await restarted.get_messages(kept) == [
+            {"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}
+        ]
+        assert await restarted.get_conversation(deleted) is None
+        assert restarted.stats()["snapshot_loads"] == 1
+        await restarted.close()
+
+    run(scenario())
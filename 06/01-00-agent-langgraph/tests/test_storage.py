@@ -0,0 +1,238 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from myapp.sqlite_storage import SQLiteConversationStorage
+from myapp.storage import CompressedMemoryColdTier, InMemoryConversationStorage, StoredSummary
+from myapp.tokens import message_tokens
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def contents(messages):
+    return [message["content"] for message in messages]
+
+
+def test_memory_budget_spills_to_the_cold_tier():
+    async def scenario():
+        cold = CompressedMemoryColdTier()
+        storage = InMemoryConversationStorage(max_bytes=20_000, cold_tier=cold)
+        ids = []
+        for n in range(10):
+            conversation_id = await storage.create_conversation()
+            await storage.add_messages(conversation_id, [("user", f"{n} " + "x" * 1000)] * 3)
+            ids.append(conversation_id)
+
+        assert storage.resident_bytes <= 20_000
+        assert storage.evictions > 0 and cold.stats()["cold_conversations"] > 0
+        # An evicted conversation comes back intact, and stays listed meanwhile.
+        assert len(await storage.get_messages(ids[0])) == 3
+        assert await storage.get_messages_since(ids[0], 3) == ([], 3)
+        assert storage.rehydrations == 1
+        page, _ = await storage.list_conversations(100)
+        assert sorted(info.id for info in page) == sorted(ids)
+
+    run(scenario())
+
+
+def test_memory_ttl_sweep():
+    async def scenario():
+        storage = InMemoryConversationStorage(ttl_seconds=0.05)
+        idle = await storage.create_conversation()
+        active = await storage.create_conversation()
+        await asyncio.sleep(0.1)
+        await storage.add_message(active, "user", "still here")
+
+        assert await storage.sweep_expired() == 1
+        assert await storage.get_conversation(idle) is None
+        assert contents(await storage.get_messages(active)) == ["still here"]
+        assert storage.expirations == 1
+
+    run(scenario())
+
+
+def test_memory_ttl_sweep_counts_only_what_it_evicts():
+    class SlowColdTier(CompressedMemoryColdTier):
+        def __init__(self):
+            super().__init__()
+            self.release = asyncio.Event()
+
+        async def put(self, conversation):
+            await self.release.wait()
+            await super().put(conversation)
+
+    async def scenario():
+        cold = SlowColdTier()
+        storage = InMemoryConversationStorage(ttl_seconds=0.05, cold_tier=cold)
+        first = await storage.create_conversation()
+        second = await storage.create_conversation()
+        await asyncio.sleep(0.1)
+
+        sweep = asyncio.create_task(storage.sweep_expired())
+        await asyncio.sleep(0)
+        # Written to while the first one is being spilled, so it is no longer idle.
+        await storage.add_message(second, "user", "back again")
+        cold.release.set()
+        assert await sweep == 1
+        assert storage.expirations == 1 and cold.stats()["cold_conversations"] == 1
+        assert contents(await storage.get_messages(second)) == ["back again"]
+        assert await storage.get_conversation(first) is not None
+
+    run(scenario())
+
+
+def test_memory_fork_shares_the_prefix():
+    async def scenario():
+        storage = InMemoryConversationStorage()
+        conversation_id = await storage.create_conversation()
+        await storage.add_messages(conversation_id, [("user", f"m{i} " + "x" * 500) for i in range(4)])
+        before = storage.resident_bytes
+        fork_id = await storage.fork_conversation(conversation_id, 2)
+        # An entry, not a copy of the messages.
+        assert storage.resident_bytes - before < 1000
+
+        await storage.add_message(fork_id, "user", "branch")
+        assert len(await storage.get_messages(fork_id)) == 3
+        assert len(await storage.get_messages(conversation_id)) == 4
+
+        # The parent's log stays charged while the fork holds it.
+        assert await storage.delete_conversation(conversation_id)
+        assert storage.stats()["shared_parent_bytes"] > 0
+        assert contents(await storage.get_messages(fork_id))[2] == "branch"
+        assert await storage.delete_conversation(fork_id)
+        assert storage.resident_bytes == 0
+
+    run(scenario())
+
+
+def test_memory_summaries():
+    async def scenario():
+        storage = InMemoryConversationStorage()
+        conversation_id = await storage.create_conversation()
+        await storage.save_summary(conversation_id, StoredSummary(upto=4, digest="a", text="four"))
+        await storage.save_summary(conversation_id, StoredSummary(upto=2, digest="b", text="two"))
+        assert (await storage.get_summary(conversation_id)).text == "four"
+        await storage.delete_conversation(conversation_id)
+        assert await storage.get_summary(conversation_id) is None
+
+    run(scenario())
+
+
+def test_sqlite_round_trip(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "conversations.db")
+        storage = SQLiteConversationStorage(path)
+        conversation_id = await storage.create_conversation()
+        await storage.add_messages(conversation_id, [("user", "I love Alien"), ("assistant", "The Godfather too?")])
+
+        assert contents(await storage.get_messages(conversation_id)) == ["I love Alien", "The Godfather too?"]
+        assert await storage.get_messages_since(conversation_id, 1) == (
+            [{"role": "assistant", "content": "The Godfather too?"}], 2
+        )
+        with pytest.raises(ValueError, match="not found"):
+            await storage.add_message("missing", "user", "hi")
+        with pytest.raises(ValueError, match="not found"):
+            await storage.add_messages("missing", [("user", "hi"), ("assistant", "hello")])
+        assert await storage.get_conversation("missing") is None
+        await storage.close()
+
+        # Committed on close, so another process sees everything.
+        reopened = SQLiteConversationStorage(path)
+        conversation = await reopened.get_conversation(conversation_id)
+        assert [message.role for message in conversation.messages] == ["user", "assistant"]
+        await reopened.close()
+
+    run(scenario())
+
+
+def test_sqlite_listing_and_search(tmp_path):
+    async def scenario():
+        storage = SQLiteConversationStorage(str(tmp_path / "conversations.db"))
+        first = await storage.create_conversation()
+        await asyncio.sleep(0.002)
+        second = await storage.create_conversation()
+        await storage.add_messages(first, [("user", "I love Alien"), ("assistant", "The Godfather too?")])
+        await storage.add_message(second, "user", "Casablanca")
+
+        page, cursor = await storage.list_conversations(1)
+        assert [info.id for info in page] == [second]
+        page, cursor = await storage.list_conversations(1, cursor)
+        assert [info.id for info in page] == [first] and cursor is None
+        page, _ = await storage.list_conversations_by_creation(10)
+        assert [info.id for info in page] == [first, second]
+        page, _ = await storage.search_conversations("godfather", 10)
+        assert [info.id for info in page] == [first]
+
+        fork_id = await storage.fork_conversation(first, 1)
+        assert contents(await storage.get_messages(fork_id)) == ["I love Alien"]
+        assert await storage.delete_conversation(first)
+        assert await storage.get_conversation(first) is None
+        await storage.close()
+
+    run(scenario())
+
+
+def test_sqlite_summary_and_lease_are_shared(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "conversations.db")
+        worker_a, worker_b = SQLiteConversationStorage(path), SQLiteConversationStorage(path)
+        conversation_id = await worker_a.create_conversation()
+
+        await worker_a.save_summary(conversation_id, StoredSummary(upto=3, digest="d", text="summary"))
+        assert await worker_b.get_summary(conversation_id) == StoredSummary(upto=3, digest="d", text="summary")
+
+        assert await worker_a.acquire_turn_lease(conversation_id, "a", 5)
+        assert not await worker_b.acquire_turn_lease(conversation_id, "b", 5)
+        await worker_a.release_turn_lease(conversation_id, "a")
+        assert await worker_b.acquire_turn_lease(conversation_id, "b", 5)
+        await worker_a.close()
+        await worker_b.close()
+
+    run(scenario())
+
+
+def test_token_counts_are_stored_with_the_messages(tmp_path):
+    async def scenario():
+        for storage in (InMemoryConversationStorage(), SQLiteConversationStorage(str(tmp_path / "tokens.db"))):
+            conversation_id = await storage.create_conversation()
+            await storage.add_messages(conversation_id, [("user", "I love Alien"), ("assistant", "Why?")])
+            messages, cursor = await storage.get_messages_since(conversation_id, 0, with_tokens=True)
+            assert cursor == 2
+            assert [m["tokens"] for m in messages] == [message_tokens("I love Alien"), message_tokens("Why?")]
+            # Without the flag the dicts stay as they were.
+            assert "tokens" not in (await storage.get_messages_since(conversation_id, 1))[0][0]
+            if isinstance(storage, SQLiteConversationStorage):
+                await storage.close()
+
+    run(scenario())
+
+
+def test_sqlite_adds_the_tokens_column_to_an_old_database(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        "CREATE TABLE conversations (id TEXT PRIMARY KEY, created_at TEXT NOT NULL, updated_at TEXT NOT NULL,"
+        " message_count INTEGER NOT NULL DEFAULT 0);"
+        "CREATE TABLE messages (conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL,"
+        " content TEXT NOT NULL, created_at TEXT NOT NULL);"
+        "INSERT INTO conversations VALUES ('old', '2024-01-01T00:00:00', '2024-01-01T00:00:00', 1);"
+        "INSERT INTO messages VALUES ('old', 0, 'user', 'I love Alien', '2024-01-01T00:00:00');"
+    )
+    conn.commit()
+    conn.close()
+
+    async def scenario():
+        storage = SQLiteConversationStorage(path)
+        # Rows written before the column existed are counted on read.
+        assert await storage.get_messages_since("old", 0, with_tokens=True) == (
+            [{"role": "user", "content": "I love Alien", "tokens": message_tokens("I love Alien")}], 1
+        )
+        await storage.add_message("old", "assistant", "Why?")
+        messages, _ = await storage.get_messages_since("old", 1, with_tokens=True)
+        assert messages[0]["tokens"] == message_tokens("Why?")
+        await storage.close()
+
+    run(scenario())
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from myapp.history import GraphHistoryCache  # noqa: E402
+from myapp.storage import InMemoryConversationStorage, StoredSummary  # noqa: E402
+from myapp.summarizer import RollingSummarizer  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class StubSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, previous_summary, messages):
+        self.calls.append((previous_summary, [m.content for m in messages]))
+        return f"summary of {len(messages)}"
+
+
+def make_cache(summarize):
+    # One token per word plus 4 of framing: every "a b c" message costs 7.
+    summarizer = RollingSummarizer(summarize, summarize_after_tokens=20, keep_recent=2)
+    return GraphHistoryCache(token_counter=lambda text: len(text.split()), summarizer=summarizer)
+
+
+async def settle(cache):
+    await asyncio.gather(*cache.summarizer._tasks.values())
+
+
+async def long_conversation(storage, turns=3):
+    conversation_id = await storage.create_conversation()
+    for turn in range(turns):
+        await storage.add_messages(conversation_id, [("user", f"question {turn} here"), ("assistant", f"answer {turn} here")])
+    return conversation_id
+
+
+def test_older_turns_are_summarized_in_the_background():
+    async def scenario():
+        storage = InMemoryConversationStorage()
+        conversation_id = await long_conversation(storage)
+        summarize = StubSummarizer()
+        cache = make_cache(summarize)
+
+        # The first load sends everything and starts summarizing.
+        assert len(await cache.load(storage, conversation_id)) == 6
+        await settle(cache)
+        assert summarize.calls == [(None, ["question 0 here", "answer 0 here", "question 1 here", "answer 1 here"])]
+
+        window = await cache.load(storage, conversation_id)
+        assert [m.content for m in window] == [
+            "Summary of the earlier conversation:\nsummary of 4", "question 2 here", "answer 2 here"
+        ]
+        assert await storage.get_summary(conversation_id) == StoredSummary(
+            upto=4, digest=cache.summarizer._summaries[conversation_id].digest, text="summary of 4"
+        )
+
+    run(scenario())
+
+
+def test_a_stored_summary_is_reused_by_other_workers():
+    async def scenario():
+        storage = InMemoryConversationStorage()
+        conversation_id = await long_conversation(storage)
+        first = make_cache(StubSummarizer())
+        await first.load(storage, conversation_id)
+        await settle(first)
+
+        summarize = StubSummarizer()
+        second = make_cache(summarize)
+        window = await second.load(storage, conversation_id)
+        await settle(second)
+        assert window[0].content.endswith("summary of 4") and len(window) == 3
+        assert summarize.calls == []
+
+    run(scenario())
+
+
+def test_a_summary_of_other_messages_is_dropped():
+    async def scenario():
+        storage = InMemoryConversationStorage()
+        conversation_id = await long_conversation(storage)
+        await storage.save_summary(conversation_id, StoredSummary(upto=4, digest="stale", text="wrong"))
+        summarize = StubSummarizer()
+        cache = make_cache(summarize)
+
+        assert len(await cache.load(storage, conversation_id)) == 6
+        await settle(cache)
+        assert (await storage.get_summary(conversation_id)).text == "summary of 4"
+        assert cache.summarizer.stats()["summaries_invalidated"] == 1
+
+    run(scenario())
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from myapp.sqlite_storage import SQLiteConversationStorage
+from myapp.turn_locks import ConversationBusyError, TurnLocks
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def take_turn(locks, conversation_id, log, name, seconds=0.05):
+    async with locks.turn(conversation_id):
+        log.append(f"{name} start")
+        await asyncio.sleep(seconds)
+        log.append(f"{name} end")
+
+
+def test_queue_runs_turns_one_after_the_other():
+    async def scenario():
+        locks, log = TurnLocks(policy="queue"), []
+        await asyncio.gather(take_turn(locks, "c", log, "first"), take_turn(locks, "c", log, "second"))
+        assert log == ["first start", "first end", "second start", "second end"]
+        assert locks.stats()["turns_contended"] == 1
+
+    run(scenario())
+
+
+def test_queue_wait_timeout():
+    async def scenario():
+        locks = TurnLocks(policy="queue", wait_timeout=0.01)
+        first = asyncio.create_task(take_turn(locks, "c", [], "first"))
+        await asyncio.sleep(0)
+        with pytest.raises(ConversationBusyError):
+            await take_turn(locks, "c", [], "second")
+        await first
+        assert locks.timed_out == 1
+
+    run(scenario())
+
+
+def test_reject_refuses_a_concurrent_turn_of_the_same_conversation():
+    async def scenario():
+        locks = TurnLocks(stripes=1, policy="reject")
+        first = asyncio.create_task(take_turn(locks, "c", [], "first"))
+        await asyncio.sleep(0)
+        with pytest.raises(ConversationBusyError):
+            locks.check("c")
+        with pytest.raises(ConversationBusyError):
+            await take_turn(locks, "c", [], "second")
+        # Another conversation on the same stripe waits instead.
+        await take_turn(locks, "other", [], "other")
+        await first
+        assert locks.rejected == 2 and locks.stripe_collisions == 1
+
+    run(scenario())
+
+
+def test_cancel_supersedes_the_running_turn():
+    async def scenario():
+        locks, log = TurnLocks(policy="cancel"), []
+        first = asyncio.create_task(take_turn(locks, "c", log, "first", seconds=10))
+        await asyncio.sleep(0)
+        await take_turn(locks, "c", log, "second")
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert log == ["first start", "second start", "second end"]
+        assert locks.cancelled == 1
+
+    run(scenario())
+
+
+def test_leases_serialize_turns_across_workers(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "conversations.db")
+        storages = [SQLiteConversationStorage(path), SQLiteConversationStorage(path)]
+        # One TurnLocks per worker, sharing only the storage.
+        workers = [TurnLocks(policy="cancel", leases=storage, lease_seconds=5) for storage in storages]
+        log = []
+        first = asyncio.create_task(take_turn(workers[0], "c", log, "a", seconds=0.2))
+        while not log:
+            await asyncio.sleep(0.01)
+        # Another worker's turn can't be cancelled, so this one waits for it.
+        await take_turn(workers[1], "c", log, "b")
+        await first
+        assert log == ["a start", "a end", "b start", "b end"]
+        assert workers[1].lease_contended == 1
+
+        rejecting = TurnLocks(policy="reject", leases=storages[1], lease_seconds=5)
+        log = []
+        running = asyncio.create_task(take_turn(workers[0], "c", log, "a"))
+        while not log:
+            await asyncio.sleep(0.01)
+        with pytest.raises(ConversationBusyError):
+            await take_turn(rejecting, "c", [], "b")
+        await running
+        for storage in storages:
+            await storage.close()
+
+    run(scenario())
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("langchain_community")
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from myapp import vector_index  # noqa: E402
+from myapp.vector_index import SECTION_SEPARATOR, load_or_build_index  # noqa: E402
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), float(text.count("a")), 1.0]
+
+
+def write_source(path, sections):
+    path.write_text(SECTION_SEPARATOR.join(sections), encoding="utf-8")
+
+
+def indexes(index_dir):
+    return {name for name in os.listdir(index_dir) if not name.startswith(".")}
+
+
+def chunk_ids(vector_store):
+    return sorted(vector_store._collection.get(include=[])["ids"])
+
+
+def test_only_changed_chunks_are_embedded(tmp_path):
+    source, index_dir = tmp_path / "movies.txt", str(tmp_path / "index")
+    write_source(source, ["Alien (1979)", "Heat (1995)", "Up (2009)"])
+    embeddings = CountingEmbeddings()
+    first = load_or_build_index(str(source), index_dir, embeddings, "test-model")
+    assert sorted(embeddings.embedded) == ["Alien (1979)", "Heat (1995)", "Up (2009)"]
+
+    embeddings.embedded.clear()
+    assert chunk_ids(load_or_build_index(str(source), index_dir, embeddings, "test-model")) == chunk_ids(first)
+    assert embeddings.embedded == []
+
+    first_name, = indexes(index_dir)
+    write_source(source, ["Alien (1979)", "Heat (1995), director's cut", "Up (2009)"])
+    second = load_or_build_index(str(source), index_dir, embeddings, "test-model")
+    assert embeddings.embedded == ["Heat (1995), director's cut"]
+    assert len(chunk_ids(second)) == 3 and len(set(chunk_ids(second)) - set(chunk_ids(first))) == 1
+
+    # The first index stays while this process still reads it, and is pruned once nobody does.
+    second_name, = indexes(index_dir) - {first_name}
+    vector_index._release(os.path.join(index_dir, first_name))
+    vector_index._prune(index_dir, keep=second_name)
+    assert indexes(index_dir) == {second_name}
@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import pytest
+
+from myapp.storage import InMemoryConversationStorage
+from myapp.write_behind import WriteBehindConversationStorage
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def contents(messages):
+    return [message["content"] for message in messages]
+
+
+def test_writes_are_visible_at_once_and_reach_the_backend(tmp_path):
+    async def scenario():
+        backend = InMemoryConversationStorage()
+        storage = WriteBehindConversationStorage(backend, str(tmp_path), flush_interval=0.01)
+        await storage.start()
+        conversation_id = await storage.create_conversation()
+        await storage.add_messages(conversation_id, [("user", "hi"), ("assistant", "hello")])
+        await storage.add_message(conversation_id, "user", "again")
+
+        # Not applied yet, but the caller reads its own writes.
+        assert contents(await storage.get_messages(conversation_id)) == ["hi", "hello", "again"]
+        assert await storage.get_messages_since(conversation_id, 2) == ([{"role": "user", "content": "again"}], 3)
+        assert (await storage.get_conversation_info(conversation_id)).message_count == 3
+        with pytest.raises(ValueError, match="not found"):
+            await storage.add_message("missing", "user", "hi")
+
+        await storage.close()
+        assert contents(await backend.get_messages(conversation_id)) == ["hi", "hello", "again"]
+        # Everything was applied, so the journal starts over.
+        assert (tmp_path / "journal-0.jsonl").read_text() == ""
+
+    run(scenario())
+
+
+def test_unacknowledged_batches_are_replayed(tmp_path):
+    async def scenario():
+        backend = InMemoryConversationStorage()
+        conversation_id = await backend.create_conversation()
+        records = [
+            {"seq": 1, "conversation_id": conversation_id, "messages": [["user", "applied"]]},
+            {"ack": 1},
+            {"seq": 2, "conversation_id": conversation_id, "messages": [["user", "lost"], ["assistant", "reply"]]},
+        ]
+        # As left by a worker that crashed mid-write.
+        (tmp_path / "journal-0.jsonl").write_text("".join(json.dumps(r) + "\n" for r in records) + '{"seq": 3, "conv')
+
+        storage = WriteBehindConversationStorage(backend, str(tmp_path))
+        await storage.start()
+        assert contents(await backend.get_messages(conversation_id)) == ["lost", "reply"]
+        await storage.close()
+
+    run(scenario())
+
+
+class FlakyStorage(InMemoryConversationStorage):
+    """Refuses writes to the conversations in `down` with a transient error."""
+
+    def __init__(self):
+        super().__init__()
+        self.down = set()
+
+    async def add_messages(self, conversation_id, messages):
+        if conversation_id in self.down:
+            raise ConnectionError("backend unavailable")
+        await super().add_messages(conversation_id, messages)
+
+
+def journal_records(tmp_path):
+    return [json.loads(line) for line in (tmp_path / "journal-0.jsonl").read_text().splitlines()]
+
+
+def test_failed_batches_are_kept_and_retried_in_order(tmp_path):
+    async def scenario():
+        backend = FlakyStorage()
+        storage = WriteBehindConversationStorage(backend, str(tmp_path), flush_interval=0.01, retry_delay=0.05)
+        await storage.start()
+        flaky = await storage.create_conversation()
+        healthy = await storage.create_conversation()
+        backend.down.add(flaky)
+        await storage.add_message(flaky, "user", "first")
+        await storage.add_message(healthy, "user", "unaffected")
+        await storage.add_message(flaky, "user", "second")
+        await asyncio.sleep(0.03)
+
+        # The other conversation got through; the failed one stays queued, readable and journaled.
+        assert contents(await backend.get_messages(healthy)) == ["unaffected"]
+        assert contents(await backend.get_messages(flaky)) == []
+        assert contents(await storage.get_messages(flaky)) == ["first", "second"]
+        assert storage.stats()["retrying_conversations"] == 1
+        assert {"ack": 0, "done": [2]} in journal_records(tmp_path)
+
+        backend.down.clear()
+        await asyncio.sleep(0.2)
+        assert contents(await backend.get_messages(flaky)) == ["first", "second"]
+        assert storage.stats()["pending_messages"] == 0
+        assert (tmp_path / "journal-0.jsonl").read_text() == ""
+        await storage.close()
+
+    run(scenario())
+
+
+def test_replay_keeps_what_the_backend_still_refuses(tmp_path):
+    async def scenario():
+        backend = FlakyStorage()
+        flaky = await backend.create_conversation()
+        applied = await backend.create_conversation()
+        records = [
+            {"seq": 1, "conversation_id": flaky, "messages": [["user", "queued"]]},
+            {"seq": 2, "conversation_id": applied, "messages": [["user", "already applied"]]},
+            {"ack": 0, "done": [2]},
+        ]
+        (tmp_path / "journal-0.jsonl").write_text("".join(json.dumps(r) + "\n" for r in records))
+        backend.down.add(flaky)
+
+        storage = WriteBehindConversationStorage(backend, str(tmp_path), retry_delay=10)
+        await storage.start()
+        assert contents(await backend.get_messages(applied)) == []
+        assert contents(await storage.get_messages(flaky)) == ["queued"]
+        await storage.close()
+        # Never truncated while the batch is unapplied, so the journal's next owner replays it.
+        assert records[0] in journal_records(tmp_path)
+
+        backend.down.clear()
+        storage = WriteBehindConversationStorage(backend, str(tmp_path))
+        await storage.start()
+        assert contents(await backend.get_messages(flaky)) == ["queued"]
+        assert (tmp_path / "journal-0.jsonl").read_text() == ""
+        await storage.close()
+
+    run(scenario())